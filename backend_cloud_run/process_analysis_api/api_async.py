@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+from datetime import timezone
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TempoEsgotado
+
+logger = logging.getLogger()
+
+# Threads para as chamadas bloqueantes das rotas da API (Firestore, Cloud Tasks, assinatura de URLs)
+API_IO_WORKERS = int(os.environ.get("API_IO_WORKERS", "32"))
+# Tempo máximo de uma rota no loop antes de a requisição responder erro
+API_TIMEOUT_S = float(os.environ.get("API_TIMEOUT_S", "60"))
+# Renova o token de assinatura (signBlob) com esta antecedência do vencimento
+TOKEN_MARGEM_S = 300
+URL_UPLOAD_EXPIRACAO_S = 900  # 15 min
+
+
+class LoopAPI:
+    """
+    Event loop asyncio numa thread própria, compartilhado pelas rotas da API da instância.
+    O entrypoint continua WSGI (functions_framework): cada requisição entrega sua corrotina ao
+    loop com `executar` e espera o resultado; dentro dela, as chamadas bloqueantes dos clientes
+    GCP rodam em `em_thread` e podem ser aguardadas em paralelo (asyncio.gather).
+    O loop e o pool só são criados na primeira requisição.
+    """
+
+    def __init__(self, workers=API_IO_WORKERS):
+        self.workers = workers
+        self._loop = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _iniciar(self):
+        with self._lock:
+            if self._loop is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='api-io')
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(self._executor)
+                threading.Thread(target=loop.run_forever, name='api-loop', daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def executar(self, corrotina, timeout=API_TIMEOUT_S):
+        """Roda `corrotina` no loop compartilhado e bloqueia a thread da requisição até o resultado."""
+        loop = self._loop or self._iniciar()
+        futuro = asyncio.run_coroutine_threadsafe(corrotina, loop)
+        try:
+            return futuro.result(timeout)
+        except TempoEsgotado:
+            futuro.cancel()
+            raise
+
+    async def em_thread(self, funcao, *args, **kwargs):
+        """Executa a chamada bloqueante `funcao(*args, **kwargs)` no pool de I/O da API."""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(funcao, *args, **kwargs))
+
+
+class AssinadorURLs:
+    """
+    Gera Signed URLs v4 reaproveitando, entre requisições, os handles de bucket e as credenciais
+    de assinatura. Com credenciais sem chave privada (conta de serviço padrão do Cloud Run) a
+    assinatura usa o IAM signBlob: o access token é renovado só perto do vencimento, não a cada URL.
+    """
+
+    def __init__(self, storage_client):
+        self.storage_client = storage_client
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, nome):
+        bucket = self._buckets.get(nome)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(nome, self.storage_client.bucket(nome))
+        return bucket
+
+    def _credenciais_assinatura(self):
+        credenciais = getattr(self.storage_client, '_credentials', None)
+        if credenciais is None or hasattr(credenciais, 'sign_bytes'):
+            return {}  # chave privada local: o cliente assina sozinho
+        if self._token_vencendo(credenciais):
+            with self._lock:
+                if self._token_vencendo(credenciais):
+                    from google.auth.transport.requests import Request
+                    credenciais.refresh(Request())
+                    logger.info("Signing credentials refreshed")
+        return {'service_account_email': credenciais.service_account_email,
+                'access_token': credenciais.token}
+
+    @staticmethod
+    def _token_vencendo(credenciais):
+        if not credenciais.token or credenciais.expiry is None:
+            return True
+        # google-auth guarda o vencimento como datetime UTC sem fuso
+        expira = credenciais.expiry.replace(tzinfo=credenciais.expiry.tzinfo or timezone.utc)
+        return expira.timestamp() - time.time() < TOKEN_MARGEM_S
+
+    def assinar(self, bucket_name, caminho, content_type, metodo="PUT", expiracao=URL_UPLOAD_EXPIRACAO_S):
+        blob = self.bucket(bucket_name).blob(caminho)
+        return blob.generate_signed_url(version="v4", expiration=expiracao, method=metodo,
+                                        content_type=content_type, **self._credenciais_assinatura())
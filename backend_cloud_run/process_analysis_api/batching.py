@@ -0,0 +1,112 @@
+import os
+import re
+import json
+
+# Empacotamento de sub-documentos pequenos numa única chamada ao Gemini Pro (1 = desligado)
+LOTE_MAX_DOCS = int(os.environ.get("LOTE_MAX_DOCS", "6"))
+# Só entram em lote documentos de até N páginas (procurações, certidões, despachos...)
+LOTE_DOC_MAX_PAGINAS = int(os.environ.get("LOTE_DOC_MAX_PAGINAS", "2"))
+LOTE_MAX_PAGINAS = int(os.environ.get("LOTE_MAX_PAGINAS", "10"))
+# Orçamento estimado de tokens de entrada dos PDFs de um lote
+LOTE_MAX_TOKENS = int(os.environ.get("LOTE_MAX_TOKENS", "16000"))
+# O Gemini conta cada página de PDF como imagem (258 tokens) + o texto extraído (~4 caracteres/token)
+TOKENS_POR_PAGINA_PDF = 258
+CARACTERES_POR_TOKEN = 4
+
+
+def estimar_tokens_paginas(textos, pages):
+    """Tokens de entrada estimados para enviar `pages` como PDF (textos: PageTextCache ou dict)."""
+    return sum(TOKENS_POR_PAGINA_PDF + len(textos.get(p) or '') // CARACTERES_POR_TOKEN for p in pages)
+
+
+def planejar_lotes(tasks, tokens_por_task, max_docs=LOTE_MAX_DOCS, doc_max_paginas=LOTE_DOC_MAX_PAGINAS,
+                   max_paginas=LOTE_MAX_PAGINAS, max_tokens=LOTE_MAX_TOKENS):
+    """
+    Agrupa tasks consecutivas (ordem de páginas) em lotes. Retorna listas de índices de `tasks`;
+    tasks grandes, sem ID do sumário ou com ID repetido no lote ficam sozinhas, e um lote
+    não mistura tasks destinadas a modelos diferentes (`task['modelo']`, definido na triagem).
+    `tokens_por_task[i]` é a estimativa de tokens da task i.
+    """
+    lotes = []
+    atual, paginas, tokens, ids, modelo = [], 0, 0, set(), None
+
+    def fechar():
+        nonlocal atual, paginas, tokens, ids, modelo
+        if atual:
+            lotes.append(atual)
+        atual, paginas, tokens, ids, modelo = [], 0, 0, set(), None
+
+    for i, task in enumerate(tasks):
+        doc_id = task['meta'].get('id_documento')
+        n_paginas = len(task['pages'])
+        if max_docs <= 1 or not doc_id or n_paginas > doc_max_paginas:
+            fechar()
+            lotes.append([i])
+            continue
+        doc_id = str(doc_id)
+        if (len(atual) >= max_docs or doc_id in ids or paginas + n_paginas > max_paginas
+                or tokens + tokens_por_task[i] > max_tokens or (atual and task.get('modelo') != modelo)):
+            fechar()
+        modelo = task.get('modelo')
+        atual.append(i)
+        paginas += n_paginas
+        tokens += tokens_por_task[i]
+        ids.add(doc_id)
+    fechar()
+    return lotes
+
+
+def separar_resposta_lote(texto, ids_esperados):
+    """
+    Resposta do lote (array JSON, um objeto por documento) -> {id_documento: dados}.
+    Objetos são associados pelo `idDocumento` ecoado do marcador; se o modelo não repetir
+    os IDs mas devolver um objeto por documento, a associação é feita pela ordem.
+    Lança ValueError se a resposta não puder ser associada; IDs sem resultado ficam de fora.
+    """
+    resultado = json.loads(texto)
+    if isinstance(resultado, dict):
+        resultado = resultado.get('documentos', [resultado])
+    if not isinstance(resultado, list) or not all(isinstance(r, dict) for r in resultado):
+        raise ValueError("Batch response is not a JSON array of objects")
+
+    normalizar = lambda v: re.sub(r'\s+', '', str(v or ''))
+    esperados = {normalizar(i): i for i in ids_esperados}
+    por_id = {}
+    for dados in resultado:
+        doc_id = esperados.get(normalizar(dados.get('idDocumento')))
+        if doc_id is not None and doc_id not in por_id:
+            por_id[doc_id] = dados
+    if not por_id and len(resultado) == len(ids_esperados):
+        por_id = dict(zip(ids_esperados, resultado))
+    if not por_id:
+        raise ValueError("Batch response does not match any document of the batch")
+    return por_id
+
+
+class EstatisticasLotes:
+    """Chamadas economizadas e latência por tipo de chamada de um job (thread principal)."""
+
+    def __init__(self):
+        self.lotes = 0
+        self.documentos_em_lote = 0
+        self.fallbacks = 0
+        self.latencias = {'lote': [], 'individual': []}
+
+    def registrar(self, tipo, segundos, documentos=1, fallbacks=0):
+        self.latencias[tipo].append(segundos)
+        if tipo == 'lote':
+            self.lotes += 1
+            self.documentos_em_lote += documentos
+            self.fallbacks += fallbacks
+
+    def resumo(self):
+        def media(valores):
+            return round(sum(valores) / len(valores), 2) if valores else 0.0
+        return {
+            'lotes': self.lotes,
+            'documentos_em_lote': self.documentos_em_lote,
+            'chamadas_economizadas': max(0, self.documentos_em_lote - self.lotes - self.fallbacks),
+            'fallbacks_individuais': self.fallbacks,
+            'latencia_media_lote_s': media(self.latencias['lote']),
+            'latencia_media_individual_s': media(self.latencias['individual']),
+        }
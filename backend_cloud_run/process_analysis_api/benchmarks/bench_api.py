@@ -0,0 +1,182 @@
+"""
+Teste de carga das rotas /api/upload-url e /api/processar numa instância: p50/p99 e requisições
+por segundo com N requisições simultâneas (as threads do servidor WSGI).
+Em processo, compara os handlers originais (chamadas bloqueantes em sequência, bucket obtido a cada
+requisição) com o caminho assíncrono atual, contra fakes de Firestore/GCS/Cloud Tasks com latência.
+Com --url, dispara as mesmas requisições por HTTP contra um serviço já deployado.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_api --requisicoes 400 --concorrencia 16 --latencia-ms 40
+    python -m benchmarks.bench_api --url https://process-analysis-api-xyz.run.app --requisicoes 200
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+import threading
+from types import SimpleNamespace
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs_nuvem"))
+
+import main  # noqa: E402
+from benchmarks.fakes_pipeline import FakeFirestore, FakeGCS, Contadores, modulo_firestore  # noqa: E402
+
+BUCKET = "bucket-bench"
+USUARIOS = 40
+PDF_MINIMO = b"%PDF-1.4\n1 0 obj << /Type /Pages /Kids [] /Count 20 >> endobj\n%%EOF\n"
+
+
+class FakeTasks:
+    """Cliente do Cloud Tasks com latência por create_task."""
+
+    def __init__(self, latencia_s=0.0):
+        self.latencia_s = latencia_s
+        self.contadores = Contadores()
+
+    def queue_path(self, projeto, regiao, fila):
+        return f"projects/{projeto}/locations/{regiao}/queues/{fila}"
+
+    def task_path(self, projeto, regiao, fila, nome):
+        return f"{self.queue_path(projeto, regiao, fila)}/tasks/{nome}"
+
+    def create_task(self, request):
+        self.contadores.somar('tarefas')
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        return SimpleNamespace(name=request["task"].get("name") or f"{request['parent']}/tasks/{uuid.uuid4().hex}")
+
+
+class Requisicao:
+    method = "POST"
+    headers = {}
+
+    def __init__(self, path, corpo):
+        self.path = path
+        self._corpo = corpo
+
+    def get_json(self, silent=False):
+        return self._corpo
+
+
+# --- Handlers como eram antes do loop assíncrono (referência) ---
+
+def upload_url_original(request, headers):
+    data = request.get_json()
+    bucket = main.storage_client.bucket(os.environ.get("BUCKET_NAME"))
+    blob = bucket.blob(f"uploads/{data.get('name')}")
+    url = blob.generate_signed_url(version="v4", expiration=900, method="PUT", content_type=data.get('type'))
+    job_ref = main.db.collection('analises_processos').document()
+    return (json.dumps({'uploadUrl': url, 'jobId': job_ref.id}), 200, headers)
+
+
+def processar_original(request, headers):
+    data = request.get_json()
+    job_id, file_path = data.get('jobId'), data.get('filePath')
+    main.db.collection('analises_processos').document(job_id).set({
+        'status': 'ENFILEIRADO', 'progresso': 0,
+        'data_criacao': main.firestore.SERVER_TIMESTAMP, 'url_arquivo_original': file_path,
+    }, merge=True)
+    main.enqueue_process_task({'jobId': job_id, 'filePath': file_path})
+    return (json.dumps({'message': 'Processamento enfileirado', 'jobId': job_id}), 200, headers)
+
+
+def preparar(args):
+    db = FakeFirestore(latencia_s=args.latencia_ms / 1000)
+    gcs = FakeGCS(latencia_s=args.latencia_ms / 1000)
+    # Todo upload já está no bucket quando /api/processar chega (o agendamento mede o PDF)
+    gcs.objetos = defaultdict(lambda: PDF_MINIMO)
+    main.db.substituir(db)
+    main.firestore.substituir(modulo_firestore(db))
+    main.storage_client.substituir(gcs)
+    main.tasks_client.substituir(FakeTasks(args.latencia_ms / 1000))
+    main.tasks_v2.substituir(SimpleNamespace(HttpMethod=SimpleNamespace(POST="POST")))
+    main.logging_client.substituir(object())
+    os.environ.setdefault("SERVICE_URL", "https://servico.invalid")
+    os.environ.setdefault("BUCKET_NAME", BUCKET)
+
+
+def sequencia(n):
+    """Metade upload-url, metade processar (o fluxo de um upload pelo frontend)."""
+    for i in range(n):
+        if i % 2 == 0:
+            yield '/api/upload-url', {'name': f"processo_{i}.pdf", 'type': 'application/pdf'}
+        else:
+            yield '/api/processar', {'jobId': f"job-{i}", 'filePath': f"gs://{BUCKET}/uploads/processo_{i}.pdf",
+                                     'usuarioUid': f"usuario-{i % USUARIOS}"}
+
+
+def medir(chamar, requisicoes, concorrencia):
+    latencias = {'/api/upload-url': [], '/api/processar': []}
+    lock = threading.Lock()
+    falhas = [0]
+
+    def uma(item):
+        rota, corpo = item
+        t0 = time.perf_counter()
+        status = chamar(rota, corpo)
+        duracao = time.perf_counter() - t0
+        with lock:
+            latencias[rota].append(duracao)
+            if status != 200:
+                falhas[0] += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as pool:
+        list(pool.map(uma, sequencia(requisicoes)))
+    return latencias, time.perf_counter() - t0, falhas[0]
+
+
+def percentil(valores, p):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+def relatar(nome, latencias, duracao, falhas):
+    total = sum(len(v) for v in latencias.values())
+    print(f"{nome}: {total / duracao:8.1f} req/s  ({total} em {duracao:.2f}s, {falhas} falhas)")
+    for rota, valores in latencias.items():
+        if valores:
+            print(f"    {rota:<16} p50 {percentil(valores, 50) * 1000:8.1f} ms   p99 {percentil(valores, 99) * 1000:8.1f} ms")
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requisicoes", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=16, help="requisições simultâneas na instância")
+    parser.add_argument("--latencia-ms", type=float, default=40.0, help="latência por RPC nos fakes")
+    parser.add_argument("--url", default=None, help="serviço deployado (carga por HTTP)")
+    args = parser.parse_args()
+
+    if args.url:
+        from storage_io import sessao_http
+        sessao = sessao_http()
+
+        def chamar_http(rota, corpo):
+            return sessao.post(f"{args.url.rstrip('/')}{rota}", json=corpo, timeout=60).status_code
+
+        relatar(args.url, *medir(chamar_http, args.requisicoes, args.concorrencia))
+        return
+
+    preparar(args)
+    headers = {'Access-Control-Allow-Origin': '*'}
+    originais = {'/api/upload-url': upload_url_original, '/api/processar': processar_original}
+
+    def chamar_original(rota, corpo):
+        return originais[rota](Requisicao(rota, corpo), headers)[1]
+
+    def chamar_atual(rota, corpo):
+        return main.process_analysis_api(Requisicao(rota, corpo))[1]
+
+    print(f"{args.requisicoes} requisições, {args.concorrencia} simultâneas, {args.latencia_ms:.0f} ms/RPC")
+    relatar("original (sequencial)", *medir(chamar_original, args.requisicoes, args.concorrencia))
+    relatar("loop assíncrono      ", *medir(chamar_atual, args.requisicoes, args.concorrencia))
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,88 @@
+"""
+Benchmark do disparo da consolidação contra o serviço local FakeConsolidacao: um POST por job
+com conexão nova (original) vs. AgregadorConsolidacao (lotes por janela/tamanho na sessão
+compartilhada, com retentativas). Simula uma importação em massa: N jobs terminando em threads
+diferentes ao longo de alguns segundos.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_consolidation --jobs 300 --duracao-s 6 --janela-s 1 --falhas 2
+"""
+import time
+import random
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from consolidation import AgregadorConsolidacao, CONSOLIDACAO_ESPERA_S
+from benchmarks.fakes_pipeline import FakeConsolidacao
+
+
+def disparo_original(url, parent_id):
+    try:
+        resp = requests.post(url, json={"process_ids": [parent_id]}, timeout=10)
+        return resp.status_code == 202
+    except Exception:
+        return False
+
+
+def executar(n_jobs, duracao_s, disparar, workers=32, seed=5):
+    rng = random.Random(seed)
+    termino = sorted(rng.uniform(0, duracao_s) for _ in range(n_jobs))
+    t0 = time.perf_counter()
+
+    def job(i):
+        espera = t0 + termino[i] - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        inicio = time.perf_counter()
+        ok = disparar(f"processo-{i % (n_jobs * 9 // 10 or 1)}")  # ~10% reimportações do mesmo processo
+        return ok, time.perf_counter() - inicio
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        resultados = list(pool.map(job, range(n_jobs)))
+    return resultados, time.perf_counter() - t0
+
+
+def relatar(nome, servico, resultados, duracao):
+    ok = sum(1 for r, _ in resultados if r)
+    ids = sum(len(lote) for lote in servico.recebidos)
+    espera = sorted(t for _, t in resultados)
+    print(f"{nome}: {servico.requisicoes:4d} POSTs ({len(servico.recebidos)} aceitos, {ids} IDs), "
+          f"{ok}/{len(resultados)} jobs ok, espera do job p50 {espera[len(espera) // 2] * 1000:.0f} ms "
+          f"máx {espera[-1] * 1000:.0f} ms, total {duracao:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=300)
+    parser.add_argument("--duracao-s", type=float, default=6.0, help="intervalo em que os jobs terminam")
+    parser.add_argument("--janela-s", type=float, default=1.0)
+    parser.add_argument("--max-ids", type=int, default=50)
+    parser.add_argument("--falhas", type=int, default=2, help="503 nas primeiras N requisições ao serviço")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="latência do serviço de consolidação")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{args.jobs} jobs em {args.duracao_s}s, janela {args.janela_s}s / {args.max_ids} IDs, "
+          f"{args.falhas} falhas injetadas")
+    with FakeConsolidacao(falhas_iniciais=args.falhas, latencia_s=args.latencia_ms / 1000) as servico:
+        relatar("original (1 por job)", servico,
+                *executar(args.jobs, args.duracao_s, lambda pid: disparo_original(servico.url, pid)))
+
+    with FakeConsolidacao(falhas_iniciais=args.falhas, latencia_s=args.latencia_ms / 1000) as servico:
+        agregador = AgregadorConsolidacao(servico.url, janela_s=args.janela_s, max_ids=args.max_ids)
+
+        def disparar(pid):
+            try:
+                agregador.adicionar(pid).result(timeout=CONSOLIDACAO_ESPERA_S)
+                return True
+            except Exception:
+                return False
+
+        relatar("agregador           ", servico, *executar(args.jobs, args.duracao_s, disparar))
+
+
+if __name__ == "__main__":
+    main()
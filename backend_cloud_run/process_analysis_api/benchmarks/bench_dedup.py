@@ -0,0 +1,93 @@
+"""
+Benchmark da deduplicação do Step 4 contra o FakeFirestore: varredura original da subcoleção
+documentos_analisados vs. Deduplicador (get_all nas chaves safe_id + `in` para os restantes),
+a frio e com o cache da instância aquecido.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_dedup --analisados 20000 --candidatos 300 --latencia-ms 20
+"""
+import argparse
+import random
+import time
+
+from dedup import Deduplicador, CacheProcessados, safe_id
+from benchmarks.fakes_pipeline import FakeFirestore
+
+PARENT_ID = "0001234-56.2024.5.02.0001"
+
+
+def varredura_original(db, parent_id):
+    existing_docs_ref = db.collection(f"analises_processos/{parent_id}/documentos_analisados")
+    existing_docs = existing_docs_ref.select(['idDocumento', 'id_documento']).stream()
+    already_processed_ids = set()
+    for d in existing_docs:
+        data = d.to_dict()
+        if data.get('idDocumento'): already_processed_ids.add(str(data.get('idDocumento')))
+        if data.get('id_documento'): already_processed_ids.add(str(data.get('id_documento')))
+    return already_processed_ids
+
+
+def popular(db, n_analisados, n_candidatos, fracao_existentes, fracao_id_gemini, seed=11):
+    """Grava `n_analisados` documentos e devolve os IDs candidatos de um novo job."""
+    rng = random.Random(seed)
+    ids = rng.sample(range(100_000_000, 999_999_999), n_analisados + n_candidatos)
+    analisados, novos = ids[:n_analisados], ids[n_analisados:]
+    colecao = db.collection(f"analises_processos/{PARENT_ID}/documentos_analisados")
+    for doc_id in analisados:
+        id_sumario = str(doc_id)
+        # Parte das análises foi gravada com o idDocumento devolvido pelo Gemini como chave
+        id_gemini = f"{id_sumario}-G" if rng.random() < fracao_id_gemini else id_sumario
+        db.docs[f"{colecao.caminho}/{safe_id(id_gemini)}"] = {'id_documento': id_sumario, 'idDocumento': id_gemini}
+    n_existentes = int(n_candidatos * fracao_existentes)
+    candidatos = [str(i) for i in rng.sample(analisados, min(n_existentes, n_analisados))]
+    candidatos += [str(i) for i in novos[:n_candidatos - len(candidatos)]]
+    rng.shuffle(candidatos)
+    return candidatos
+
+
+def medir(db, funcao):
+    antes = db.contadores.copia()
+    t0 = time.perf_counter()
+    resultado = funcao()
+    duracao = time.perf_counter() - t0
+    depois = db.contadores.copia()
+    delta = {k: depois.get(k, 0) - antes.get(k, 0) for k in ('leituras', 'documentos_lidos')}
+    return resultado, duracao, delta
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--analisados", type=int, default=20000, help="documentos já na subcoleção")
+    parser.add_argument("--candidatos", type=int, default=300, help="tasks do sumário no novo job")
+    parser.add_argument("--existentes", type=float, default=0.5, help="fração dos candidatos já analisada")
+    parser.add_argument("--id-gemini", type=float, default=0.1,
+                        help="fração das análises gravadas com chave diferente do ID do sumário")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="latência por RPC")
+    parser.add_argument("--latencia-doc-us", type=float, default=20.0, help="custo por documento lido")
+    args = parser.parse_args()
+
+    db = FakeFirestore(latencia_s=args.latencia_ms / 1000, latencia_doc_s=args.latencia_doc_us / 1_000_000)
+    candidatos = popular(db, args.analisados, args.candidatos, args.existentes, args.id_gemini)
+
+    todos, t_original, c_original = medir(db, lambda: varredura_original(db, PARENT_ID))
+    esperado = todos & set(candidatos)
+
+    cache = CacheProcessados()
+    frio = Deduplicador(db, PARENT_ID, cache)
+    r_frio, t_frio, c_frio = medir(db, lambda: frio.ja_processados(candidatos))
+    quente = Deduplicador(db, PARENT_ID, cache)
+    r_quente, t_quente, c_quente = medir(db, lambda: quente.ja_processados(candidatos))
+
+    print(f"{args.analisados} documentos analisados, {len(candidatos)} candidatos "
+          f"({len(esperado)} já analisados), {args.latencia_ms:.0f} ms/RPC")
+    print(f"varredura original:  {t_original * 1000:9.1f} ms  {c_original['leituras']:4d} RPCs  "
+          f"{c_original['documentos_lidos']:7d} docs lidos  ({len(todos)} IDs em memória)")
+    print(f"dedup (cache frio):  {t_frio * 1000:9.1f} ms  {c_frio['leituras']:4d} RPCs  "
+          f"{c_frio['documentos_lidos']:7d} docs lidos")
+    print(f"dedup (cache quente):{t_quente * 1000:9.1f} ms  {c_quente['leituras']:4d} RPCs  "
+          f"{c_quente['documentos_lidos']:7d} docs lidos  ({quente.acertos_cache} acertos)")
+    print(f"mesmo resultado da varredura: frio={r_frio == esperado}, quente={r_quente == esperado}")
+
+
+if __name__ == "__main__":
+    main()
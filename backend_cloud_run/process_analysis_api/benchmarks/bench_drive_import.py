@@ -0,0 +1,46 @@
+"""
+Benchmark da importação Drive -> GCS em streaming contra servidores locais.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_drive_import --mb 200 --chunk-mb 8 --falhas
+"""
+import argparse
+import hashlib
+import os
+import time
+
+import job_metrics
+import storage_io
+from benchmarks.fake_http import FakeDriveGcs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--chunk-mb", type=int, default=8)
+    parser.add_argument("--falhas", action="store_true", help="corta o download e falha um PUT no meio")
+    args = parser.parse_args()
+
+    dados = os.urandom(args.mb * 1024 * 1024)
+    storage_io.time.sleep = lambda s: None  # sem backoff real no benchmark
+    opcoes = {}
+    if args.falhas:
+        opcoes = {'cortar_download_em': len(dados) // 2, 'falhar_puts': {3}}
+
+    with FakeDriveGcs(dados, **opcoes) as fake:
+        job_metrics.resetar_pico_rss()
+        base_rss = job_metrics.pico_rss_mb()
+        t0 = time.perf_counter()
+        tamanho = storage_io.transferir_stream_para_gcs(
+            f"{fake.base_url}/drive", {}, f"{fake.base_url}/upload",
+            tamanho_total=len(dados), chunk_size=args.chunk_mb * 1024 * 1024)
+        elapsed = time.perf_counter() - t0
+
+        assert tamanho == len(dados) and fake.finalizado and fake.md5_recebido.digest() == hashlib.md5(dados).digest(), "conteúdo divergente"
+        print(f"{args.mb} MB em {elapsed:.2f}s ({args.mb / elapsed:.1f} MB/s), "
+              f"GETs={fake.gets} PUTs={fake.puts}, "
+              f"pico RSS acima da base: {job_metrics.pico_rss_mb() - base_rss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
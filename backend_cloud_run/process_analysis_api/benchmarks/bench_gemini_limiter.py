@@ -0,0 +1,73 @@
+"""
+Benchmark do limitador de chamadas Gemini contra um modelo fake que injeta 429/503.
+Compara chamadas diretas (sem retentativa: o erro descarta o sub-documento) com o LimitadorModelo.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_gemini_limiter --chamadas 200 --threads 16 --cota-concorrencia 4
+"""
+import argparse
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from gemini_limiter import LimitadorModelo
+from benchmarks.fake_gemini import FakeGemini, ModeloFake
+
+
+def executar(fake, chamadas, threads, limitador=None):
+    local = threading.local()
+
+    def modelo():
+        if not hasattr(local, 'modelo'):
+            local.modelo = ModeloFake(fake.base_url)
+        return local.modelo
+
+    def chamar(i):
+        conteudo = {'tokens': 1000}
+        try:
+            if limitador is None:
+                modelo().generate_content(conteudo)
+            else:
+                limitador.chamar(lambda: modelo().generate_content(conteudo), tokens_estimados=1000,
+                                 tokens_da_resposta=lambda r: r.usage_metadata.total_token_count)
+            return True
+        except Exception:
+            return False
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ok = sum(pool.map(chamar, range(chamadas)))
+    return ok, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chamadas", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--cota-concorrencia", type=int, default=4)
+    parser.add_argument("--cota-rpm", type=int, default=0)
+    parser.add_argument("--prob-503", type=float, default=0.02)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{args.chamadas} chamadas, {args.threads} threads; modelo fake: {args.latencia * 1000:.0f}ms, "
+          f"até {args.cota_concorrencia} simultâneas, rpm={args.cota_rpm or '-'}, 503={args.prob_503:.0%}")
+    for nome in ("direto", "limitador"):
+        with FakeGemini(latencia_s=args.latencia, max_concorrencia=args.cota_concorrencia,
+                        rpm=args.cota_rpm, prob_503=args.prob_503) as fake:
+            limitador = None
+            if nome == "limitador":
+                limitador = LimitadorModelo("fake", rpm=args.cota_rpm, concorrencia_max=args.threads,
+                                            backoff_base_s=args.latencia, backoff_max_s=args.latencia * 20,
+                                            max_tentativas=8)
+            ok, tempo = executar(fake, args.chamadas, args.threads, limitador)
+            print(f"{nome:>10}: {ok}/{args.chamadas} ok, perdidas {args.chamadas - ok}, "
+                  f"{tempo:.2f}s, respostas {fake.respostas}")
+            if limitador:
+                print(f"{'':>10}  {limitador.resumo()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark da exclusividade por processo (process_lease) com o FakeFirestore transacional e a
+FilaLocal com vários workers: N jobs do mesmo numero_processo chegando quase juntos.
+Compara a salvaguarda original (get seguido de set, sem transação) com o lease e relata quantas
+análises completas rodaram (custo Gemini Pro), o máximo de análises simultâneas e como cada job
+terminou. Com --zumbi, o processo começa marcado por um job que morreu sem liberar.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_lease --jobs 8 --chegada-s 0.05 --analise-s 1
+    python -m benchmarks.bench_lease --jobs 8 --zumbi --ttl-s 2
+"""
+import time
+import random
+import argparse
+import logging
+import threading
+from collections import Counter
+
+from dedup import safe_id
+from process_lease import LeaseProcesso
+from task_queue import FilaLocal
+from benchmarks.fakes_pipeline import FakeFirestore, modulo_firestore
+
+ROTA = '/api/worker/processar-pdf'
+PARENT_ID = '0001234-56.2024.4.01.3304'
+
+
+class Processo:
+    """Estado compartilhado da "análise" do processo: quantas vezes rodou e quantas ao mesmo tempo."""
+
+    def __init__(self, analise_s):
+        self.analise_s = analise_s
+        self.lock = threading.Lock()
+        self.analisado = False
+        self.em_analise = 0
+        self.max_simultaneas = 0
+        self.analises = 0
+
+    def analisar(self, lease=None):
+        with self.lock:
+            if self.analisado:
+                return 'dedup'  # resultados já gravados por quem veio antes (Step 4 pula tudo)
+            self.em_analise += 1
+            self.max_simultaneas = max(self.max_simultaneas, self.em_analise)
+        try:
+            fim = time.time() + self.analise_s
+            while time.time() < fim:
+                time.sleep(0.02)
+                if lease:
+                    lease.pulsar()
+        finally:
+            with self.lock:
+                self.em_analise -= 1
+                self.analises += 1
+                self.analisado = True
+        return 'concluido'
+
+
+def job_original(db, processo, job_id):
+    """CONCURRENCY SAFEGUARD como era em processar_pdf."""
+    ref = db.collection('analises_processos').document(PARENT_ID)
+    snapshot = ref.get()
+    if snapshot.exists:
+        dados = snapshot.to_dict()
+        if dados.get('status') == 'PROCESSANDO' and dados.get('origem_job_id') != job_id:
+            return 'abortado'
+    ref.set({'status': 'PROCESSANDO', 'origem_job_id': job_id}, merge=True)
+    resultado = processo.analisar()
+    ref.set({'status': 'CONCLUIDO'}, merge=True)
+    return resultado
+
+
+def job_lease(db, firestore, fila, processo, payload, args):
+    lease = LeaseProcesso(db, firestore, PARENT_ID, payload['jobId'], ttl_s=args.ttl_s,
+                          heartbeat_s=args.ttl_s / 4, margem_s=0.2)
+    aquisicao = lease.adquirir(tarefa=payload)
+    if not aquisicao.adquirido:
+        fila.criar_tarefa(ROTA, payload, atraso_s=lease.atraso_espera(aquisicao))
+        return 'aguardando'
+    try:
+        return processo.analisar(lease)
+    finally:
+        for tarefa in lease.liberar():
+            fila.criar_tarefa(ROTA, tarefa)
+
+
+def executar(modo, args):
+    db = FakeFirestore(latencia_s=args.latencia_ms / 1000)
+    firestore = modulo_firestore(db)
+    processo = Processo(args.analise_s)
+    finais = {}
+    entregas = Counter()
+    fim = {}
+    lock = threading.Lock()
+
+    if args.zumbi:
+        if modo == 'original':
+            db.collection('analises_processos').document(PARENT_ID).set(
+                {'status': 'PROCESSANDO', 'origem_job_id': 'job-morto'})
+        else:
+            db.collection('leases_processos').document(safe_id(PARENT_ID)).set(
+                {'job_id': 'job-morto', 'execucao': 'morto', 'expira_em': time.time() + args.ttl_s})
+
+    def despachar(rota, payload, tentativa):
+        job_id = payload['jobId']
+        with lock:
+            entregas[job_id] += 1
+            if finais.get(job_id) in ('concluido', 'dedup'):
+                return  # reentrega de job concluído: processar_pdf ignora (status CONCLUIDO)
+        if modo == 'original':
+            resultado = job_original(db, processo, job_id)
+        else:
+            resultado = job_lease(db, firestore, fila, processo, payload, args)
+        with lock:
+            finais[job_id] = resultado
+            if resultado != 'aguardando':
+                fim[job_id] = time.time() - t0
+
+    fila = FilaLocal(despachar, workers=args.jobs)
+    rng = random.Random(11)
+    t0 = time.time()
+    for i, chegada in enumerate(sorted(rng.uniform(0, args.chegada_s) for _ in range(args.jobs))):
+        atraso = t0 + chegada - time.time()
+        if atraso > 0:
+            time.sleep(atraso)
+        fila.criar_tarefa(ROTA, {'jobId': f"job-{i}", 'filePath': f"gs://bucket/uploads/copia_{i}.pdf"})
+    fila.aguardar(timeout=120)
+    fila.encerrar()
+    return processo, finais, entregas, max(fim.values(), default=0.0)
+
+
+def relatar(nome, processo, finais, entregas, ultimo_s):
+    estados = Counter(finais.values())
+    print(f"{nome}: {processo.analises} análise(s) completa(s), máx {processo.max_simultaneas} simultânea(s), "
+          f"processo {'analisado' if processo.analisado else 'NÃO analisado'}, "
+          f"{sum(entregas.values())} entregas, último job resolvido em {ultimo_s:.1f}s")
+    print(f"    estado final dos jobs: {dict(sorted(estados.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=8, help="uploads do mesmo processo")
+    parser.add_argument("--chegada-s", type=float, default=0.05, help="intervalo em que os jobs chegam")
+    parser.add_argument("--analise-s", type=float, default=1.0, help="duração simulada da análise")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="latência por RPC no FakeFirestore")
+    parser.add_argument("--ttl-s", type=float, default=2.0, help="validade do lease (heartbeat a cada ttl/4)")
+    parser.add_argument("--zumbi", action="store_true", help="processo já marcado por um job morto")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{args.jobs} jobs em {args.chegada_s}s, análise de {args.analise_s}s, {args.latencia_ms:.0f} ms/RPC"
+          f"{', processo preso por job morto' if args.zumbi else ''}")
+    relatar("original (get + set)", *executar('original', args))
+    relatar("lease transacional  ", *executar('lease', args))
+
+
+if __name__ == "__main__":
+    main()
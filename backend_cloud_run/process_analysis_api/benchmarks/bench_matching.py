@@ -0,0 +1,82 @@
+"""
+Micro-benchmark do cruzamento sumário x mapa de páginas (Step 4):
+varredura O(N×M) original vs. IndiceDocumentos.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_matching --chaves 5000 --consultas 500
+"""
+import argparse
+import random
+import time
+
+from page_mapping import IndiceDocumentos
+
+
+def varredura_original(mapa_paginas, extracted_doc_id):
+    found_pages = mapa_paginas.get(extracted_doc_id)
+    if not found_pages and extracted_doc_id:
+        for k in mapa_paginas.keys():
+            if extracted_doc_id in k or k in extracted_doc_id:
+                return mapa_paginas[k]
+    return found_pages
+
+
+def gerar_cenario(n_chaves, n_consultas, estilo, seed=7):
+    rng = random.Random(seed)
+    mapa = {}
+    pagina = 0
+    while len(mapa) < n_chaves:
+        chave = f"{rng.getrandbits(28):07x}" if estilo == "trt" else str(rng.randint(100_000_000, 999_999_999))
+        if chave not in mapa:
+            mapa[chave] = [pagina, pagina + 1]
+            pagina += 2
+    chaves = list(mapa)
+    consultas = []
+    for _ in range(n_consultas):
+        chave = rng.choice(chaves)
+        tipo = rng.random()
+        if tipo < 0.4:
+            consultas.append(chave)                      # exato
+        elif tipo < 0.6:
+            consultas.append(chave[:-2])                 # truncado no fim
+        elif tipo < 0.8:
+            consultas.append(chave[2:])                  # truncado no início
+        elif tipo < 0.9:
+            consultas.append(f"ID{chave}X")              # chave contida no ID do sumário
+        else:
+            consultas.append("zz" + chave[:2])           # sem match
+    return mapa, consultas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chaves", type=int, default=5000)
+    parser.add_argument("--consultas", type=int, default=500)
+    parser.add_argument("--estilo", choices=["trf", "trt"], default="trf")
+    args = parser.parse_args()
+
+    mapa, consultas = gerar_cenario(args.chaves, args.consultas, args.estilo)
+
+    t0 = time.perf_counter()
+    original = [varredura_original(mapa, c) for c in consultas]
+    t_original = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    indice = IndiceDocumentos(mapa)
+    t_construcao = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    novo = [indice.resolver(c) for c in consultas]
+    t_consulta = time.perf_counter() - t0
+
+    resolvidos_original = sum(1 for r in original if r)
+    resolvidos_novo = sum(1 for r in novo if r)
+    iguais = sum(1 for a, b in zip(original, novo) if a == b)
+    print(f"{args.chaves} chaves ({args.estilo}), {args.consultas} consultas")
+    print(f"varredura original: {t_original * 1000:9.1f} ms  ({resolvidos_original} resolvidas)")
+    print(f"indice: construção {t_construcao * 1000:9.1f} ms, consultas {t_consulta * 1000:9.1f} ms  ({resolvidos_novo} resolvidas)")
+    print(f"mesmo resultado da varredura em {iguais}/{len(consultas)} consultas "
+          f"(divergências = escolha determinística entre vários candidatos)")
+
+
+if __name__ == "__main__":
+    main()
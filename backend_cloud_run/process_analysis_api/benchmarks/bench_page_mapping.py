@@ -0,0 +1,58 @@
+"""
+Benchmark do Step 3 (mapeamento de páginas): serial vs. pool de processos.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_page_mapping --pages 2000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+import page_text
+from page_mapping import mapear_paginas
+from page_text import PageTextCache
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--estilo", choices=["trf", "trt"], default="trf")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    pdf_bytes, _ = gerar_pdf_sintetico(args.pages, estilo=args.estilo)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as spool:
+        spool.write(pdf_bytes)
+        spool_path = spool.name
+
+    # Força o caminho paralelo mesmo em PDFs pequenos
+    page_text.PAGE_TEXT_PARALLEL_MIN_PAGES = 0
+    try:
+        referencia = None
+        base = None
+        print(f"{args.pages} páginas ({args.estilo}), {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'tempo (s)':>10} {'speedup':>8} {'docs':>6}")
+        for workers in args.workers:
+            doc = fitz.open(spool_path)
+            textos = PageTextCache(doc, fonte=spool_path, workers=workers)
+            t0 = time.perf_counter()
+            mapa = mapear_paginas(textos)
+            elapsed = time.perf_counter() - t0
+            doc.close()
+
+            if referencia is None:
+                referencia, base = mapa, elapsed
+            elif mapa != referencia:
+                raise SystemExit(f"Resultado divergente do serial com {workers} workers")
+            print(f"{workers:>8} {elapsed:>10.3f} {base / elapsed:>7.2f}x {len(mapa):>6}")
+    finally:
+        os.remove(spool_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Comparação offline dos payloads do Step 4 (payload_planning), sem chamar o Gemini: para cada
+sub-documento do job, o recorte em PDF (como era) contra o plano atual (texto com marcadores de
+página e PDF só dos trechos com imagem). Relata, por job, os bytes enviados e os tokens de
+entrada estimados nos dois modos, quantos documentos foram em cada modo e o tempo de montagem.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_payload --pages 600 --fracao-digitalizada 0.1
+    python -m benchmarks.bench_payload --pdf /caminho/processo.pdf     # documentos pelo mapeamento do Step 3
+"""
+import time
+import argparse
+
+import fitz  # PyMuPDF
+
+from page_text import PageTextCache
+from page_mapping import mapear_paginas
+from pdf_slicing import RecortadorPDF
+from payload_planning import PlanejadorPayload, MODO_PDF, paginas_em_pdf
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico
+
+
+def medir(doc, textos, documentos, modo, tamanho_arquivo):
+    """(bytes enviados, tokens estimados, resumo do planejador, segundos) para todos os sub-documentos."""
+    t0 = time.perf_counter()
+    planejador = PlanejadorPayload(doc, textos, modo=modo)
+    planos = [planejador.planejar(pages) for pages in documentos]
+    recortador = RecortadorPDF(doc, tamanho_arquivo=tamanho_arquivo)
+    recortador.planejar(paginas for plano in planos for paginas in paginas_em_pdf(plano))
+    for plano in planos:
+        planejador.montar(plano, recortador).descartar()
+    resumo = planejador.resumo()
+    return resumo['bytes_enviados'], resumo['tokens_estimados'], resumo, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf", default=None, help="PDF real (senão, um sintético)")
+    parser.add_argument("--pages", type=int, default=600)
+    parser.add_argument("--estilo", choices=["trf", "trt"], default="trf")
+    parser.add_argument("--timbre", action="store_true", help="timbre em imagem no topo das páginas")
+    parser.add_argument("--fracao-digitalizada", type=float, default=0.1,
+                        help="fração de páginas escaneadas (sem camada de texto) no PDF sintético")
+    args = parser.parse_args()
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        textos = PageTextCache(doc)
+        documentos = list(mapear_paginas(textos).values())
+        origem = args.pdf
+    else:
+        pdf_bytes, esperados = gerar_pdf_sintetico(args.pages, estilo=args.estilo, com_timbre=args.timbre,
+                                                   fracao_digitalizada=args.fracao_digitalizada)
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        textos = PageTextCache(doc)
+        documentos = [paginas for _, paginas in esperados]
+        origem = f"sintético {args.estilo}, {args.fracao_digitalizada:.0%} das páginas escaneadas"
+    for p in range(len(doc)):
+        textos.get(p)  # no job o texto já veio do Step 3
+    print(f"{origem}: {len(doc)} páginas, {len(pdf_bytes) / 1e6:.1f} MB, {len(documentos)} sub-documentos")
+
+    bytes_pdf, tokens_pdf, _, tempo_pdf = medir(doc, textos, documentos, MODO_PDF, len(pdf_bytes))
+    bytes_plano, tokens_plano, resumo, tempo_plano = medir(doc, textos, documentos, 'hibrido', len(pdf_bytes))
+
+    print(f"{'':>10} {'bytes':>12} {'tokens':>10} {'montagem s':>11}")
+    print(f"{'PDF':>10} {bytes_pdf:>12,} {tokens_pdf:>10,} {tempo_pdf:>11.3f}")
+    print(f"{'híbrido':>10} {bytes_plano:>12,} {tokens_plano:>10,} {tempo_plano:>11.3f}")
+    print(f"economia: {bytes_pdf - bytes_plano:,} bytes ({1 - bytes_plano / max(1, bytes_pdf):.0%}), "
+          f"{tokens_pdf - tokens_plano:,} tokens ({1 - tokens_plano / max(1, tokens_pdf):.0%})")
+    print(f"documentos por modo: {resumo['documentos']}; páginas como texto {resumo['paginas_texto']}, "
+          f"em PDF {resumo['paginas_pdf']}")
+
+
+if __name__ == "__main__":
+    main()
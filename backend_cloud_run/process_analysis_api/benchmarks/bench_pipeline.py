@@ -0,0 +1,234 @@
+"""
+Benchmark offline do processar_pdf completo, com PDFs sintéticos (TRF/TRT) e fakes em memória
+do Firestore, GCS, Gemini e consolidação (latências configuráveis) e a FilaLocal no lugar do Cloud Tasks.
+Relata por etapa: tempo de parede, CPU do processo, pico de memória (VmHWM) e RPCs.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_pipeline --pages 600 --latencia-pro-ms 300
+    python -m benchmarks.bench_pipeline --pages 600 --salvar-baseline trf600
+    python -m benchmarks.bench_pipeline --pages 600 --comparar trf600
+    python -m benchmarks.bench_pipeline --pages 300 --interromper-no-commit 6   # retomada por checkpoint
+    python -m benchmarks.bench_pipeline --pages 300 --fanout 1                  # fan-out/fan-in pela FilaLocal
+    OCR_MOTOR=tesseract python -m benchmarks.bench_pipeline --pages 100 --digitalizado
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import logging
+import time
+
+# Só functions_framework e google.api_core vêm dos stubs; os clientes são substituídos pelos fakes
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs_nuvem"))
+
+import main  # noqa: E402
+from job_metrics import resetar_pico_rss, pico_rss_mb  # noqa: E402
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico  # noqa: E402
+from benchmarks.fakes_pipeline import (FakeFirestore, FakeGCS, FakeGenAI, FakeConsolidacao, FalhaInjetada,  # noqa: E402
+                                       modulo_firestore)
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+TIPOS = ["Petição Inicial", "Procuração", "Laudo Médico", "Despacho", "Certidão de Intimação",
+         "Atestado Médico", "Contestação", "Documento de Identificação"]
+BUCKET = "bucket-bench"
+
+
+class MedidorEtapas:
+    """Fases sequenciais do job; cada fronteira fecha a fase atual e abre a próxima."""
+
+    def __init__(self, contadores):
+        self.contadores = contadores  # callable -> dict de RPCs acumulados
+        self.etapas = {}
+        self.prefixo = ''
+        self._atual = None
+
+    def iniciar(self, nome):
+        self.fechar()
+        nome = self.prefixo + nome
+        resetar_pico_rss()
+        self._atual = (nome, time.perf_counter(), time.process_time(), self.contadores())
+
+    def fechar(self):
+        if self._atual is None:
+            return
+        nome, t0, cpu0, rpcs0 = self._atual
+        rpcs = {k: v - rpcs0.get(k, 0) for k, v in self.contadores().items() if v - rpcs0.get(k, 0)}
+        anterior = self.etapas.get(nome, {'parede_s': 0.0, 'cpu_s': 0.0, 'pico_mb': 0.0, 'rpcs': {}})
+        for k, v in rpcs.items():
+            anterior['rpcs'][k] = anterior['rpcs'].get(k, 0) + v
+        self.etapas[nome] = {
+            'parede_s': round(anterior['parede_s'] + time.perf_counter() - t0, 3),
+            'cpu_s': round(anterior['cpu_s'] + time.process_time() - cpu0, 3),
+            'pico_mb': max(anterior['pico_mb'], pico_rss_mb() or 0.0),
+            'rpcs': anterior['rpcs'],
+        }
+        self._atual = None
+
+    def envolver(self, funcao, etapa, depois):
+        def envolvida(*args, **kwargs):
+            self.iniciar(etapa)
+            try:
+                return funcao(*args, **kwargs)
+            finally:
+                self.iniciar(depois)
+        return envolvida
+
+
+def preparar(args):
+    pdf_bytes, documentos = gerar_pdf_sintetico(args.pages, estilo=args.estilo, com_timbre=args.timbre,
+                                                digitalizado=args.digitalizado)
+    rng = random.Random(7)
+    indice = [{'id_documento': doc_id, 'tipo_original': rng.choice(TIPOS), 'data': '01/01/2024'}
+              for doc_id, _ in documentos]
+
+    db = FakeFirestore(latencia_s=args.latencia_firestore_ms / 1000, falhar_commit_n=args.interromper_no_commit)
+    gcs = FakeGCS(latencia_s=args.latencia_gcs_ms / 1000)
+    genai = FakeGenAI(main.PROMPT_SUMARIO, indice, numero_processo=args.numero_processo,
+                      latencias_s={main.MODEL_PRO_NAME: args.latencia_pro_ms / 1000,
+                                   main.MODEL_FLASH_NAME: args.latencia_flash_ms / 1000})
+
+    main.db.substituir(db)
+    main.firestore.substituir(modulo_firestore(db))
+    main.storage_client.substituir(gcs)
+    main.genai.substituir(genai)
+    main.logging_client.substituir(object())
+    main.usar_fila_local(workers=args.workers_fila)
+    main.FANOUT_MIN_TASKS = args.fanout
+
+    gcs.objetos[(BUCKET, "uploads/processo.pdf")] = pdf_bytes
+    return db, gcs, genai, len(pdf_bytes), len(documentos)
+
+
+def contadores_rpc(db, gcs, genai):
+    def ler():
+        valores = {}
+        for prefixo, fonte in (("firestore", db), ("gcs", gcs), ("gemini", genai)):
+            for k, v in fonte.contadores.copia().items():
+                valores[f"{prefixo}.{k}"] = v
+        return valores
+    return ler
+
+
+def executar(args):
+    db, gcs, genai, tamanho_pdf, n_docs = preparar(args)
+    medidor = MedidorEtapas(contadores_rpc(db, gcs, genai))
+    main.baixar_blob_para_arquivo = medidor.envolver(main.baixar_blob_para_arquivo, 'download', 'texto_indice')
+    main.identificar_sumario = medidor.envolver(main.identificar_sumario, 'indice', 'pos_indice')
+    main.mapear_paginas = medidor.envolver(main.mapear_paginas, 'mapeamento', 'analise')
+
+    job_id = "job-bench"
+    file_path = f"gs://{BUCKET}/uploads/processo.pdf"
+    db.collection('analises_processos').document(job_id).set({'status': 'ENFILEIRADO', 'progresso': 0})
+
+    execucoes = 0
+    with FakeConsolidacao() as consolidacao:
+        main.CONSOLIDATION_URL = main.agregador_consolidacao.url = consolidacao.url
+        main.agregador_consolidacao.janela_s = 0.05  # um job por vez: a janela só atrasaria o fim
+        t0 = time.perf_counter()
+        while True:
+            execucoes += 1
+            # Na reentrega as etapas com checkpoint não rodam: as fases ficam separadas da 1ª execução
+            medidor.prefixo = 'retomada:' if execucoes > 1 else ''
+            medidor.iniciar('preparacao')
+            try:
+                main.processar_pdf(job_id, file_path)
+                caiu = False
+            except FalhaInjetada:
+                caiu = True
+            medidor.fechar()
+            # Reentrega após a falha injetada, como o Cloud Tasks faria
+            if not caiu:
+                break
+        medidor.prefixo = ''
+        if args.fanout:
+            medidor.iniciar('fanout_partes')
+            main.fila_local.aguardar(timeout=600)
+            medidor.fechar()
+        parede = time.perf_counter() - t0
+        consolidacoes = len(consolidacao.recebidos)
+    main.fila_local.encerrar()
+
+    job = db.docs[f"analises_processos/{job_id}"]
+    parent_id = args.numero_processo.replace('/', '-').replace(' ', '') if args.numero_processo else job_id
+    return {
+        'cenario': {k: v for k, v in vars(args).items() if k not in ('salvar_baseline', 'comparar')},
+        'pdf_mb': round(tamanho_pdf / 1024 / 1024, 2),
+        'documentos_no_indice': n_docs,
+        'execucoes': execucoes,
+        'status': job.get('status'),
+        'documentos_analisados': len(db.listar(f"analises_processos/{parent_id}/documentos_analisados")),
+        'documentos_ignorados': len(db.listar(f"analises_processos/{parent_id}/documentos_ignorados")),
+        'consolidacoes': consolidacoes,
+        'parede_total_s': round(parede, 3),
+        'etapas': medidor.etapas,
+        'metricas_job': job.get('metricas'),
+        'payload_analise': job.get('payload_analise'),
+    }
+
+
+def imprimir(resultado, baseline=None):
+    print(f"PDF {resultado['pdf_mb']}MB, {resultado['documentos_no_indice']} documentos no índice; "
+          f"status {resultado['status']} em {resultado['execucoes']} execução(ões); "
+          f"{resultado['documentos_analisados']} analisados, {resultado['documentos_ignorados']} ignorados, "
+          f"{resultado['consolidacoes']} consolidação(ões)")
+    print(f"{'etapa':>22} {'parede s':>9} {'cpu s':>8} {'pico MB':>8}  rpcs")
+    for nome, e in resultado['etapas'].items():
+        rpcs = ', '.join(f"{k}={v}" for k, v in sorted(e['rpcs'].items()))
+        delta = ''
+        if baseline and nome in baseline['etapas']:
+            base = baseline['etapas'][nome]['parede_s']
+            if base:
+                delta = f" ({(e['parede_s'] - base) / base:+.0%})"
+        print(f"{nome:>22} {e['parede_s']:>9.3f} {e['cpu_s']:>8.3f} {e['pico_mb']:>8.1f}  {rpcs}{delta}")
+    total = f"{'total':>22} {resultado['parede_total_s']:>9.3f}"
+    if baseline:
+        base = baseline['parede_total_s']
+        total += f"  (baseline {base:.3f}s, {(resultado['parede_total_s'] - base) / base:+.0%})"
+    print(total)
+    if resultado.get('payload_analise'):
+        print(f"payload da análise (payload_planning): {resultado['payload_analise']}")
+    if resultado.get('metricas_job'):
+        print("metricas do job (RastreadorEtapas):")
+        for nome, m in resultado['metricas_job'].items():
+            print(f"{nome:>22} " + ', '.join(f"{k}={v}" for k, v in m.items()))
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--estilo", choices=["trf", "trt"], default="trf")
+    parser.add_argument("--timbre", action="store_true")
+    parser.add_argument("--digitalizado", action="store_true", help="páginas só com imagem (fallback de OCR)")
+    parser.add_argument("--numero-processo", default="0001234-56.2024.4.01.3304")
+    parser.add_argument("--latencia-pro-ms", type=float, default=200)
+    parser.add_argument("--latencia-flash-ms", type=float, default=80)
+    parser.add_argument("--latencia-firestore-ms", type=float, default=5)
+    parser.add_argument("--latencia-gcs-ms", type=float, default=10)
+    parser.add_argument("--fanout", type=int, default=0, help="FANOUT_MIN_TASKS (0 = loop local)")
+    parser.add_argument("--workers-fila", type=int, default=8)
+    parser.add_argument("--interromper-no-commit", type=int, default=None,
+                        help="falha injetada no N-ésimo commit; o job é reentregue e retoma dos checkpoints")
+    parser.add_argument("--salvar-baseline", metavar="NOME")
+    parser.add_argument("--comparar", metavar="NOME")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    baseline = None
+    if args.comparar:
+        with open(os.path.join(BASELINES, f"{args.comparar}.json")) as f:
+            baseline = json.load(f)
+
+    resultado = executar(args)
+    imprimir(resultado, baseline)
+
+    if args.salvar_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        caminho = os.path.join(BASELINES, f"{args.salvar_baseline}.json")
+        with open(caminho, "w") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"baseline salva em {caminho}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,92 @@
+"""
+Benchmark do fallback para PDFs digitalizados (page_render): detecção das páginas sem texto,
+renderização de páginas inteiras (imagens do Step 2) e OCR da faixa do rodapé (Step 3),
+em série e no pool de processos, e uma segunda passada servida pelo cache de páginas.
+Relata páginas por segundo.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_render --pages 300 --workers 1 4
+    python -m benchmarks.bench_render --pages 300 --ocr tesseract          # motor real
+    python -m benchmarks.bench_render --pages 300 --ocr-simulado-ms 40     # OCR fake com custo fixo
+"""
+import os
+import time
+import argparse
+import tempfile
+
+import fitz  # PyMuPDF
+
+import page_render
+from page_text import PageTextCache
+from page_mapping import mapear_paginas
+from page_render import RenderizadorPaginas, REGIAO_PAGINA
+from result_cache import LRUCache
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico
+
+
+def ocr_simulado(png):
+    """Motor de OCR fake (OCR_SIMULADO_MS por imagem); definido no módulo para rodar nos workers."""
+    time.sleep(int(os.environ.get("OCR_SIMULADO_MS", "40")) / 1000)
+    return ""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--estilo", choices=["trf", "trt"], default="trf")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--ocr", default=None, help="motor de OCR (mupdf, tesseract, modulo:funcao)")
+    parser.add_argument("--ocr-simulado-ms", type=int, default=40)
+    args = parser.parse_args()
+
+    os.environ["OCR_SIMULADO_MS"] = str(args.ocr_simulado_ms)
+    motor = args.ocr or "benchmarks.bench_render:ocr_simulado"
+    t0 = time.perf_counter()
+    pdf_bytes, documentos = gerar_pdf_sintetico(args.pages, estilo=args.estilo, digitalizado=True)
+    print(f"{args.pages} páginas digitalizadas ({args.estilo}), {len(pdf_bytes) / 1e6:.1f} MB, "
+          f"gerado em {time.perf_counter() - t0:.1f}s; OCR: {motor}")
+
+    with tempfile.TemporaryDirectory() as dir_temp:
+        spool_path = os.path.join(dir_temp, "spool.pdf")
+        with open(spool_path, "wb") as f:
+            f.write(pdf_bytes)
+        page_render.RENDER_PARALLEL_MIN_PAGES = 0
+
+        print(f"{'workers':>8} {'detecção':>10} {'páginas':>10} {'rodapé+OCR':>11} {'2ª passada':>11} {'docs':>6}")
+        for workers in args.workers:
+            doc = fitz.open(spool_path)
+            textos = PageTextCache(doc, fonte=spool_path, workers=workers)
+            cache = LRUCache(max_items=args.pages * 3)
+
+            t0 = time.perf_counter()
+            renderizador = RenderizadorPaginas(doc, fonte=spool_path, workers=workers, cache=cache, motor_ocr=motor)
+            sem_texto = renderizador.sem_texto(textos)
+            t_deteccao = time.perf_counter() - t0
+            if len(sem_texto) != args.pages:
+                raise SystemExit(f"Só {len(sem_texto)} de {args.pages} páginas detectadas como digitalizadas")
+
+            t0 = time.perf_counter()
+            renderizador.renderizar(sem_texto, REGIAO_PAGINA)
+            t_paginas = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            mapa = mapear_paginas(textos, renderizador)
+            t_ocr = time.perf_counter() - t0
+
+            # Mesmo arquivo de novo (reprocessamento): imagens e OCR vêm do cache
+            novo = RenderizadorPaginas(doc, fonte=spool_path, workers=workers, cache=cache, motor_ocr=motor)
+            t0 = time.perf_counter()
+            novo.renderizar(sem_texto, REGIAO_PAGINA)
+            novo.ocr_rodapes(sem_texto)
+            t_cache = time.perf_counter() - t0
+            doc.close()
+
+            def pps(t):
+                return f"{args.pages / t:7.1f} p/s" if t else "      - p/s"
+            print(f"{workers:>8} {pps(t_deteccao):>10} {pps(t_paginas):>10} {pps(t_ocr):>11} {pps(t_cache):>11} "
+                  f"{len(mapa):>6}")
+        print(f"documentos esperados: {len(documentos)} (o mapa só se completa com um motor de OCR real)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark do agendamento por tamanho (job_scheduling) com a FilaLocal no lugar do Cloud Tasks e
+uma carga sintética mista: poucos processos gigantes de um usuário chegando primeiro e muitos
+processos pequenos/médios de outros usuários logo depois. Cada job "processa" por um tempo
+proporcional às páginas. Compara a fila única original (mesmo total de workers, FIFO) com as
+filas por classe + fair share por usuário, e relata a espera na fila (p50/p95/máx) por classe.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_scheduling --jobs 120 --ms-por-pagina 2
+"""
+import time
+import random
+import argparse
+import statistics
+import threading
+
+import job_scheduling
+from job_scheduling import AgendadorJobs, ClasseTamanho, classificar
+from task_queue import FilaLocal
+from benchmarks.fakes_pipeline import FakeFirestore, modulo_firestore
+
+ROTA = '/api/worker/processar-pdf'
+
+
+def gerar_carga(n_jobs, seed=3):
+    """[(atraso_chegada_s, usuario, paginas)]: um usuário com processos gigantes e vários com pequenos."""
+    rng = random.Random(seed)
+    carga = [(0.0, 'escritorio-grande', rng.randint(2500, 3500)) for _ in range(max(1, n_jobs // 20))]
+    chegada = 0.01
+    while len(carga) < n_jobs:
+        usuario = f"perito-{rng.randint(1, 12)}"
+        paginas = rng.randint(10, 120) if rng.random() < 0.8 else rng.randint(200, 900)
+        if usuario == 'perito-1':
+            # Um usuário comum que sobe vários processos de uma vez
+            carga += [(chegada, usuario, rng.randint(10, 80)) for _ in range(6)]
+        else:
+            carga.append((chegada, usuario, paginas))
+        chegada += rng.uniform(0.0, 0.01)
+    return carga[:n_jobs]
+
+
+def executar(carga, classes, ms_por_pagina, fair_share):
+    esperas = {c.nome: [] for c in classes}
+    lock = threading.Lock()
+
+    def despachar(rota, payload, tentativa):
+        espera = time.time() - payload['enfileiradoEm']
+        with lock:
+            esperas[payload['classe']].append(espera)
+        time.sleep(payload['paginas'] * ms_por_pagina / 1000)
+
+    fila = FilaLocal(despachar, workers=sum(c.concorrencia for c in classes),
+                     filas={c.fila: c.concorrencia for c in classes} if fair_share else None)
+    db = FakeFirestore()
+    agendador = AgendadorJobs(db, modulo_firestore(db), classes=classes,
+                              segundos_por_pagina=ms_por_pagina / 1000)
+    t0 = time.time()
+    for chegada, usuario, paginas in carga:
+        atraso = t0 + chegada - time.time()
+        if atraso > 0:
+            time.sleep(atraso)
+        if fair_share:
+            agendamento = agendador.agendar(paginas, paginas * 50_000, usuario)
+            classe, atraso_justo = agendamento.classe, agendamento.atraso_s
+        else:
+            classe, atraso_justo = classificar(paginas, paginas * 50_000, classes), 0
+        payload = {'enfileiradoEm': time.time(), 'classe': classe.nome, 'paginas': paginas}
+        fila.criar_tarefa(ROTA, payload, fila=classe.fila if fair_share else None, atraso_s=atraso_justo)
+    fila.aguardar()
+    fila.encerrar()
+    return esperas, time.time() - t0
+
+
+def percentil(valores, p):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+def relatar(nome, esperas, duracao):
+    print(f"{nome} (total {duracao:.1f}s)")
+    for classe, valores in esperas.items():
+        if valores:
+            print(f"    {classe:<8} {len(valores):4d} jobs  espera p50 {percentil(valores, 50):7.2f}s  "
+                  f"p95 {percentil(valores, 95):7.2f}s  máx {max(valores):7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=120)
+    parser.add_argument("--ms-por-pagina", type=float, default=2.0, help="tempo simulado de processamento")
+    parser.add_argument("--workers", type=int, nargs=3, default=[6, 3, 1], metavar=("PEQ", "MED", "GRA"),
+                        help="concorrência de cada classe (a fila única usa a soma)")
+    args = parser.parse_args()
+
+    base = job_scheduling.CLASSES_TAMANHO
+    classes = [ClasseTamanho(c.nome, c.max_paginas, c.max_bytes, c.fila, n, c.deadline_s)
+               for c, n in zip(base, args.workers)]
+    carga = gerar_carga(args.jobs)
+    print(f"{len(carga)} jobs, {sum(p for _, _, p in carga)} páginas, {args.ms_por_pagina} ms/página, "
+          f"concorrência {dict(zip((c.nome for c in classes), args.workers))}")
+    relatar("fila única (FIFO)", *executar(carga, classes, args.ms_por_pagina, fair_share=False))
+    relatar("classes + fair share", *executar(carga, classes, args.ms_por_pagina, fair_share=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark do recorte de sub-documentos (Step 4): serialização original
+(insert_pdf + tobytes sem otimização) vs. RecortadorPDF (garbage/deflate, intervalos planejados).
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_slicing --pages 1000 --timbre
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from pdf_slicing import RecortadorPDF
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico
+
+
+def recortar_original(doc, pages):
+    new_doc = fitz.open()
+    new_doc.insert_pdf(doc, from_page=min(pages), to_page=max(pages))
+    dados = new_doc.tobytes(no_new_id=True)
+    new_doc.close()
+    return dados
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--estilo", choices=["trf", "trt"], default="trf")
+    parser.add_argument("--timbre", action="store_true", help="imagem compartilhada em todas as páginas")
+    parser.add_argument("--repeticoes", type=float, default=0.1,
+                        help="fração de sub-documentos indexados duas vezes no sumário")
+    parser.add_argument("--limite-inline-mb", type=float, default=None,
+                        help="força recortes em disco acima deste tamanho")
+    args = parser.parse_args()
+
+    pdf_bytes, documentos = gerar_pdf_sintetico(args.pages, estilo=args.estilo, com_timbre=args.timbre)
+    tarefas = [paginas for _, paginas in documentos]
+    tarefas += tarefas[:int(len(tarefas) * args.repeticoes)]
+    tarefas.sort(key=min)
+
+    with tempfile.TemporaryDirectory() as dir_temp:
+        spool_path = os.path.join(dir_temp, "spool.pdf")
+        with open(spool_path, "wb") as f:
+            f.write(pdf_bytes)
+        doc = fitz.open(spool_path)
+
+        t0 = time.perf_counter()
+        bytes_original = sum(len(recortar_original(doc, pages)) for pages in tarefas)
+        t_original = time.perf_counter() - t0
+
+        opcoes = {}
+        if args.limite_inline_mb is not None:
+            opcoes['limite_inline'] = int(args.limite_inline_mb * 1024 * 1024)
+        recortador = RecortadorPDF(doc, tamanho_arquivo=len(pdf_bytes), dir_temp=dir_temp, **opcoes)
+        recortador.planejar(tarefas)
+        t0 = time.perf_counter()
+        for pages in tarefas:
+            recortador.recortar(pages).descartar()
+        t_novo = time.perf_counter() - t0
+        doc.close()
+
+    resumo = recortador.resumo()
+    n = len(tarefas)
+    print(f"{args.pages} páginas ({args.estilo}{', com timbre' if args.timbre else ''}), "
+          f"PDF de {len(pdf_bytes) / 1024 / 1024:.1f}MB, {n} recortes")
+    print(f"{'':>12} {'MB gerados':>11} {'ms/recorte':>11}")
+    print(f"{'original':>12} {bytes_original / 1024 / 1024:>11.2f} {t_original / n * 1000:>11.2f}")
+    print(f"{'recortador':>12} {resumo['bytes_gerados'] / 1024 / 1024:>11.2f} {t_novo / n * 1000:>11.2f}")
+    print(f"reaproveitados: {resumo['reaproveitados']}, em disco: {resumo['em_disco']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark de cold start do main.py com stubs locais das bibliotecas GCP (benchmarks/stubs_nuvem),
+que simulam o custo de import e de criação de cada cliente.
+Cada cenário roda num processo novo: import do módulo, 1ª e 2ª requisição a /api/upload-url.
+O cenário "ansioso" força todos os clientes no import, como antes da inicialização sob demanda.
+
+Uso (a partir de backend_cloud_run/process_analysis_api):
+    python -m benchmarks.bench_startup --import-ms 150 --cliente-ms 200
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+STUBS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stubs_nuvem")
+
+SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+if sys.argv[1] == "ansioso":
+    for proxy in (main.firestore, main.db, main.storage_client, main.logging_client,
+                  main.tasks_v2, main.tasks_client, main.genai):
+        proxy.obter()
+t_pronto = time.perf_counter() - t0
+
+class Requisicao:
+    method = "POST"
+    path = "/api/upload-url"
+    headers = {}
+    def get_json(self, silent=False):
+        return {"name": "processo.pdf", "type": "application/pdf"}
+
+tempos = []
+for _ in range(2):
+    t = time.perf_counter()
+    corpo, status, _ = main.process_analysis_api(Requisicao())
+    assert status == 200, corpo
+    tempos.append(time.perf_counter() - t)
+print(json.dumps({"import_s": t_import, "pronto_s": t_pronto, "primeira_s": tempos[0], "segunda_s": tempos[1],
+                  "clientes": sorted(k for k in main.tempos_inicializacao if k != "import_main")}))
+"""
+
+
+def rodar(cenario, env):
+    saida = subprocess.run([sys.executable, "-c", SCRIPT, cenario], env=env, capture_output=True,
+                           text=True, check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--import-ms", type=int, default=150)
+    parser.add_argument("--cliente-ms", type=int, default=200)
+    parser.add_argument("--reais", action="store_true", help="usa as bibliotecas instaladas em vez dos stubs")
+    args = parser.parse_args()
+
+    env = dict(os.environ, STUB_IMPORT_MS=str(args.import_ms), STUB_CLIENTE_MS=str(args.cliente_ms),
+               BUCKET_NAME=os.environ.get("BUCKET_NAME", "bucket-bench"))
+    if not args.reais:
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (STUBS, env.get("PYTHONPATH")) if p)
+
+    print(f"stubs: import {args.import_ms}ms, cliente {args.cliente_ms}ms" if not args.reais else "bibliotecas reais")
+    print(f"{'cenário':>10} {'import':>8} {'pronto':>8} {'1ª req':>8} {'2ª req':>8}  clientes criados")
+    for cenario in ("ansioso", "sob-demanda"):
+        r = rodar(cenario, env)
+        print(f"{cenario:>10} {r['import_s']:>8.3f} {r['pronto_s']:>8.3f} {r['primeira_s']:>8.3f} "
+              f"{r['segunda_s']:>8.3f}  {', '.join(r['clientes'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Servidor HTTP local que simula o endpoint de geração do Gemini com throttling,
+para exercitar o LimitadorModelo sem cota real.
+"""
+import json
+import time
+import random
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class ErroModeloHttp(Exception):
+    """Erro HTTP do modelo fake; expõe `code` como as exceções do google.api_core."""
+
+    def __init__(self, code, mensagem=""):
+        super().__init__(f"{code} {mensagem}".strip())
+        self.code = code
+
+
+class FakeGemini:
+    """
+    POST /generate {"tokens": n} -> {"text": "{}", "tokens": n} após `latencia_s`.
+    Responde 429 acima de `max_concorrencia` chamadas simultâneas ou de `rpm` por janela de 60s,
+    e 503 com probabilidade `prob_503`.
+    """
+
+    def __init__(self, latencia_s=0.05, max_concorrencia=4, rpm=0, prob_503=0.0, seed=1):
+        self.latencia_s = latencia_s
+        self.max_concorrencia = max_concorrencia
+        self.rpm = rpm
+        self.prob_503 = prob_503
+        self.rng = random.Random(seed)
+        self.em_voo = 0
+        self.aceitas = []  # instantes das requisições aceitas
+        self.respostas = {200: 0, 429: 0, 503: 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _admitir(self):
+        with self.lock:
+            agora = time.monotonic()
+            self.aceitas = [t for t in self.aceitas if agora - t < 60]
+            if self.em_voo >= self.max_concorrencia or (self.rpm and len(self.aceitas) >= self.rpm):
+                return 429
+            if self.rng.random() < self.prob_503:
+                return 503
+            self.em_voo += 1
+            self.aceitas.append(agora)
+            return 200
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                status = fake._admitir()
+                if status == 200:
+                    try:
+                        time.sleep(fake.latencia_s)
+                    finally:
+                        with fake.lock:
+                            fake.em_voo -= 1
+                    resposta = json.dumps({'text': '{}', 'tokens': corpo.get('tokens', 0)}).encode()
+                else:
+                    resposta = json.dumps({'error': status}).encode()
+                with fake.lock:
+                    fake.respostas[status] += 1
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(resposta)))
+                self.end_headers()
+                self.wfile.write(resposta)
+
+        return Handler
+
+
+class ModeloFake:
+    """Cliente com a interface usada do GenerativeModel (generate_content -> .text/.usage_metadata)."""
+
+    def __init__(self, base_url, session=None):
+        self.url = f"{base_url}/generate"
+        self.session = session or requests.Session()
+
+    def generate_content(self, conteudo, generation_config=None):
+        tokens = conteudo.get('tokens', 0) if isinstance(conteudo, dict) else 0
+        resp = self.session.post(self.url, json={'tokens': tokens}, timeout=30)
+        if resp.status_code != 200:
+            raise ErroModeloHttp(resp.status_code, resp.text)
+        dados = resp.json()
+        return SimpleNamespace(text=dados['text'],
+                               usage_metadata=SimpleNamespace(total_token_count=dados['tokens']))
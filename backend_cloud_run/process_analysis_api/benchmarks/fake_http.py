@@ -0,0 +1,109 @@
+"""
+Servidores HTTP locais que substituem o Drive (alt=media) e a sessão de upload
+resumível do GCS nos benchmarks, com injeção de falhas transitórias.
+"""
+import re
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeDriveGcs:
+    """
+    GET  /drive   -> conteúdo de `dados` (suporta Range); pode cortar a conexão uma vez
+                     após `cortar_download_em` bytes.
+    PUT  /upload  -> protocolo de upload resumível (Content-Range, 308 + Range, 200 no final);
+                     responde 503 nos PUTs listados em `falhar_puts` (contagem 1-based).
+    """
+
+    def __init__(self, dados, cortar_download_em=None, falhar_puts=()):
+        self.dados = dados
+        # Só o tamanho e o MD5 do que foi recebido, para não distorcer a medição de memória
+        self.recebido = 0
+        self.md5_recebido = hashlib.md5()
+        self.finalizado = False
+        self.cortar_download_em = cortar_download_em
+        self.falhar_puts = set(falhar_puts)
+        self.puts = 0
+        self.gets = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.gets += 1
+                inicio = 0
+                match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+                if match:
+                    inicio = int(match.group(1))
+                corpo = memoryview(fake.dados)[inicio:]
+                self.send_response(206 if match else 200)
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                corte = fake.cortar_download_em
+                if corte is not None and inicio < corte:
+                    fake.cortar_download_em = None
+                    corpo = corpo[:corte - inicio]
+                    self.close_connection = True
+                try:
+                    self.wfile.write(corpo)
+                except ConnectionError:
+                    pass
+
+            def do_PUT(self):
+                corpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with fake.lock:
+                    fake.puts += 1
+                    if fake.puts in fake.falhar_puts:
+                        self._responder(503)
+                        return
+                    content_range = self.headers.get('Content-Range', '')
+                    match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+                    if match:
+                        inicio = int(match.group(1))
+                        if inicio == fake.recebido:
+                            fake.recebido += len(corpo)
+                            fake.md5_recebido.update(corpo)
+                        total = match.group(3)
+                        if total != '*' and fake.recebido == int(total):
+                            fake.finalizado = True
+                    else:
+                        total = content_range.rsplit('/', 1)[-1]
+                        if total != '*' and fake.recebido == int(total):
+                            fake.finalizado = True
+                    if fake.finalizado:
+                        self._responder(200)
+                    elif fake.recebido:
+                        self._responder(308, {'Range': f'bytes=0-{fake.recebido - 1}'})
+                    else:
+                        self._responder(308)
+
+            def _responder(self, status, headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        return Handler
@@ -0,0 +1,474 @@
+"""
+Fakes em memória do Firestore, GCS, Gemini e do serviço de consolidação para rodar
+o processar_pdf offline (bench_pipeline). Cada RPC dorme a latência configurada e é contada.
+"""
+import io
+import json
+import time
+import uuid
+import base64
+import hashlib
+import threading
+import copy
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Contadores:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.valores = {}
+
+    def somar(self, nome, n=1):
+        with self.lock:
+            self.valores[nome] = self.valores.get(nome, 0) + n
+
+    def copia(self):
+        with self.lock:
+            return dict(self.valores)
+
+
+# --- Firestore ---
+
+SERVER_TIMESTAMP = object()
+
+
+class FalhaInjetada(BaseException):
+    """Queda do worker: não é tratada pelo `except Exception` do job, como um processo morto."""
+    pass
+
+
+def _resolver_valores(dados):
+    return {k: (datetime.now(timezone.utc) if v is SERVER_TIMESTAMP else copy.deepcopy(v)) for k, v in dados.items()}
+
+
+class Snapshot:
+    def __init__(self, ref, dados):
+        self.reference = ref
+        self.id = ref.id
+        self._dados = dados
+        self.exists = dados is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._dados) if self._dados is not None else None
+
+
+class RefDocumento:
+    def __init__(self, db, caminho):
+        self.db = db
+        self.caminho = caminho
+        self.id = caminho.rsplit('/', 1)[-1]
+
+    def collection(self, nome):
+        return RefColecao(self.db, f"{self.caminho}/{nome}")
+
+    def get(self, transaction=None, field_paths=None):
+        if transaction is not None:
+            transaction.travar(self.caminho)
+        self.db._rpc('leituras')
+        with self.db.lock:
+            return Snapshot(self, self.db.docs.get(self.caminho))
+
+    def set(self, dados, merge=False):
+        self.db._rpc('escritas')
+        self.db._aplicar('set', self, dados, merge)
+
+    def update(self, dados):
+        self.db._rpc('escritas')
+        self.db._aplicar('update', self, dados, None)
+
+    def delete(self):
+        self.db._rpc('escritas')
+        self.db._aplicar('delete', self, None, None)
+
+
+# Operadores de where() suportados (documentos sem o campo nunca casam, como no Firestore)
+OPERADORES = {
+    '==': lambda campo, valor: campo == valor,
+    'in': lambda campo, valor: campo in valor,
+    '>': lambda campo, valor: campo > valor,
+    '>=': lambda campo, valor: campo >= valor,
+    '<': lambda campo, valor: campo < valor,
+    '<=': lambda campo, valor: campo <= valor,
+}
+
+
+class RefColecao:
+    def __init__(self, db, caminho, campos=None, filtros=()):
+        self.db = db
+        self.caminho = caminho
+        self.campos = campos
+        self.filtros = filtros
+
+    def document(self, doc_id=None):
+        return RefDocumento(self.db, f"{self.caminho}/{doc_id or uuid.uuid4().hex[:20]}")
+
+    def select(self, campos):
+        return RefColecao(self.db, self.caminho, campos, self.filtros)
+
+    def where(self, campo, operador, valor):
+        if operador not in OPERADORES:
+            raise NotImplementedError(f"Unsupported operator: {operador}")
+        return RefColecao(self.db, self.caminho, self.campos, self.filtros + ((campo, OPERADORES[operador], valor),))
+
+    def stream(self):
+        self.db._rpc('leituras')
+        prefixo = self.caminho + '/'
+        with self.db.lock:
+            itens = [(c, d) for c, d in self.db.docs.items()
+                     if c.startswith(prefixo) and '/' not in c[len(prefixo):]
+                     and all(campo in d and testar(d[campo], valor) for campo, testar, valor in self.filtros)]
+        for caminho, dados in sorted(itens):
+            if self.campos is not None:
+                dados = {k: v for k, v in dados.items() if k in self.campos}
+            self.db._documento_lido()
+            yield Snapshot(RefDocumento(self.db, caminho), dados)
+
+
+class Lote:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, ref, dados, merge=False):
+        self.ops.append(('set', ref, dados, merge))
+
+    def update(self, ref, dados):
+        self.ops.append(('update', ref, dados, None))
+
+    def delete(self, ref):
+        self.ops.append(('delete', ref, None, None))
+
+    def commit(self):
+        self.db._rpc('commits')
+        self.db._verificar_falha()
+        with self.db.lock:
+            # Atômico como o WriteBatch: se uma operação falhar, as anteriores são desfeitas
+            anteriores = []
+            try:
+                for op in self.ops:
+                    caminho = op[1].caminho
+                    anteriores.append((caminho, copy.deepcopy(self.db.docs.get(caminho))))
+                    self.db._aplicar(*op, travado=True)
+            except Exception:
+                for caminho, dados in reversed(anteriores):
+                    if dados is None:
+                        self.db.docs.pop(caminho, None)
+                    else:
+                        self.db.docs[caminho] = dados
+                raise
+
+
+class Transacao(Lote):
+    """Lê sob trava do documento até o commit: transações no mesmo documento são serializadas."""
+
+    def __init__(self, db, max_attempts=5):
+        super().__init__(db)
+        self._travas = []
+
+    def travar(self, caminho):
+        trava = self.db.trava_documento(caminho)
+        if trava not in self._travas:
+            trava.acquire()
+            self._travas.append(trava)
+
+    def liberar(self):
+        while self._travas:
+            self._travas.pop().release()
+
+
+class FakeFirestore:
+    """
+    Firestore em memória: documentos por caminho completo ("colecao/doc/subcolecao/doc").
+    `falhar_commit_n` faz o N-ésimo commit de lote lançar FalhaInjetada (simula a queda do worker).
+    `latencia_doc_s` é o custo extra por documento devolvido em stream/get_all (contado em `documentos_lidos`).
+    """
+
+    def __init__(self, latencia_s=0.0, falhar_commit_n=None, latencia_doc_s=0.0):
+        self.latencia_s = latencia_s
+        self.latencia_doc_s = latencia_doc_s
+        self.docs = {}
+        self.lock = threading.RLock()
+        self._travas_documentos = {}
+        self.contadores = Contadores()
+        self.falhar_commit_n = falhar_commit_n
+        self._commits = 0
+
+    def _rpc(self, tipo):
+        self.contadores.somar(tipo)
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+
+    def _documento_lido(self):
+        self.contadores.somar('documentos_lidos')
+        if self.latencia_doc_s:
+            time.sleep(self.latencia_doc_s)
+
+    def _verificar_falha(self):
+        with self.lock:
+            self._commits += 1
+            if self.falhar_commit_n is not None and self._commits == self.falhar_commit_n:
+                raise FalhaInjetada(f"Injected failure on commit {self._commits}")
+
+    def _aplicar(self, tipo, ref, dados, merge, travado=False):
+        with self.lock:
+            if tipo == 'delete':
+                self.docs.pop(ref.caminho, None)
+            elif tipo == 'update':
+                if ref.caminho not in self.docs:
+                    raise KeyError(f"No document to update: {ref.caminho}")
+                self.docs[ref.caminho].update(_resolver_valores(dados))
+            elif merge and ref.caminho in self.docs:
+                self.docs[ref.caminho].update(_resolver_valores(dados))
+            else:
+                self.docs[ref.caminho] = _resolver_valores(dados)
+
+    def trava_documento(self, caminho):
+        with self.lock:
+            return self._travas_documentos.setdefault(caminho, threading.Lock())
+
+    def collection(self, caminho):
+        return RefColecao(self, caminho)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        self._rpc('leituras')
+        with self.lock:
+            dados = [(ref, self.docs.get(ref.caminho)) for ref in refs]
+        for ref, d in dados:
+            if d is not None and field_paths is not None:
+                d = {k: v for k, v in d.items() if k in field_paths}
+            if d is not None:
+                self._documento_lido()
+            yield Snapshot(ref, d)
+
+    def batch(self):
+        return Lote(self)
+
+    def transaction(self, max_attempts=5):
+        return Transacao(self, max_attempts)
+
+    def listar(self, caminho_colecao):
+        prefixo = caminho_colecao + '/'
+        with self.lock:
+            return {c[len(prefixo):]: d for c, d in self.docs.items()
+                    if c.startswith(prefixo) and '/' not in c[len(prefixo):]}
+
+
+def modulo_firestore(db):
+    """Substituto do módulo firebase_admin.firestore (SERVER_TIMESTAMP, transactional)."""
+
+    def transactional(funcao):
+        def executar(transacao, *args, **kwargs):
+            # Serializa as transações por documento lido: equivalente ao controle otimista do
+            # Firestore sem retentativas, e transações em documentos diferentes correm em paralelo
+            try:
+                resultado = funcao(transacao, *args, **kwargs)
+                Lote.commit(transacao)
+            finally:
+                transacao.liberar()
+            return resultado
+        return executar
+
+    return SimpleNamespace(SERVER_TIMESTAMP=SERVER_TIMESTAMP, transactional=transactional, client=lambda: db)
+
+
+# --- GCS ---
+
+class FakeBlob:
+    def __init__(self, gcs, bucket, nome):
+        self.gcs = gcs
+        self.bucket = bucket
+        self.name = nome
+        self.md5_hash = None
+        self.crc32c = None
+        self.size = None
+
+    @property
+    def _chave(self):
+        return (self.bucket, self.name)
+
+    def reload(self):
+        self.gcs._rpc('metadados')
+        dados = self.gcs.objetos[self._chave]
+        self.md5_hash = base64.b64encode(hashlib.md5(dados).digest()).decode()
+        self.size = len(dados)
+
+    def open(self, modo='rb', chunk_size=None):
+        self.gcs._rpc('downloads')
+        return io.BytesIO(self.gcs.objetos[self._chave])
+
+    def download_as_bytes(self, start=None, end=None):
+        self.gcs._rpc('downloads')
+        dados = self.gcs.objetos[self._chave]
+        if start is not None or end is not None:
+            # `end` inclusivo, como no google-cloud-storage
+            return dados[start or 0:None if end is None else end + 1]
+        return dados
+
+    def upload_from_string(self, dados, content_type=None):
+        self.gcs._rpc('uploads')
+        self.gcs.objetos[self._chave] = bytes(dados)
+
+    def upload_from_filename(self, caminho, content_type=None):
+        with open(caminho, 'rb') as f:
+            self.upload_from_string(f.read(), content_type)
+
+    def delete(self):
+        self.gcs._rpc('deletes')
+        self.gcs.objetos.pop(self._chave, None)
+
+    def generate_signed_url(self, **kwargs):
+        return f"https://storage.invalid/{self.bucket}/{self.name}"
+
+
+class FakeBucket:
+    def __init__(self, gcs, nome):
+        self.gcs = gcs
+        self.name = nome
+
+    def blob(self, nome):
+        return FakeBlob(self.gcs, self.name, nome)
+
+    def list_blobs(self, prefix=''):
+        self.gcs._rpc('listagens')
+        return [FakeBlob(self.gcs, self.name, n) for (b, n) in list(self.gcs.objetos)
+                if b == self.name and n.startswith(prefix)]
+
+
+class FakeGCS:
+    def __init__(self, latencia_s=0.0):
+        self.latencia_s = latencia_s
+        self.objetos = {}
+        self.contadores = Contadores()
+
+    def _rpc(self, tipo):
+        self.contadores.somar(tipo)
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+
+    def bucket(self, nome):
+        return FakeBucket(self, nome)
+
+
+# --- Gemini ---
+
+class FakeGenAI:
+    """
+    Substituto do módulo google.generativeai. O índice (chamada com `prompt_sumario`) devolve os
+    documentos informados; análises devolvem um objeto por documento (ou um array, em lotes).
+    """
+
+    def __init__(self, prompt_sumario, documentos_indice, numero_processo=None, latencias_s=None):
+        self.prompt_sumario = prompt_sumario
+        self.documentos_indice = documentos_indice
+        self.numero_processo = numero_processo
+        self.latencias_s = latencias_s or {}
+        self.contadores = Contadores()
+
+    def configure(self, api_key=None):
+        pass
+
+    def GenerativeModel(self, nome):
+        return ModeloFake(self, nome)
+
+    def upload_file(self, path, mime_type=None):
+        self.contadores.somar('uploads_file_api')
+        return SimpleNamespace(name=f"files/{uuid.uuid4().hex[:8]}", state=SimpleNamespace(name="ACTIVE"))
+
+    def get_file(self, nome):
+        return SimpleNamespace(name=nome, state=SimpleNamespace(name="ACTIVE"))
+
+    def delete_file(self, nome):
+        pass
+
+
+class ModeloFake:
+    def __init__(self, genai, nome):
+        self.genai = genai
+        self.nome = nome
+
+    def generate_content(self, conteudo, generation_config=None):
+        genai = self.genai
+        genai.contadores.somar(f"chamadas:{self.nome}")
+        time.sleep(genai.latencias_s.get(self.nome, 0.0))
+        if conteudo and conteudo[0] == genai.prompt_sumario:
+            resposta = {'numero_processo': genai.numero_processo, 'documentos': genai.documentos_indice}
+        else:
+            ids = [p.split('=', 1)[1] for p in conteudo if isinstance(p, str) and p.startswith('DOCUMENTO idDocumento=')]
+            if ids:
+                resposta = [self._analise(doc_id) for doc_id in ids]
+            else:
+                resposta = self._analise(None)
+        texto = json.dumps(resposta, ensure_ascii=False)
+        return SimpleNamespace(text=texto, usage_metadata=SimpleNamespace(total_token_count=len(texto) // 4))
+
+    def _analise(self, doc_id):
+        return {
+            'idDocumento': doc_id,
+            'tipoDocumentoGeral': 'Documento',
+            'dadosRelevantesParaLaudo': {'ResumoGeralConteudoArquivo': 'Resumo sintético.'},
+            'documentosMedicosAnexados': [],
+            'observacoes': f'analisado por {self.nome}',
+        }
+
+
+# --- Consolidação ---
+
+class FakeConsolidacao:
+    """
+    Serviço de consolidação local: responde 202 e guarda os process_ids recebidos.
+    As `falhas_iniciais` primeiras requisições recebem 503 (não são guardadas).
+    """
+
+    def __init__(self, status=202, falhas_iniciais=0, latencia_s=0.0):
+        self.status = status
+        self.falhas_restantes = falhas_iniciais
+        self.latencia_s = latencia_s
+        self.recebidos = []
+        self.requisicoes = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/consolidar-batch"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                corpo = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if fake.latencia_s:
+                    time.sleep(fake.latencia_s)
+                with fake.lock:
+                    fake.requisicoes += 1
+                    if fake.falhas_restantes > 0:
+                        fake.falhas_restantes -= 1
+                        status = 503
+                    else:
+                        status = fake.status
+                        fake.recebidos.append(corpo.get('process_ids', []))
+                resposta = b'{}'
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(resposta)))
+                self.end_headers()
+                self.wfile.write(resposta)
+
+        return Handler
@@ -0,0 +1,17 @@
+from latencia_stubs import simular_import, simular_cliente
+
+simular_import()
+_app = None
+
+
+def get_app():
+    if _app is None:
+        raise ValueError("The default Firebase app does not exist.")
+    return _app
+
+
+def initialize_app():
+    global _app
+    simular_cliente()
+    _app = object()
+    return _app
@@ -0,0 +1,36 @@
+import uuid
+
+from latencia_stubs import simular_import, simular_cliente
+
+simular_import()
+SERVER_TIMESTAMP = object()
+
+
+def transactional(funcao):
+    return funcao
+
+
+class _Documento:
+    def __init__(self, doc_id=None):
+        self.id = doc_id or uuid.uuid4().hex[:20]
+
+    def set(self, dados, merge=False):
+        pass
+
+    def update(self, dados):
+        pass
+
+
+class _Colecao:
+    def document(self, doc_id=None):
+        return _Documento(doc_id)
+
+
+class _Cliente:
+    def collection(self, caminho):
+        return _Colecao()
+
+
+def client():
+    simular_cliente()
+    return _Cliente()
@@ -0,0 +1,2 @@
+def http(funcao):
+    return funcao
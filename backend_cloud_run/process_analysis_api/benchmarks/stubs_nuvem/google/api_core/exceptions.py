@@ -0,0 +1,26 @@
+class AlreadyExists(Exception):
+    code = 409
+
+
+class NotFound(Exception):
+    code = 404
+
+
+class Aborted(Exception):
+    code = 409
+
+
+class ResourceExhausted(Exception):
+    code = 429
+
+
+class InternalServerError(Exception):
+    code = 500
+
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+class DeadlineExceeded(Exception):
+    code = 504
@@ -0,0 +1,11 @@
+from latencia_stubs import simular_import, simular_cliente
+
+simular_import()
+
+
+class Client:
+    def __init__(self):
+        simular_cliente()
+
+    def setup_logging(self):
+        pass
@@ -0,0 +1,24 @@
+from latencia_stubs import simular_import, simular_cliente
+
+simular_import()
+
+
+class _Blob:
+    def __init__(self, nome):
+        self.nome = nome
+
+    def generate_signed_url(self, **kwargs):
+        return f"https://storage.invalid/{self.nome}?assinatura=stub"
+
+
+class _Bucket:
+    def blob(self, nome):
+        return _Blob(nome)
+
+
+class Client:
+    def __init__(self):
+        simular_cliente()
+
+    def bucket(self, nome):
+        return _Bucket()
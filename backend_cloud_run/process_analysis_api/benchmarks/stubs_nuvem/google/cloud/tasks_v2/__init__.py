@@ -0,0 +1,23 @@
+import enum
+
+from latencia_stubs import simular_import, simular_cliente
+
+simular_import()
+
+
+class HttpMethod(enum.Enum):
+    POST = 1
+
+
+class CloudTasksClient:
+    def __init__(self):
+        simular_cliente()
+
+    def queue_path(self, projeto, regiao, fila):
+        return f"projects/{projeto}/locations/{regiao}/queues/{fila}"
+
+    def task_path(self, projeto, regiao, fila, nome):
+        return f"{self.queue_path(projeto, regiao, fila)}/tasks/{nome}"
+
+    def create_task(self, request):
+        return type("Tarefa", (), {"name": request["task"].get("name", "stub")})()
@@ -0,0 +1,12 @@
+from latencia_stubs import simular_import
+
+simular_import()
+
+
+def configure(api_key=None):
+    pass
+
+
+class GenerativeModel:
+    def __init__(self, nome):
+        self.nome = nome
@@ -0,0 +1,15 @@
+"""
+Latências simuladas dos stubs de bibliotecas GCP usados por bench_startup.
+STUB_IMPORT_MS: custo de importar uma biblioteca pesada; STUB_CLIENTE_MS: custo de criar um cliente
+(descoberta de credenciais, canal gRPC...).
+"""
+import os
+import time
+
+
+def simular_import():
+    time.sleep(int(os.environ.get("STUB_IMPORT_MS", "150")) / 1000)
+
+
+def simular_cliente():
+    time.sleep(int(os.environ.get("STUB_CLIENTE_MS", "200")) / 1000)
@@ -0,0 +1,75 @@
+"""Geração de PDFs sintéticos no formato de autos do TRF/TRT para os benchmarks."""
+import random
+
+import fitz  # PyMuPDF
+
+PARAGRAFO = (
+    "Trata-se de documento juntado aos autos pela parte autora. O periciando relata dor lombar "
+    "crônica com irradiação para membro inferior esquerdo, em acompanhamento ortopédico. "
+)
+
+
+def _imagem_timbre(rng, lado=256):
+    """Imagem JPEG com ruído (como um timbre digitalizado), repetida em todas as páginas."""
+    amostras = bytes(rng.getrandbits(8) for _ in range(lado * lado * 3))
+    pix = fitz.Pixmap(fitz.csRGB, lado, lado, amostras, False)
+    return pix.tobytes("jpeg")
+
+
+def digitalizar(doc, dpi=150, paginas=None):
+    """
+    PDF só de imagens (como um escaneamento) a partir de `doc`: cada página vira um JPEG em cinza.
+    Com `paginas`, só essas viram imagem e as demais são copiadas com a camada de texto.
+    """
+    saida = fitz.open()
+    for page in doc:
+        if paginas is not None and page.number not in paginas:
+            saida.insert_pdf(doc, from_page=page.number, to_page=page.number)
+            continue
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        nova = saida.new_page(width=page.rect.width, height=page.rect.height)
+        nova.insert_image(nova.rect, stream=pix.tobytes("jpeg", jpg_quality=75))
+    return saida
+
+
+def gerar_pdf_sintetico(n_paginas, estilo="trf", paginas_por_doc=(1, 6), seed=42, com_timbre=False,
+                        digitalizado=False, fracao_digitalizada=0.0):
+    """
+    Gera um PDF com `n_paginas` páginas agrupadas em documentos de tamanho aleatório.
+    estilo="trf": rodapé "Num. NNNNNNNNN - Pág. X"; estilo="trt": rodapé terminando em "- hash7".
+    com_timbre=True repete uma mesma imagem (um único objeto no PDF) no topo de cada página.
+    digitalizado=True entrega as páginas como imagens, sem camada de texto; `fracao_digitalizada`
+    faz isso só com uma fração das páginas, sorteadas (exames e laudos escaneados juntados aos autos).
+    Retorna (pdf_bytes, documentos), onde documentos é a lista [(id, [paginas])] esperada.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    timbre = _imagem_timbre(rng) if com_timbre else None
+    xref_timbre = 0
+    documentos = []
+    pagina = 0
+    while pagina < n_paginas:
+        tamanho = min(rng.randint(*paginas_por_doc), n_paginas - pagina)
+        if estilo == "trt":
+            doc_id = f"{rng.getrandbits(28):07x}"
+        else:
+            doc_id = str(rng.randint(100_000_000, 999_999_999))
+        paginas = []
+        for pag_doc in range(tamanho):
+            page = doc.new_page()
+            if timbre is not None:
+                xref_timbre = page.insert_image(fitz.Rect(72, 20, 136, 68), stream=timbre, xref=xref_timbre)
+            page.insert_textbox(fitz.Rect(72, 72, 520, 700), PARAGRAFO * 6, fontsize=10)
+            if estilo == "trt":
+                rodape = f"Assinado eletronicamente por: FULANO DE TAL - {doc_id}"
+            else:
+                rodape = f"Num. {doc_id} - Pág. {pag_doc + 1}"
+            page.insert_text((72, 800), rodape, fontsize=8)
+            paginas.append(pagina)
+            pagina += 1
+        documentos.append((doc_id, paginas))
+    if digitalizado:
+        doc = digitalizar(doc)
+    elif fracao_digitalizada > 0:
+        doc = digitalizar(doc, paginas=set(rng.sample(range(pagina), round(pagina * fracao_digitalizada))))
+    return doc.tobytes(), documentos
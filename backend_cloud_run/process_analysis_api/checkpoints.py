@@ -0,0 +1,59 @@
+import json
+
+# Etapas com checkpoint, na ordem do pipeline
+ETAPA_SUMARIO = 'sumario'
+ETAPA_MAPA = 'mapa_paginas'
+ETAPA_ANALISE = 'analise'
+
+
+class JobCheckpoints:
+    """
+    Checkpoints por etapa de um job, em analises_processos/{job_id}/checkpoints/{etapa}.
+    Se o Cloud Tasks reentregar o job (crash/timeout do worker), o processamento retoma
+    da primeira etapa sem checkpoint e, no Step 4, do primeiro sub-documento não concluído.
+    Os valores são gravados como JSON para não esbarrar em limitações de tipos do Firestore
+    (ex.: mapas com listas de listas).
+    Com um `escritor` (EscritorFirestore), as gravações entram no mesmo lote das demais
+    escritas do job, de modo que resultados e checkpoint são gravados juntos.
+    """
+
+    def __init__(self, db, job_id, escritor=None):
+        self.colecao = db.collection(f"analises_processos/{job_id}/checkpoints")
+        self.escritor = escritor
+        self.etapas = {}
+        self._ultimo_analise = None
+
+    def carregar(self):
+        """Lê todos os checkpoints do job numa única consulta. Retorna as etapas encontradas."""
+        for snapshot in self.colecao.stream():
+            self.etapas[snapshot.id] = json.loads(snapshot.to_dict()['valor_json'])
+        if self.escritor:
+            self.escritor.contar_leituras()
+        return sorted(self.etapas)
+
+    def get(self, etapa):
+        return self.etapas.get(etapa)
+
+    def salvar(self, etapa, valor):
+        valor_json = json.dumps(valor, ensure_ascii=False)
+        if etapa == ETAPA_ANALISE:
+            # Evita regravar o mesmo estado a cada iteração do loop de análise
+            if valor_json == self._ultimo_analise:
+                return
+            self._ultimo_analise = valor_json
+        self.etapas[etapa] = valor
+        ref = self.colecao.document(etapa)
+        if self.escritor:
+            self.escritor.set(ref, {'valor_json': valor_json})
+        else:
+            ref.set({'valor_json': valor_json})
+
+    def limpar(self):
+        """Remove os checkpoints ao final do job (sucesso ou erro terminal)."""
+        for etapa in list(self.etapas):
+            ref = self.colecao.document(etapa)
+            if self.escritor:
+                self.escritor.delete(ref)
+            else:
+                ref.delete()
+        self.etapas = {}
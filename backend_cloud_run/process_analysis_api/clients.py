@@ -0,0 +1,87 @@
+import os
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger()
+
+# Tempo de criação de cada cliente (perfil de cold start da instância)
+tempos_inicializacao = {}
+
+
+class Preguicoso:
+    """
+    Cliente criado por `fabrica` no primeiro acesso a um atributo e reaproveitado por todas as
+    requisições da instância. Assim cada rota só paga a inicialização do que usa
+    (ex.: /api/upload-url nunca importa o genai nem cria o cliente do Cloud Tasks).
+    """
+
+    def __init__(self, nome, fabrica):
+        self._nome = nome
+        self._fabrica = fabrica
+        self._objeto = None
+        self._lock = threading.Lock()
+
+    def obter(self):
+        objeto = self._objeto
+        if objeto is None:
+            with self._lock:
+                if self._objeto is None:
+                    t0 = time.perf_counter()
+                    self._objeto = self._fabrica()
+                    tempos_inicializacao[self._nome] = round(time.perf_counter() - t0, 3)
+                    logger.info(f"Client {self._nome} initialized in {tempos_inicializacao[self._nome]}s")
+                objeto = self._objeto
+        return objeto
+
+    @property
+    def inicializado(self):
+        return self._objeto is not None
+
+    def substituir(self, objeto):
+        """Injeta um objeto pronto (fakes locais em benchmarks)."""
+        with self._lock:
+            self._objeto = objeto
+
+    def __getattr__(self, atributo):
+        return getattr(self.obter(), atributo)
+
+
+def criar_firestore():
+    import firebase_admin
+    from firebase_admin import firestore
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+    return firestore.client()
+
+
+def criar_storage():
+    from google.cloud import storage as gcs
+    return gcs.Client()
+
+
+def criar_tasks():
+    from google.cloud import tasks_v2
+    return tasks_v2.CloudTasksClient()
+
+
+def criar_genai():
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+    return genai
+
+
+def criar_logging():
+    import google.cloud.logging
+    cliente = google.cloud.logging.Client()
+    cliente.setup_logging()
+    logging.getLogger().setLevel(logging.INFO)
+    return cliente
+
+
+def modulo(nome):
+    """Fábrica que só importa o módulo no primeiro uso (ex.: enums do tasks_v2)."""
+    return lambda: importlib.import_module(nome)
@@ -0,0 +1,140 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import Future
+
+import requests
+
+from storage_io import sessao_http
+
+logger = logging.getLogger()
+
+# Janela de agregação: o primeiro parent_id abre a janela; o lote sai quando ela fecha ou enche
+CONSOLIDACAO_JANELA_S = float(os.environ.get("CONSOLIDACAO_JANELA_S", "3"))
+CONSOLIDACAO_MAX_IDS = int(os.environ.get("CONSOLIDACAO_MAX_IDS", "50"))
+CONSOLIDACAO_MAX_TENTATIVAS = int(os.environ.get("CONSOLIDACAO_MAX_TENTATIVAS", "4"))
+CONSOLIDACAO_TIMEOUT_S = 10  # o serviço responde 202 imediatamente
+# Backoff entre tentativas: base * 2^tentativa, limitado a BACKOFF_MAX_S, com jitter de 0,5x a 1,5x
+BACKOFF_BASE_S = 0.5
+BACKOFF_MAX_S = 30
+JITTER_MAX = 1.5
+
+
+def espera_backoff(tentativa, fator_jitter):
+    return min(BACKOFF_MAX_S, (2 ** tentativa) * BACKOFF_BASE_S) * fator_jitter
+
+
+def espera_maxima(janela_s=CONSOLIDACAO_JANELA_S, max_tentativas=CONSOLIDACAO_MAX_TENTATIVAS):
+    """
+    Pior caso entre adicionar um ID e o lote dele ser resolvido: a janela, todas as tentativas
+    esgotando o timeout (de conexão e de leitura, que o requests aplica em separado) e os
+    backoffs entre elas com o jitter máximo.
+    """
+    tentativas = CONSOLIDACAO_TIMEOUT_S * 2 * max_tentativas
+    backoffs = sum(espera_backoff(t, JITTER_MAX) for t in range(max_tentativas - 1))
+    return janela_s + tentativas + backoffs
+
+
+# Quanto quem finalizou um job espera o envio do seu lote (mantém a requisição, e a CPU, ativa)
+CONSOLIDACAO_ESPERA_S = espera_maxima()
+
+_STATUS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+
+
+class ConsolidacaoFalhou(Exception):
+    pass
+
+
+class AgregadorConsolidacao:
+    """
+    Junta os parent_id de jobs finalizados na instância e dispara a consolidação em lote
+    (`{"process_ids": [...]}`) pela sessão HTTP compartilhada, com retentativas e backoff.
+    `adicionar` devolve um Future resolvido quando o lote que contém o ID é aceito (ou falha de vez);
+    o lote sai quando a janela fecha ou quando chega a `max_ids`. IDs repetidos na mesma janela
+    são enviados uma vez. No Cloud Run, quem adiciona deve esperar o Future: a thread do envio
+    só tem CPU garantida enquanto alguma requisição está ativa.
+    """
+
+    def __init__(self, url, janela_s=CONSOLIDACAO_JANELA_S, max_ids=CONSOLIDACAO_MAX_IDS,
+                 max_tentativas=CONSOLIDACAO_MAX_TENTATIVAS, sessao=None, dormir=time.sleep):
+        self.url = url
+        self.janela_s = janela_s
+        self.max_ids = max_ids
+        self.max_tentativas = max_tentativas
+        self._sessao = sessao
+        self.dormir = dormir
+        self._lock = threading.Lock()
+        self._pendentes = {}  # parent_id -> Future
+        self._timer = None
+        self.lotes_enviados = 0
+        self.ids_enviados = 0
+
+    @property
+    def sessao(self):
+        if self._sessao is None:
+            self._sessao = sessao_http()
+        return self._sessao
+
+    def adicionar(self, parent_id):
+        with self._lock:
+            futuro = self._pendentes.get(parent_id)
+            if futuro is None:
+                futuro = self._pendentes[parent_id] = Future()
+            if len(self._pendentes) >= self.max_ids:
+                lote = self._retirar_lote()
+            else:
+                lote = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.janela_s, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if lote:
+            self._enviar(lote)
+        return futuro
+
+    def flush(self):
+        """Envia já o que estiver pendente (fim da janela, ou encerramento da instância)."""
+        with self._lock:
+            lote = self._retirar_lote()
+        if lote:
+            self._enviar(lote)
+
+    def _retirar_lote(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        lote, self._pendentes = self._pendentes, {}
+        return lote
+
+    def _enviar(self, lote):
+        ids = list(lote)
+        try:
+            self._post(ids)
+        except Exception as e:
+            for futuro in lote.values():
+                futuro.set_exception(e)
+            return
+        self.lotes_enviados += 1
+        self.ids_enviados += len(ids)
+        for futuro in lote.values():
+            futuro.set_result(len(ids))
+
+    def _post(self, ids):
+        logger.info(f"Triggering consolidation for {len(ids)} processes: {self.url}")
+        for tentativa in range(self.max_tentativas):
+            try:
+                resp = self.sessao.post(self.url, json={"process_ids": ids}, timeout=CONSOLIDACAO_TIMEOUT_S)
+                if resp.status_code not in _STATUS_TRANSITORIOS:
+                    if resp.status_code != 202:
+                        logger.warning(f"Consolidation trigger returned unexpected status: {resp.status_code} - {resp.text}")
+                    return resp.status_code
+                erro = f"HTTP {resp.status_code}"
+            except requests.RequestException as e:
+                erro = str(e)
+            if tentativa + 1 < self.max_tentativas:
+                espera = espera_backoff(tentativa, 0.5 + random.random() * (JITTER_MAX - 0.5))
+                logger.warning(f"Consolidation trigger failed ({erro}). Retrying in {espera:.1f}s")
+                self.dormir(espera)
+        raise ConsolidacaoFalhou(f"Consolidation trigger failed after {self.max_tentativas} attempts: {erro}")
@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Documentos por chamada get_all (chaves determinísticas) e valores por consulta `in` (limite do Firestore: 30)
+DEDUP_GET_ALL_MAX = int(os.environ.get("DEDUP_GET_ALL_MAX", "100"))
+DEDUP_IN_MAX = 30
+# Processos (parent_id) com IDs já analisados mantidos em memória pela instância
+DEDUP_CACHE_MAX_PROCESSOS = int(os.environ.get("DEDUP_CACHE_MAX_PROCESSOS", "256"))
+
+CAMPOS_ID = ['idDocumento', 'id_documento']
+
+
+def safe_id(base_id):
+    """ID de documento do Firestore a partir do ID do sumário/Gemini (base das chaves em documentos_analisados)."""
+    return re.sub(r'[^a-zA-Z0-9_\-]', '_', str(base_id))
+
+
+def _em_blocos(itens, tamanho):
+    for i in range(0, len(itens), tamanho):
+        yield itens[i:i + tamanho]
+
+
+class CacheProcessados:
+    """
+    IDs já analisados por parent_id, mantidos enquanto a instância viver (LRU por processo).
+    Só guarda positivos: um documento analisado não deixa de existir, então a entrada não
+    fica obsoleta com gravações de outros workers. Thread-safe.
+    """
+
+    def __init__(self, max_processos=DEDUP_CACHE_MAX_PROCESSOS):
+        self.max_processos = max_processos
+        self._processos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def conhecidos(self, parent_id):
+        with self._lock:
+            ids = self._processos.get(parent_id)
+            if ids is None:
+                return set()
+            self._processos.move_to_end(parent_id)
+            return set(ids)
+
+    def adicionar(self, parent_id, ids):
+        ids = {str(i) for i in ids if i}
+        if not ids:
+            return
+        with self._lock:
+            self._processos.setdefault(parent_id, set()).update(ids)
+            self._processos.move_to_end(parent_id)
+            while len(self._processos) > self.max_processos:
+                self._processos.popitem(last=False)
+
+
+class Deduplicador:
+    """
+    Quais IDs candidatos (id_documento das tasks do sumário) já têm análise em
+    analises_processos/{parent_id}/documentos_analisados, sem ler a subcoleção inteira:
+    1. get_all nas chaves determinísticas safe_id(candidato), em blocos de DEDUP_GET_ALL_MAX;
+    2. para os não encontrados, consultas `id_documento in [...]` (documentos gravados com a chave
+       do idDocumento devolvido pelo Gemini, quando ele difere do ID do sumário).
+    Candidatos já conhecidos pelo cache da instância não geram leituras.
+    """
+
+    def __init__(self, db, parent_id, cache):
+        self.db = db
+        self.parent_id = parent_id
+        self.cache = cache
+        self.colecao = db.collection(f"analises_processos/{parent_id}/documentos_analisados")
+        self.rpcs = 0
+        self.acertos_cache = 0
+
+    def ja_processados(self, candidatos):
+        """Retorna o conjunto (str) dos candidatos que já foram analisados."""
+        unicos = {}
+        for c in candidatos:
+            if c and str(c) not in unicos:
+                unicos[str(c)] = c
+        conhecidos = self.cache.conhecidos(self.parent_id)
+        encontrados = set(unicos) & conhecidos
+        self.acertos_cache = len(encontrados)
+        pendentes = [c for c in unicos if c not in encontrados]
+
+        por_chave = {}
+        for c in pendentes:
+            por_chave.setdefault(safe_id(c), []).append(c)
+        for chaves in _em_blocos(list(por_chave), DEDUP_GET_ALL_MAX):
+            refs = [self.colecao.document(k) for k in chaves]
+            snapshots = self.db.get_all(refs, field_paths=CAMPOS_ID)
+            self.rpcs += 1
+            for snapshot in snapshots:
+                if snapshot.exists:
+                    # A chave sanitizada pode colidir ("12.3" e "12_3"): confirma pelos campos
+                    ids = self._registrar(snapshot.to_dict())
+                    encontrados.update(ids & set(por_chave.get(snapshot.id, [])))
+
+        restantes = [unicos[c] for c in pendentes if c not in encontrados]
+        for valores in _em_blocos(restantes, DEDUP_IN_MAX):
+            consulta = self.colecao.where('id_documento', 'in', valores).select(CAMPOS_ID)
+            self.rpcs += 1
+            for snapshot in consulta.stream():
+                encontrados.update(self._registrar(snapshot.to_dict()) & set(unicos))
+        return encontrados
+
+    def _registrar(self, dados):
+        ids = {str(dados.get(campo)) for campo in CAMPOS_ID if dados.get(campo)}
+        self.cache.adicionar(self.parent_id, ids)
+        return ids
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger()
+
+# Operações por commit (o limite do Firestore é 500 por WriteBatch)
+FIRESTORE_BATCH_MAX_OPS = int(os.environ.get("FIRESTORE_BATCH_MAX_OPS", "100"))
+# Progresso só é publicado a cada N pontos percentuais ou a cada X segundos
+PROGRESSO_PASSO = int(os.environ.get("PROGRESSO_PASSO", "5"))
+PROGRESSO_INTERVALO_S = float(os.environ.get("PROGRESSO_INTERVALO_S", "5"))
+
+
+class EscritorFirestore:
+    """
+    Buffer de escrita de um job: acumula set/update/delete e grava tudo num único
+    WriteBatch por commit, em vez de uma chamada por documento.
+    O commit acontece quando o lote enche, quando o progresso deve ser publicado
+    (throttle por passo/intervalo), numa escrita `imediato=True` ou em flush() explícito.
+    Se o commit do lote falhar (um documento recusado derruba o WriteBatch inteiro), as
+    operações são regravadas uma a uma: as que têm `rotulo` e falham de novo vão para
+    `rejeitados()` e o resto segue; falha numa operação sem rótulo é relançada.
+    Também conta as RPCs do job (commits e leituras) para o relatório final.
+    Usado apenas pela thread principal do job.
+    """
+
+    def __init__(self, db, max_ops=FIRESTORE_BATCH_MAX_OPS,
+                 passo_progresso=PROGRESSO_PASSO, intervalo_progresso_s=PROGRESSO_INTERVALO_S):
+        self.db = db
+        self.max_ops = max_ops
+        self.passo_progresso = passo_progresso
+        self.intervalo_progresso_s = intervalo_progresso_s
+        self._ops = []
+        self._rejeitados = []
+        self._ultimo_progresso = None
+        self._ultimo_progresso_em = 0.0
+        self.commits = 0
+        self.documentos_escritos = 0
+        self.leituras = 0
+
+    def set(self, ref, dados, merge=False, imediato=False, rotulo=None):
+        """`rotulo` identifica a escrita em `rejeitados()` se o Firestore recusar o documento."""
+        self._adicionar(('set', ref, dados, merge, rotulo), imediato)
+
+    def update(self, ref, dados, imediato=False):
+        self._adicionar(('update', ref, dados, None, None), imediato)
+
+    def delete(self, ref, imediato=False):
+        self._adicionar(('delete', ref, None, None, None), imediato)
+
+    def contar_leituras(self, n=1):
+        """Registra RPCs de leitura feitas diretamente pelo job (get/stream)."""
+        self.leituras += n
+
+    def progresso(self, refs, valor):
+        """Enfileira o progresso nos documentos `refs` e faz commit se o throttle permitir."""
+        agora = time.monotonic()
+        if (self._ultimo_progresso is not None and valor < 100
+                and valor - self._ultimo_progresso < self.passo_progresso
+                and agora - self._ultimo_progresso_em < self.intervalo_progresso_s):
+            return False
+        for ref in refs:
+            self.update(ref, {'progresso': valor})
+        self._ultimo_progresso = valor
+        self._ultimo_progresso_em = agora
+        self.flush()
+        return True
+
+    def _adicionar(self, op, imediato):
+        self._ops.append(op)
+        if imediato or len(self._ops) >= self.max_ops:
+            self.flush()
+
+    @staticmethod
+    def _aplicar(batch, op):
+        tipo, ref, dados, merge, _ = op
+        if tipo == 'set':
+            batch.set(ref, dados, merge=merge)
+        elif tipo == 'update':
+            batch.update(ref, dados)
+        else:
+            batch.delete(ref)
+
+    def flush(self):
+        if not self._ops:
+            return
+        ops, self._ops = self._ops, []
+        batch = self.db.batch()
+        for op in ops:
+            self._aplicar(batch, op)
+        try:
+            batch.commit()
+        except Exception as e:
+            logger.warning(f"Batch commit of {len(ops)} writes failed ({e}); writing them one by one")
+            self._gravar_individualmente(ops)
+            return
+        self.commits += 1
+        self.documentos_escritos += len(ops)
+
+    def _gravar_individualmente(self, ops):
+        erro = None
+        for op in ops:
+            batch = self.db.batch()
+            self._aplicar(batch, op)
+            self.commits += 1
+            try:
+                batch.commit()
+                self.documentos_escritos += 1
+            except Exception as e:
+                rotulo = op[4]
+                if rotulo is None:
+                    erro = erro or e
+                else:
+                    logger.error(f"Firestore rejected write {rotulo} ({op[1].id}): {e}")
+                    self._rejeitados.append(rotulo)
+        if erro is not None:
+            raise erro
+
+    def rejeitados(self):
+        """Rótulos das escritas recusadas desde a última chamada (e os esquece)."""
+        rejeitados, self._rejeitados = self._rejeitados, []
+        return rejeitados
+
+    def resumo(self):
+        return {
+            'commits': self.commits,
+            'documentos_escritos': self.documentos_escritos,
+            'leituras': self.leituras,
+        }
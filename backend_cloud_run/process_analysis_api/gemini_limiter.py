@@ -0,0 +1,187 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger()
+
+# Cotas por modelo (0 = sem limite do lado do cliente). Ajustar ao tier do projeto.
+GEMINI_PRO_RPM = int(os.environ.get("GEMINI_PRO_RPM", "150"))
+GEMINI_PRO_TPM = int(os.environ.get("GEMINI_PRO_TPM", "2000000"))
+GEMINI_FLASH_RPM = int(os.environ.get("GEMINI_FLASH_RPM", "1000"))
+GEMINI_FLASH_TPM = int(os.environ.get("GEMINI_FLASH_TPM", "4000000"))
+# Retentativas de erros transitórios (429/5xx) com backoff exponencial e jitter
+GEMINI_MAX_TENTATIVAS = int(os.environ.get("GEMINI_MAX_TENTATIVAS", "6"))
+GEMINI_BACKOFF_BASE_S = float(os.environ.get("GEMINI_BACKOFF_BASE_S", "2"))
+GEMINI_BACKOFF_MAX_S = float(os.environ.get("GEMINI_BACKOFF_MAX_S", "60"))
+
+JANELA_S = 60.0
+# Códigos HTTP que indicam throttling/sobrecarga (reduzem a concorrência) ou falha transitória
+CODIGOS_THROTTLE = {429, 503}
+CODIGOS_TRANSITORIOS = {429, 500, 502, 503, 504}
+
+
+def codigo_erro(e):
+    """Código HTTP de uma exceção do google.api_core (ou equivalente), se houver."""
+    codigo = getattr(e, 'code', None)
+    codigo = getattr(codigo, 'value', codigo)  # HTTPStatus / grpc.StatusCode
+    return codigo if isinstance(codigo, int) else None
+
+
+class LimitadorModelo:
+    """
+    Limitador do lado do cliente para um modelo, compartilhado por todas as threads da instância.
+    - Janela deslizante de 60s com requisições e tokens (RPM/TPM);
+    - Concorrência controlada por AIMD: +1/limite a cada sucesso, metade em 429/503
+      (no máximo uma redução por intervalo de backoff base, para uma rajada de erros não zerar o limite);
+    - Retentativas de erros transitórios com backoff exponencial "full jitter".
+    Métricas separam o tempo esperando (fila do limitador + backoff) do tempo dentro do modelo.
+    """
+
+    def __init__(self, nome, rpm=0, tpm=0, concorrencia_max=8, concorrencia_min=1,
+                 max_tentativas=GEMINI_MAX_TENTATIVAS, backoff_base_s=GEMINI_BACKOFF_BASE_S,
+                 backoff_max_s=GEMINI_BACKOFF_MAX_S, relogio=time.monotonic, dormir=time.sleep):
+        self.nome = nome
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concorrencia_max = concorrencia_max
+        self.concorrencia_min = concorrencia_min
+        self.limite = float(concorrencia_max)
+        self.max_tentativas = max_tentativas
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.relogio = relogio
+        self.dormir = dormir
+        self._cond = threading.Condition()
+        self._janela = deque()  # (instante, tokens)
+        self._tokens_janela = 0
+        self._em_voo = 0
+        self._ultima_reducao = float('-inf')
+        self.chamadas = 0
+        self.tentativas = 0
+        self.throttles = 0
+        self.falhas = 0
+        self.espera_s = 0.0
+        self.modelo_s = 0.0
+
+    def _limpar_janela(self, agora):
+        while self._janela and agora - self._janela[0][0] >= JANELA_S:
+            _, tokens = self._janela.popleft()
+            self._tokens_janela -= tokens
+
+    def _tempo_ate_liberar(self, agora, tokens):
+        """0 se a requisição cabe agora; senão, segundos até a janela abrir espaço."""
+        self._limpar_janela(agora)
+        espera = 0.0
+        if self.rpm and len(self._janela) >= self.rpm:
+            espera = max(espera, self._janela[0][0] + JANELA_S - agora)
+        if self.tpm and self._janela and self._tokens_janela + tokens > self.tpm:
+            # Libera as entradas mais antigas até caber
+            sobra = self._tokens_janela + tokens - self.tpm
+            for instante, t in self._janela:
+                sobra -= t
+                if sobra <= 0:
+                    espera = max(espera, instante + JANELA_S - agora)
+                    break
+        return espera
+
+    def _adquirir(self, tokens):
+        """Bloqueia até haver vaga de concorrência e cota na janela. Retorna a entrada da janela."""
+        with self._cond:
+            while True:
+                agora = self.relogio()
+                if self._em_voo < max(self.concorrencia_min, int(self.limite)):
+                    espera = self._tempo_ate_liberar(agora, tokens)
+                    if espera <= 0:
+                        entrada = [agora, tokens]
+                        self._janela.append(entrada)
+                        self._tokens_janela += tokens
+                        self._em_voo += 1
+                        return entrada
+                    self._cond.wait(timeout=espera)
+                else:
+                    self._cond.wait(timeout=1.0)
+
+    def _liberar(self, entrada, tokens_reais, sucesso, throttle):
+        with self._cond:
+            self._em_voo -= 1
+            if tokens_reais is not None and entrada in self._janela:
+                self._tokens_janela += tokens_reais - entrada[1]
+                entrada[1] = tokens_reais
+            agora = self.relogio()
+            if throttle:
+                self.throttles += 1
+                if agora - self._ultima_reducao >= self.backoff_base_s:
+                    self.limite = max(self.concorrencia_min, self.limite / 2)
+                    self._ultima_reducao = agora
+                    logger.warning(f"{self.nome}: throttled, concurrency limit reduced to {int(self.limite)}")
+            elif sucesso:
+                self.limite = min(self.concorrencia_max, self.limite + 1 / self.limite)
+            self._cond.notify_all()
+
+    def backoff(self, tentativa):
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** tentativa)))
+
+    def chamar(self, funcao, tokens_estimados=0, tokens_da_resposta=None):
+        """
+        Executa `funcao()` respeitando cotas e concorrência, com retentativas.
+        `tokens_da_resposta(resposta)` devolve os tokens reais para corrigir a janela (ex.: usage_metadata).
+        Erros não transitórios, ou transitórios após `max_tentativas`, são relançados.
+        """
+        with self._cond:
+            self.chamadas += 1
+        for tentativa in range(self.max_tentativas):
+            t0 = self.relogio()
+            entrada = self._adquirir(tokens_estimados)
+            t1 = self.relogio()
+            resposta, erro, codigo = None, None, None
+            try:
+                resposta = funcao()
+            except Exception as e:
+                erro, codigo = e, codigo_erro(e)
+            t2 = self.relogio()
+
+            tokens_reais = None
+            if erro is None and tokens_da_resposta:
+                try:
+                    tokens_reais = tokens_da_resposta(resposta)
+                except Exception:
+                    pass
+            self._liberar(entrada, tokens_reais, erro is None, codigo in CODIGOS_THROTTLE)
+            with self._cond:
+                self.tentativas += 1
+                self.espera_s += t1 - t0
+                self.modelo_s += t2 - t1
+
+            if erro is None:
+                return resposta
+            if codigo not in CODIGOS_TRANSITORIOS or tentativa + 1 >= self.max_tentativas:
+                with self._cond:
+                    self.falhas += 1
+                raise erro
+            pausa = self.backoff(tentativa)
+            logger.warning(f"{self.nome}: transient error {codigo} ({erro}). Retrying in {pausa:.1f}s (attempt {tentativa + 2})")
+            self.dormir(pausa)
+            with self._cond:
+                self.espera_s += pausa
+
+    def resumo(self):
+        with self._cond:
+            return {
+                'chamadas': self.chamadas,
+                'tentativas': self.tentativas,
+                'throttles': self.throttles,
+                'falhas': self.falhas,
+                'espera_s': round(self.espera_s, 2),
+                'modelo_s': round(self.modelo_s, 2),
+                'limite_concorrencia': int(self.limite),
+            }
+
+
+def diferenca_resumos(antes, depois):
+    """Delta entre dois `resumo()` do mesmo limitador (o limite de concorrência é o atual)."""
+    delta = {k: round(depois[k] - antes[k], 2) for k in depois if k != 'limite_concorrencia'}
+    delta['limite_concorrencia'] = depois['limite_concorrencia']
+    return delta
@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# Intervalo de amostragem do RSS durante um job (pico de memória por job)
+METRICAS_AMOSTRA_RSS_S = float(os.environ.get("METRICAS_AMOSTRA_RSS_S", "0.5"))
+
+
+def _ler_status_kb(campo):
+    try:
+        with open('/proc/self/status') as f:
+            for linha in f:
+                if linha.startswith(campo + ':'):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def resetar_pico_rss():
+    """
+    Zera o pico de RSS (VmHWM) do processo inteiro (Linux). Só para benchmarks com um job por
+    processo: com jobs simultâneos um zeraria o pico do outro (nos jobs, use AmostradorRSS).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def pico_rss_mb():
+    """Pico de memória residente desde o último resetar_pico_rss(), em MB."""
+    kb = _ler_status_kb('VmHWM')
+    if kb is None:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # pico do processo inteiro
+    return round(kb / 1024, 1)
+
+
+def rss_mb():
+    """Memória residente atual do processo, em MB (None fora do Linux)."""
+    kb = _ler_status_kb('VmRSS')
+    return None if kb is None else round(kb / 1024, 1)
+
+
+class AmostradorRSS:
+    """
+    Pico de RSS durante um job, por amostragem numa thread própria. Não mexe no VmHWM do
+    processo, então jobs simultâneos na instância não zeram o pico uns dos outros. O valor
+    é a memória do processo enquanto o job rodava (inclui a dos outros jobs da instância).
+    """
+
+    def __init__(self, intervalo_s=METRICAS_AMOSTRA_RSS_S):
+        self.intervalo_s = intervalo_s
+        self.pico_mb = rss_mb()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _amostrar(self):
+        atual = rss_mb()
+        if atual is not None and (self.pico_mb is None or atual > self.pico_mb):
+            self.pico_mb = atual
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo_s):
+            self._amostrar()
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._loop, name='amostrador-rss', daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        """Encerra a amostragem e devolve o pico em MB (None fora do Linux)."""
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._amostrar()
+        return self.pico_mb
+
+
+class RastreadorEtapas:
+    """
+    Tempo, bytes e contagens por etapa de um job. Cada medição vira uma linha de log estruturada
+    (campos em `json_fields`, indexados pelo Cloud Logging) e é agregada por nome de etapa em
+    resumo(), o mapa compacto `metricas` gravado no documento do job.
+    Etapas repetidas (recorte, analise) somam tempo e contagens; `max_s` mostra a mais lenta.
+    registrar() pode ser chamado de qualquer thread.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.etapas = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def etapa(self, nome, log=True, **campos):
+        """Mede o bloco; o chamador pode acrescentar campos ao dict devolvido (bytes, paginas...)."""
+        medicao = dict(campos)
+        t0 = time.perf_counter()
+        try:
+            yield medicao
+        except Exception:
+            medicao['erros'] = 1
+            raise
+        finally:
+            self.registrar(nome, time.perf_counter() - t0, log=log, **medicao)
+
+    def registrar(self, nome, segundos, log=True, **campos):
+        """Campos numéricos são somados no resumo; os demais (ex.: id_documento) só vão para o log."""
+        with self._lock:
+            agregado = self.etapas.setdefault(nome, {'s': 0.0, 'n': 0, 'max_s': 0.0})
+            agregado['s'] += segundos
+            agregado['n'] += 1
+            agregado['max_s'] = max(agregado['max_s'], segundos)
+            for campo, valor in campos.items():
+                if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                    agregado[campo] = agregado.get(campo, 0) + valor
+        if log:
+            logger.info(f"Stage {nome} of job {self.job_id} took {segundos:.3f}s",
+                        extra={'json_fields': dict(campos, job_id=self.job_id, etapa=nome, duracao_s=round(segundos, 3))})
+
+    def resumo(self):
+        with self._lock:
+            resumo = {}
+            for nome, agregado in self.etapas.items():
+                compacto = dict(agregado, s=round(agregado['s'], 3))
+                if compacto['n'] > 1:
+                    compacto['max_s'] = round(agregado['max_s'], 3)
+                else:
+                    del compacto['max_s']
+                resumo[nome] = compacto
+            return resumo
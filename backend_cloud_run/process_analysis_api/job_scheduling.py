@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import logging
+from collections import namedtuple
+
+from dedup import safe_id
+
+logger = logging.getLogger()
+
+# Classes de tamanho: cada uma tem a própria fila no Cloud Tasks (setup_queue.sh), com orçamento
+# de concorrência (max-concurrent-dispatches) e prazo de despacho próprios. Um job entra na
+# primeira classe em que cabe pelos dois limites (páginas e bytes); None = sem limite.
+ClasseTamanho = namedtuple('ClasseTamanho', ['nome', 'max_paginas', 'max_bytes', 'fila', 'concorrencia', 'deadline_s'])
+
+CLASSES_TAMANHO = [
+    ClasseTamanho('pequeno', int(os.environ.get("CLASSE_PEQUENO_MAX_PAGINAS", "150")),
+                  int(os.environ.get("CLASSE_PEQUENO_MAX_MB", "30")) * 1024 * 1024,
+                  os.environ.get("FILA_PEQUENOS", "process-queue-pequenos"),
+                  int(os.environ.get("FILA_PEQUENOS_CONCORRENCIA", "30")), 600),
+    ClasseTamanho('medio', int(os.environ.get("CLASSE_MEDIO_MAX_PAGINAS", "1000")),
+                  int(os.environ.get("CLASSE_MEDIO_MAX_MB", "200")) * 1024 * 1024,
+                  os.environ.get("FILA_MEDIOS", "process-queue-medios"),
+                  int(os.environ.get("FILA_MEDIOS_CONCORRENCIA", "10")), 1200),
+    ClasseTamanho('grande', None, None,
+                  os.environ.get("FILA_GRANDES", "process-queue-grandes"),
+                  int(os.environ.get("FILA_GRANDES_CONCORRENCIA", "3")), 1800),  # 30 min: máximo do Cloud Tasks
+]
+
+# Custo estimado de processamento por página (fair share entre usuários de uma classe)
+SEGUNDOS_POR_PAGINA = float(os.environ.get("AGENDAMENTO_SEGUNDOS_POR_PAGINA", "0.5"))
+# Teto do atraso de fair share de um único job
+ATRASO_MAX_S = float(os.environ.get("AGENDAMENTO_ATRASO_MAX_S", "3600"))
+# Bytes por página usados quando o número de páginas não aparece no início/fim do arquivo
+BYTES_POR_PAGINA_ESTIMADOS = int(os.environ.get("BYTES_POR_PAGINA_ESTIMADOS", str(60 * 1024)))
+# Quanto ler do início e do fim do PDF para achar a contagem de páginas
+SONDA_BYTES = 64 * 1024
+USUARIO_ANONIMO = 'anonimo'
+
+Agendamento = namedtuple('Agendamento', ['classe', 'paginas', 'bytes', 'paginas_exatas', 'usuario', 'atraso_s'])
+
+# /Linearized ... /N <páginas> (PDFs "fast web view") e /Type /Pages ... /Count <páginas> (árvore de páginas)
+_REGEX_LINEARIZADO = re.compile(rb"/Linearized\b[^>]*?/N\s+(\d+)", re.S)
+_REGEX_PAGES = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", re.S)
+
+
+def contar_paginas_em(trecho):
+    """Contagem de páginas declarada em `trecho` (bytes do PDF), ou None."""
+    linearizado = _REGEX_LINEARIZADO.search(trecho)
+    if linearizado:
+        return int(linearizado.group(1))
+    # A raiz da árvore tem o maior /Count (nós intermediários contam só as suas folhas)
+    contagens = [int(a or b) for a, b in _REGEX_PAGES.findall(trecho)]
+    return max(contagens) if contagens else None
+
+
+def ler_inicio(blob):
+    """Primeiros SONDA_BYTES do PDF no GCS (o arquivo inteiro, se for menor); não depende dos metadados."""
+    return blob.download_as_bytes(start=0, end=SONDA_BYTES - 1)
+
+
+def sondar_pdf(blob, tamanho=None, inicio=None):
+    """
+    Tamanho e número de páginas do PDF no GCS sem baixá-lo: metadados do objeto mais leituras
+    parciais do início e do fim do arquivo. Quando a contagem está num object stream comprimido,
+    estima pelo tamanho. `tamanho` (já conhecido, ex.: import do Drive) e `inicio` (de ler_inicio,
+    lido em paralelo com os metadados) poupam as RPCs correspondentes. Retorna (paginas, bytes, exato).
+    """
+    if tamanho is None:
+        blob.reload()
+        tamanho = blob.size or 0
+    if tamanho:
+        paginas = contar_paginas_em(ler_inicio(blob) if inicio is None else inicio)
+        if paginas is None and tamanho > SONDA_BYTES:
+            paginas = contar_paginas_em(blob.download_as_bytes(start=max(0, tamanho - SONDA_BYTES), end=tamanho - 1))
+        if paginas:
+            return paginas, tamanho, True
+    return max(1, tamanho // BYTES_POR_PAGINA_ESTIMADOS), tamanho, False
+
+
+def classificar(paginas, tamanho_bytes, classes=CLASSES_TAMANHO):
+    """Primeira classe em que o job cabe; tamanho desconhecido (None) vai para a maior."""
+    if paginas is None or tamanho_bytes is None:
+        return classes[-1]
+    for classe in classes:
+        if ((classe.max_paginas is None or paginas <= classe.max_paginas)
+                and (classe.max_bytes is None or tamanho_bytes <= classe.max_bytes)):
+            return classe
+    return classes[-1]
+
+
+def classe_por_nome(nome, classes=CLASSES_TAMANHO):
+    """Classe de tamanho gravada no payload de um job (reenfileiramento); a maior se o nome não existe."""
+    for classe in classes:
+        if classe.nome == nome:
+            return classe
+    return classes[-1]
+
+
+def identificado(usuario):
+    return bool(usuario) and usuario != USUARIO_ANONIMO
+
+
+class AgendadorJobs:
+    """
+    Escolhe a classe de tamanho de um job e o atraso de fair share do usuário dentro dela
+    (start-time fair queuing): cada usuário tem um "fim virtual" por classe, que avança com o
+    custo estimado de cada job dele dividido pela concorrência da classe. O atraso só existe
+    quando outro usuário tem trabalho pendente na classe: o job espera até o fim virtual dele
+    ou até o trabalho dos outros acabar, o que vier antes. Sozinho na classe, o job entra na
+    hora (a concorrência da fila já limita o uso). O fim virtual fica em `colecao/{classe}_{usuario}`
+    (um documento por usuário, avançado em transação); os relógios pendentes de todos vêm de uma
+    consulta por fim_virtual > agora, que não depende do tamanho do job e pode correr junto com
+    a medição do PDF. Jobs sem usuário identificado não têm relógio nem atraso.
+    """
+
+    def __init__(self, db, firestore, classes=CLASSES_TAMANHO, colecao='agendamento_filas',
+                 segundos_por_pagina=SEGUNDOS_POR_PAGINA, atraso_max_s=ATRASO_MAX_S):
+        self.db = db
+        self.firestore = firestore
+        self.classes = classes
+        self.colecao = colecao
+        self.segundos_por_pagina = segundos_por_pagina
+        self.atraso_max_s = atraso_max_s
+
+    def pendentes(self, usuario, agora=None):
+        """Relógios ainda no futuro, por classe: {classe: {usuario: fim_virtual}}; {} sem usuário (nada a consultar)."""
+        if not identificado(usuario):
+            return {}
+        agora = time.time() if agora is None else agora
+        por_classe = {}
+        for snapshot in self.db.collection(self.colecao).where('fim_virtual', '>', agora).stream():
+            dados = snapshot.to_dict()
+            por_classe.setdefault(dados.get('classe'), {})[dados.get('usuario')] = dados['fim_virtual']
+        return por_classe
+
+    def atraso_justo(self, classe, usuario, pendentes, agora=None):
+        """Atraso (segundos) do próximo job de `usuario` na classe diante do trabalho pendente dos outros."""
+        agora = time.time() if agora is None else agora
+        relogios = pendentes.get(classe.nome, {})
+        inicio = min(max(agora, relogios.get(usuario, 0)), agora + self.atraso_max_s)
+        outros = [fim for u, fim in relogios.items() if u != usuario and fim > agora]
+        return max(0.0, min(inicio, max(outros)) - agora) if outros else 0.0
+
+    def reservar(self, agendamento, agora=None):
+        """Avança o relógio virtual do usuário com o custo do job (transação no documento dele)."""
+        if not identificado(agendamento.usuario):
+            return
+        agora = time.time() if agora is None else agora
+        classe = agendamento.classe
+        custo = (agendamento.paginas or 0) * self.segundos_por_pagina / max(1, classe.concorrencia)
+        ref = self.db.collection(self.colecao).document(safe_id(f"{classe.nome}_{agendamento.usuario}"))
+
+        @self.firestore.transactional
+        def _reservar(transaction):
+            snapshot = ref.get(transaction=transaction)
+            fim_virtual = (snapshot.to_dict() or {}).get('fim_virtual', 0) if snapshot.exists else 0
+            inicio = min(max(agora, fim_virtual), agora + self.atraso_max_s)
+            transaction.set(ref, {'fim_virtual': inicio + custo, 'classe': classe.nome, 'usuario': agendamento.usuario})
+
+        try:
+            _reservar(self.db.transaction())
+        except Exception as e:
+            # O job já está agendado; só os próximos dele deixam de pesar no fair share
+            logger.warning(f"Fair-share reservation failed for {agendamento.usuario}: {e}")
+
+    def agendar(self, paginas, tamanho_bytes, usuario=None, paginas_exatas=True, pendentes=None, reservar=True):
+        """
+        Classe e atraso do job. `pendentes` (de self.pendentes, já lido) poupa a consulta; com
+        reservar=False quem chama avança o relógio depois (self.reservar), em paralelo ao enfileiramento.
+        """
+        classe = classificar(paginas, tamanho_bytes, self.classes)
+        if not identificado(usuario):
+            # Sem usuário não há de quem ser justo: todos cairiam no mesmo relógio e esperariam à toa
+            return Agendamento(classe, paginas, tamanho_bytes, paginas_exatas, USUARIO_ANONIMO, 0.0)
+        try:
+            atraso = self.atraso_justo(classe, usuario, self.pendentes(usuario) if pendentes is None else pendentes)
+        except Exception as e:
+            # Sem os relógios o job ainda entra na fila da classe, só sem fair share
+            logger.warning(f"Fair-share lookup failed for {usuario}: {e}")
+            atraso = 0.0
+        agendamento = Agendamento(classe, paginas, tamanho_bytes, paginas_exatas, usuario, round(atraso, 3))
+        if reservar:
+            self.reservar(agendamento)
+        return agendamento
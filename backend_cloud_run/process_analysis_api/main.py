@@ -1,28 +1,50 @@
 import os
 import json
+import asyncio
 import re
 import io
-import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+_inicio_import = time.perf_counter()
 import functions_framework
-import firebase_admin
-from firebase_admin import firestore, storage
-from google.cloud import storage as gcs
-import google.generativeai as genai
 import fitz  # PyMuPDF
 import requests
-from google.cloud import tasks_v2
+from google.api_core.exceptions import (AlreadyExists, NotFound, Aborted, DeadlineExceeded, InternalServerError,
+                                        ResourceExhausted, ServiceUnavailable)
 from datetime import datetime, timedelta, timezone
 
-import google.cloud.logging
+from clients import Preguicoso, criar_firestore, criar_storage, criar_tasks, criar_genai, criar_logging, modulo, tempos_inicializacao
+from page_text import PageTextCache
+from page_mapping import mapear_paginas, IndiceDocumentos
+from page_render import RenderizadorPaginas
+from pdf_slicing import RecortadorPDF, recorte_de_bytes, GEMINI_INLINE_MAX_BYTES
+from payload_planning import PlanejadorPayload, PayloadTexto, paginas_em_pdf
+from batching import (planejar_lotes, separar_resposta_lote, EstatisticasLotes, CARACTERES_POR_TOKEN,
+                      TOKENS_POR_PAGINA_PDF)
+from triage import Triagem, EstatisticasTriagem, ACAO_PULAR, ACAO_FLASH
+from gemini_limiter import (LimitadorModelo, GEMINI_PRO_RPM, GEMINI_PRO_TPM, GEMINI_FLASH_RPM, GEMINI_FLASH_TPM,
+                            diferenca_resumos)
+from storage_io import baixar_blob_para_arquivo, sessao_http, transferir_stream_para_gcs
+from job_metrics import AmostradorRSS, RastreadorEtapas
+from firestore_writes import EscritorFirestore
+from task_queue import FilaLocal, TarefaDuplicada
+from checkpoints import JobCheckpoints, ETAPA_SUMARIO, ETAPA_MAPA, ETAPA_ANALISE
+from result_cache import LRUCache, FirestoreCache, CacheEmCamadas, EstatisticasCache, chave_cache, sha256_hex
+from dedup import Deduplicador, CacheProcessados, safe_id
+from api_async import LoopAPI, AssinadorURLs
+from job_scheduling import AgendadorJobs, sondar_pdf, ler_inicio, classe_por_nome
+from consolidation import AgregadorConsolidacao, CONSOLIDACAO_ESPERA_S
+from process_lease import LeaseProcesso, LeasePerdido, LEASE_TTL_FANOUT_S
 
-# Inicialização Firebase e GCS
-firebase_admin.initialize_app()
-db = firestore.client()
-storage_client = gcs.Client()
-
-# Inicialização Logging
-logging_client = google.cloud.logging.Client()
-logging_client.setup_logging()
+# Clientes criados sob demanda e reaproveitados entre requisições (ver clients.Preguicoso):
+# o import do módulo não abre conexões, e cada rota só inicializa o que usa.
+firestore = Preguicoso('firebase_admin.firestore', modulo('firebase_admin.firestore'))
+db = Preguicoso('firestore', criar_firestore)
+storage_client = Preguicoso('storage', criar_storage)
+logging_client = Preguicoso('logging', criar_logging)
+# Rotas da API (/api/upload-url, /api/processar) servidas por um loop asyncio compartilhado
+loop_api = LoopAPI()
+assinador_urls = AssinadorURLs(storage_client)
 import logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -31,14 +53,55 @@ logger.setLevel(logging.INFO)
 PROJECT_ID = os.environ.get("GOOGLE_CLOUD_PROJECT", "processai-468612") # Fallback ou env
 QUEUE_REGION = "us-central1"
 QUEUE_NAME = "process-queue"
-tasks_client = tasks_v2.CloudTasksClient()
+tasks_v2 = Preguicoso('tasks_v2', modulo('google.cloud.tasks_v2'))
+tasks_client = Preguicoso('tasks', criar_tasks)
+ROTA_WORKER_PDF = '/api/worker/processar-pdf'
+ROTA_WORKER_PARTE = '/api/worker/analisar-documento'
+# Fan-out: a partir de N sub-documentos, cada um vira uma Cloud Task própria (0 = desligado)
+FANOUT_MIN_TASKS = int(os.environ.get("FANOUT_MIN_TASKS", "0"))
+# Tentativas por parte antes de registrá-la como falha e seguir para o fan-in
+FANOUT_MAX_TENTATIVAS = int(os.environ.get("FANOUT_MAX_TENTATIVAS", "3"))
+# Entregas de um job (Cloud Tasks max-attempts das filas de classe, setup_queue.sh): erros transitórios
+# devolvem 500 e o job retoma dos checkpoints; na última entrega viram erro terminal
+JOB_MAX_TENTATIVAS = int(os.environ.get("JOB_MAX_TENTATIVAS", "5"))
+# Falhas de infraestrutura que sobraram das retentativas internas (Firestore, GCS, Gemini, HTTP)
+ERROS_TRANSITORIOS = (Aborted, DeadlineExceeded, InternalServerError, ResourceExhausted, ServiceUnavailable,
+                      ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)
+CONSOLIDATION_URL = "https://consolidar-processos-async-557034577173.us-central1.run.app/consolidar-batch"
+# Jobs que terminam juntos na instância são consolidados num único POST (ver disparar_consolidacao)
+agregador_consolidacao = AgregadorConsolidacao(CONSOLIDATION_URL)
+# Substituto in-process do Cloud Tasks (TASKS_BACKEND=local), ver usar_fila_local()
+fila_local = None
+# Jobs vão para a fila da sua classe de tamanho, com atraso de fair share por usuário
+agendador_jobs = AgendadorJobs(db, firestore)
+
+# Configuração Gemini (genai.configure no primeiro uso)
+genai = Preguicoso('genai', criar_genai)
+# Número máximo de chamadas Gemini Pro simultâneas por job (Step 4)
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))
+MODEL_PRO_NAME = 'gemini-2.5-pro'
+MODEL_FLASH_NAME = 'gemini-2.5-flash'
+# Limitadores compartilhados por todos os jobs da instância (cotas por modelo + AIMD + retentativas)
+limitadores_gemini = {
+    MODEL_PRO_NAME: LimitadorModelo(MODEL_PRO_NAME, rpm=GEMINI_PRO_RPM, tpm=GEMINI_PRO_TPM,
+                                    concorrencia_max=GEMINI_MAX_CONCURRENCY),
+    MODEL_FLASH_NAME: LimitadorModelo(MODEL_FLASH_NAME, rpm=GEMINI_FLASH_RPM, tpm=GEMINI_FLASH_TPM,
+                                      concorrencia_max=GEMINI_MAX_CONCURRENCY),
+}
 
-# Configuração Gemini
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+# Cache de análises: LRU na instância + coleção no Firestore (com TTL)
+cache_analises = CacheEmCamadas(LRUCache(), FirestoreCache(db, 'cache_analises_gemini'))
+# Cache do índice (Step 2) por impressão digital do texto das páginas lidas
+cache_sumarios = CacheEmCamadas(LRUCache(max_items=64), FirestoreCache(db, 'cache_sumarios'))
+# Imagens renderizadas e OCR de rodapé de páginas digitalizadas, pela impressão digital da página
+cache_paginas = LRUCache(max_items=512)
+# IDs já analisados por processo (dedup do Step 4), reaproveitados entre jobs da instância
+cache_processados = CacheProcessados()
 
 @functions_framework.http
 def process_analysis_api(request):
     """Entrypoint único para a Cloud Function (HTTP)."""
+    logging_client.obter()
     
     # CORS setup (Simplificado)
     if request.method == 'OPTIONS':
@@ -60,14 +123,23 @@ def process_analysis_api(request):
         return handle_processar(request, headers)
     elif path == '/api/importar-drive':
         return handle_importar_drive(request, headers)
-    elif path == '/api/worker/processar-pdf':
+    elif path == ROTA_WORKER_PDF:
         return handle_worker_processar(request)
+    elif path == ROTA_WORKER_PARTE:
+        return handle_worker_analisar_documento(request)
     else:
         return ('Not Found', 404, headers)
 
-def enqueue_process_task(payload):
-    """Enfileira a tarefa no Cloud Tasks."""
-    parent = tasks_client.queue_path(PROJECT_ID, QUEUE_REGION, QUEUE_NAME)
+def enqueue_process_task(payload, rota=ROTA_WORKER_PDF, nome=None, fila=QUEUE_NAME, deadline_s=None, atraso_s=0):
+    """
+    Enfileira a tarefa no Cloud Tasks.
+    `nome` torna a criação idempotente (AlreadyExists/TarefaDuplicada para o mesmo nome).
+    `fila`, `deadline_s` (dispatch_deadline) e `atraso_s` (schedule_time) vêm da classe de tamanho do job.
+    """
+    if fila_local is not None:
+        return fila_local.criar_tarefa(rota, payload, nome=nome, fila=fila, atraso_s=atraso_s)
+
+    parent = tasks_client.queue_path(PROJECT_ID, QUEUE_REGION, fila)
     
     # URL interna do próprio serviço (precisa estar deployado)
     # Se não tiver SERVICE_URL, tentar descobrir ou usar o hardcoded temporariamente
@@ -77,7 +149,7 @@ def enqueue_process_task(payload):
         # Para Cloud Run, geralmente passamos SERVICE_URL nas variaveis de ambiente
         raise ValueError("SERVICE_URL env var is missing")
 
-    url = f"{service_url.rstrip('/')}/api/worker/processar-pdf"
+    url = f"{service_url.rstrip('/')}{rota}"
     
     task = {
         "http_request": {
@@ -91,6 +163,12 @@ def enqueue_process_task(payload):
             # Vamos assumir public por enquanto ou que a service account tem permissão.
         }
     }
+    if nome:
+        task["name"] = tasks_client.task_path(PROJECT_ID, QUEUE_REGION, fila, nome)
+    if deadline_s:
+        task["dispatch_deadline"] = {"seconds": int(deadline_s)}
+    if atraso_s > 0:
+        task["schedule_time"] = {"seconds": int(time.time() + atraso_s)}
 
     response = tasks_client.create_task(request={"parent": parent, "task": task})
     logger.info(f"Task created: {response.name}")
@@ -108,69 +186,221 @@ def handle_worker_processar(request):
         if not job_id or not file_path:
             logger.error("Invalid worker payload")
             return ('Invalid Payload', 400)
+
+        tentativa = int(request.headers.get('X-CloudTasks-TaskRetryCount', 0))
+        registrar_inicio_job(data, tentativa)
             
         # Executa a lógica pesada
-        processar_pdf(job_id, file_path)
+        processar_pdf(job_id, file_path, data, tentativa)
         
         return ('OK', 200)
     except Exception as e:
         logger.exception("Worker failed")
         return (f'Error: {e}', 500)
 
+def handle_worker_analisar_documento(request):
+    """Worker do fan-out: analisa um único sub-documento de um job."""
+    try:
+        data = request.get_json()
+        tentativa = int(request.headers.get('X-CloudTasks-TaskRetryCount', 0))
+        logger.info(f"Part worker received task: job {data.get('jobId')} part {data.get('indice')} (attempt {tentativa + 1})")
+        processar_parte(data, tentativa)
+        return ('OK', 200)
+    except Exception as e:
+        # 500 faz o Cloud Tasks reentregar a parte
+        logger.exception("Part worker failed")
+        return (f'Error: {e}', 500)
+
+def usar_fila_local(workers=4, filas=None):
+    """Troca o Cloud Tasks por uma fila in-process (desenvolvimento local e benchmarks)."""
+    global fila_local
+    fila_local = FilaLocal(despachar_worker, workers=workers,
+                           max_tentativas=max(FANOUT_MAX_TENTATIVAS, JOB_MAX_TENTATIVAS), filas=filas)
+    return fila_local
+
+def despachar_worker(rota, payload, tentativa=0):
+    """Executa o handler de worker de `rota` diretamente (usado pela fila local)."""
+    if rota == ROTA_WORKER_PDF:
+        registrar_inicio_job(payload, tentativa)
+        processar_pdf(payload['jobId'], payload['filePath'], payload, tentativa)
+    elif rota == ROTA_WORKER_PARTE:
+        processar_parte(payload, tentativa)
+    else:
+        raise ValueError(f"Unknown worker route: {rota}")
+
+def medir_pdf(file_path, tamanho=None, inicio=None):
+    """(paginas, bytes, exato) do PDF no GCS; sem a medição o job vai para a classe dos grandes (prazo mais longo)."""
+    try:
+        return sondar_pdf(blob_de_caminho(file_path), tamanho, inicio)
+    except Exception as e:
+        logger.warning(f"Could not size {file_path}: {e}")
+        return None, None, False
+
+async def medir_pdf_async(file_path):
+    """medir_pdf com a leitura dos metadados e a do início do arquivo em paralelo."""
+    try:
+        blob = await loop_api.em_thread(blob_de_caminho, file_path)
+        _, inicio = await asyncio.gather(loop_api.em_thread(blob.reload), loop_api.em_thread(ler_inicio, blob))
+    except Exception as e:
+        logger.warning(f"Could not size {file_path}: {e}")
+        return None, None, False
+    return await loop_api.em_thread(medir_pdf, file_path, blob.size or 0, inicio)
+
+def enfileirar_agendado(job_id, file_path, agendamento):
+    """Enfileira o job na fila da classe do `agendamento`, adiado pelo fair share do usuário."""
+    payload = {
+        'jobId': job_id,
+        'filePath': file_path,
+        'enfileiradoEm': time.time(),
+        'agendamento': {
+            'classe': agendamento.classe.nome,
+            'paginas': agendamento.paginas,
+            'paginas_exatas': agendamento.paginas_exatas,
+            'bytes': agendamento.bytes,
+            'usuario': agendamento.usuario,
+            'atraso_justo_s': agendamento.atraso_s,
+        },
+    }
+    enqueue_process_task(payload, fila=agendamento.classe.fila, deadline_s=agendamento.classe.deadline_s,
+                         atraso_s=agendamento.atraso_s)
+    logger.info(f"Job {job_id} scheduled as '{agendamento.classe.nome}' ({agendamento.paginas} pages"
+                f"{'' if agendamento.paginas_exatas else ' est.'}, {agendamento.bytes} bytes) "
+                f"for {agendamento.usuario}, delayed {agendamento.atraso_s}s")
+
+def agendar_processamento(job_id, file_path, usuario=None, tamanho=None):
+    """
+    Mede o PDF (páginas e bytes, sem baixá-lo), escolhe a classe de tamanho e enfileira o job
+    na fila da classe, adiado pelo fair share do usuário. Devolve o Agendamento.
+    """
+    paginas, tamanho, exato = medir_pdf(file_path, tamanho)
+    agendamento = agendador_jobs.agendar(paginas, tamanho, usuario, paginas_exatas=exato)
+    enfileirar_agendado(job_id, file_path, agendamento)
+    return agendamento
+
+def reenfileirar_job(payload, atraso_s=0, nome=None):
+    """Enfileira de novo um job (na fila da sua classe de tamanho), ex.: quando espera o lease do processo."""
+    classe = classe_por_nome((payload.get('agendamento') or {}).get('classe'))
+    enqueue_process_task(dict(payload, enfileiradoEm=time.time()), fila=classe.fila,
+                         deadline_s=classe.deadline_s, atraso_s=atraso_s, nome=nome)
+
+def nome_espera(tarefa):
+    """Nome da tarefa de segurança da espera nº `espera` do job (o Cloud Tasks não reaproveita nomes)."""
+    return f"{tarefa['jobId']}-espera-{tarefa['espera']}"
+
+def cancelar_tarefa(nome, fila=QUEUE_NAME):
+    """Remove uma tarefa nomeada ainda não despachada. False se ela já não existe (rodou ou foi removida)."""
+    if fila_local is not None:
+        return fila_local.cancelar_tarefa(nome)
+    try:
+        tasks_client.delete_task(name=tasks_client.task_path(PROJECT_ID, QUEUE_REGION, fila, nome))
+    except NotFound:
+        return False
+    return True
+
+def liberar_lease(lease):
+    """
+    Solta o lease do processo e reenfileira na hora o próximo job que esperava por ele, cancelando
+    a tarefa de segurança da espera (senão ela ainda rodaria o job uma segunda vez).
+    """
+    try:
+        aguardando = lease.liberar()
+    except Exception as e:
+        # Os jobs em espera ainda tentam de novo sozinhos quando o lease expirar
+        logger.warning(f"Failed to release lease on {lease.parent_id}: {e}")
+        return
+    for tarefa in aguardando:
+        logger.info(f"Waking job {tarefa.get('jobId')}, waiting for process {lease.parent_id}")
+        try:
+            reenfileirar_job(tarefa)
+        except Exception as e:
+            logger.warning(f"Failed to requeue waiting job {tarefa.get('jobId')}: {e}")
+            continue
+        if tarefa.get('espera'):
+            classe = classe_por_nome((tarefa.get('agendamento') or {}).get('classe'))
+            try:
+                cancelar_tarefa(nome_espera(tarefa), fila=classe.fila)
+            except Exception as e:
+                # Se escapar, a reentrega vê que o job já é o dono e para logo após o sumário
+                logger.warning(f"Failed to cancel safety-net task of job {tarefa.get('jobId')}: {e}")
+
+def registrar_inicio_job(payload, tentativa=0):
+    """Grava no job a classe de tamanho e o tempo de espera na fila (só na primeira entrega)."""
+    if tentativa or 'enfileiradoEm' not in payload:
+        return
+    agendamento = dict(payload.get('agendamento') or {})
+    agendamento['espera_fila_s'] = round(time.time() - payload['enfileiradoEm'], 3)
+    try:
+        db.collection('analises_processos').document(payload['jobId']).set({'agendamento': agendamento}, merge=True)
+    except Exception as e:
+        logger.warning(f"Failed to record queue wait for job {payload['jobId']}: {e}")
+
 def handle_upload_url(request, headers):
     """Gera Signed URL para upload direto."""
     try:
         data = request.get_json()
-        filename = data.get('name')
-        content_type = data.get('type')
-        
-        bucket_name = os.environ.get("BUCKET_NAME") # Configurar env var
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(f"uploads/{filename}")
-        
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=900, # 15 min
-            method="PUT",
-            content_type=content_type
-        )
-        
-        # Gerar JobId (usando auto-id do firestore para facilitar)
-        job_ref = db.collection('analises_processos').document()
-        
-        return (json.dumps({'uploadUrl': url, 'jobId': job_ref.id}), 200, headers)
+        return loop_api.executar(upload_url_async(data, headers))
     except Exception as e:
         return (json.dumps({'error': str(e)}), 500, headers)
 
+async def upload_url_async(data, headers):
+    filename = data.get('name')
+    content_type = data.get('type')
+    
+    bucket_name = os.environ.get("BUCKET_NAME") # Configurar env var
+    # Handle do bucket e credenciais de assinatura reaproveitados entre requisições
+    url = await loop_api.em_thread(assinador_urls.assinar, bucket_name, f"uploads/{filename}", content_type)
+    
+    # Gerar JobId (usando auto-id do firestore para facilitar)
+    # Em thread: o primeiro acesso ao `db` cria o cliente, o que não pode travar o loop
+    job_ref = await loop_api.em_thread(lambda: db.collection('analises_processos').document())
+    
+    return (json.dumps({'uploadUrl': url, 'jobId': job_ref.id}), 200, headers)
+
 def handle_processar(request, headers):
     """Gatilho para iniciar processamento após upload."""
     try:
         data = request.get_json()
-        job_id = data.get('jobId')
-        file_path = data.get('filePath') # gs://bucket/uploads/file.pdf
-        
-        # Iniciar processamento background (Simulado aqui com chamada async direta ou Cloud Tasks)
-        # Em produção, idealmente usaria Cloud Tasks para evitar timeout HTTP imediato
-        # Aqui vamos apenas registar e chamar a função interna de processamento
-        
-        # Criação inicial do doc
-        db.collection('analises_processos').document(job_id).set({
-            'status': 'ENFILEIRADO', # Status novo
-            'progresso': 0,
-            'data_criacao': firestore.SERVER_TIMESTAMP,
-            'url_arquivo_original': file_path,
-        }, merge=True)
-
-        # Enfileirar Tarefa
-        try:
-            enqueue_process_task({'jobId': job_id, 'filePath': file_path})
-            return (json.dumps({'message': 'Processamento enfileirado', 'jobId': job_id}), 200, headers)
-        except Exception as e:
-            logger.error(f"Failed to enqueue task: {e}")
-            return (json.dumps({'error': f'Failed to enqueue: {e}'}), 500, headers)
+        return loop_api.executar(processar_async(data, headers))
     except Exception as e:
         return (json.dumps({'error': str(e)}), 500, headers)
 
+async def processar_async(data, headers):
+    job_id = data.get('jobId')
+    file_path = data.get('filePath') # gs://bucket/uploads/file.pdf
+    usuario = data.get('usuarioUid')
+    
+    # O documento do job é criado antes do enfileiramento: se a criação falhar nada foi
+    # enfileirado e o cliente pode repetir a chamada sem iniciar um segundo processamento.
+    # A medição do PDF e a leitura dos relógios do fair share só leem: correm junto com a criação.
+    criacao, (paginas, tamanho, exato), pendentes = await asyncio.gather(
+        loop_api.em_thread(criar_documento_job, job_id, file_path),
+        medir_pdf_async(file_path),
+        loop_api.em_thread(agendador_jobs.pendentes, usuario),
+        return_exceptions=True)
+    if isinstance(criacao, Exception):
+        raise criacao
+    if isinstance(pendentes, Exception):
+        logger.warning(f"Fair-share lookup failed for {usuario}: {pendentes}")
+        pendentes = {}
+    agendamento = agendador_jobs.agendar(paginas, tamanho, usuario, paginas_exatas=exato,
+                                         pendentes=pendentes, reservar=False)
+    try:
+        # O relógio do usuário avança junto com o enfileiramento (reservar não lança)
+        await asyncio.gather(loop_api.em_thread(enfileirar_agendado, job_id, file_path, agendamento),
+                             loop_api.em_thread(agendador_jobs.reservar, agendamento))
+    except Exception as e:
+        logger.error(f"Failed to enqueue task: {e}")
+        return (json.dumps({'error': f'Failed to enqueue: {e}'}), 500, headers)
+    return (json.dumps({'message': 'Processamento enfileirado', 'jobId': job_id}), 200, headers)
+
+def criar_documento_job(job_id, file_path):
+    db.collection('analises_processos').document(job_id).set({
+        'status': 'ENFILEIRADO', # Status novo
+        'progresso': 0,
+        'data_criacao': firestore.SERVER_TIMESTAMP,
+        'url_arquivo_original': file_path,
+    }, merge=True)
+
 def handle_importar_drive(request, headers):
     """Importa do Drive para GCS e inicia processamento."""
     try:
@@ -198,52 +428,44 @@ def handle_importar_drive(request, headers):
             logger.error(f"Missing fileId (or valid URL) or token. Data: {data}")
             return (json.dumps({'error': 'Missing fileId (or valid URL) or token'}), 400, headers)
             
-        # 1. Obter metadados do arquivo (Nome)
+        # 1. Obter metadados do arquivo (Nome e tamanho)
         logger.info(f"Fetching metadata for file_id: {file_id}")
         meta_url = f"https://www.googleapis.com/drive/v3/files/{file_id}"
         headers_drive = {'Authorization': f'Bearer {oauth_token}'}
+        session = sessao_http()
         
-        resp_meta = requests.get(meta_url, headers=headers_drive)
+        resp_meta = session.get(meta_url, headers=headers_drive, params={'fields': 'name,size'})
         if resp_meta.status_code != 200:
              logger.error(f"Drive API Error: {resp_meta.text}")
              return (json.dumps({'error': f'Drive API Error: {resp_meta.text}'}), 500, headers)
              
-        filename = resp_meta.json().get('name', f'drive_{file_id}.pdf')
-        logger.info(f"Filename resolved: {filename}")
+        meta = resp_meta.json()
+        filename = meta.get('name', f'drive_{file_id}.pdf')
+        file_size = int(meta['size']) if meta.get('size') is not None else None
+        logger.info(f"Filename resolved: {filename} ({file_size} bytes)")
         
+        if file_size == 0:
+            logger.error("File in Drive is empty (0 bytes).")
+            return (json.dumps({'error': 'File is empty'}), 400, headers)
+
         # 2. Baixar Conteúdo (alt=media)
         # Para arquivos Google Docs seria export, mas o picker filtro PDF, assumimos binário.
         download_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
         
-        # Stream download -> Upload GCS
-        # Para evitar estourar memória na Cloud Function, fazemos stream.
-        # Mas para simplificar aqui vamos carregar em memória (cuidado com arquivos > 500MB)
-        # O ideal seria usar transfer manager ou stream chunked.
-        
-        # Download to memory to verify content
-        logger.info("Downloading file content to memory...")
-        resp_content = requests.get(download_url, headers=headers_drive)
-        
-        if resp_content.status_code != 200:
-            logger.error(f"Failed to download file. Status: {resp_content.status_code}, Response: {resp_content.text}")
-            return (json.dumps({'error': 'Failed to download file from Drive'}), 500, headers)
-            
-        file_content = resp_content.content
-        file_size = len(file_content)
-        logger.info(f"Downloaded {file_size} bytes from Drive.")
-        
-        if file_size == 0:
-            logger.error("File downloaded from Drive is empty (0 bytes).")
-            return (json.dumps({'error': 'File is empty'}), 400, headers)
-
+        # Stream Drive -> upload resumível do GCS em blocos de tamanho fixo (memória constante),
+        # retomando do último offset confirmado em falhas transitórias.
         bucket_name = os.environ.get("BUCKET_NAME")
         bucket = storage_client.bucket(bucket_name)
         blob = bucket.blob(f"uploads/{filename}")
+        upload_url = blob.create_resumable_upload_session(content_type='application/pdf', size=file_size)
         
-        # Upload from string/bytes
-        logger.info(f"Uploading to GCS: gs://{bucket_name}/uploads/{filename}")
-        blob.upload_from_string(file_content, content_type='application/pdf')
-        logger.info("Upload to GCS completed.")
+        logger.info(f"Streaming Drive file to GCS: gs://{bucket_name}/uploads/{filename}")
+        try:
+            transferido = transferir_stream_para_gcs(download_url, headers_drive, upload_url, tamanho_total=file_size, session=session)
+        except Exception as e:
+            logger.error(f"Failed to stream file from Drive to GCS: {e}")
+            return (json.dumps({'error': 'Failed to download file from Drive'}), 500, headers)
+        logger.info(f"Upload to GCS completed. {transferido} bytes.")
         
         # 3. Criar Job
         job_ref = db.collection('analises_processos').document()
@@ -260,7 +482,8 @@ def handle_importar_drive(request, headers):
         })
         
         try:
-            enqueue_process_task({'jobId': job_id, 'filePath': f"gs://{bucket_name}/uploads/{filename}"})
+            # O tamanho já é conhecido pela transferência: a medição não relê os metadados
+            agendar_processamento(job_id, f"gs://{bucket_name}/uploads/{filename}", data.get('usuarioUid'), transferido)
             return (json.dumps({'message': 'Importação iniciada (Enfileirada)', 'jobId': job_id}), 200, headers)
         except Exception as e:
              logger.error(f"Failed to enqueue task drive: {e}")
@@ -273,99 +496,721 @@ def handle_importar_drive(request, headers):
 
 # --- LÓGICA CORE DE ANÁLISE ---
 
-def processar_pdf(job_id, file_path_gs):
+# Melhoria no Prompt para ser mais permissivo e explicativo
+PROMPT_SUMARIO = """
+        Você é um auditor jurídico experiente. Sua tarefa é identificar a tabela de índice ou lista de documentos neste PDF.
+        Também tente encontrar o NÚMERO DO PROCESSO (formato NNNNNNN-DD.AAAA.J.TR.OOOO).
+
+        Geralmente encontrada nas primeiras ou últimas páginas.
+        Procure por:
+        - Tabela com colunas 'Id', 'Documento', 'Data'.
+        - Lista sequencial de peças processuais.
+        - Cabeçalho ou linha contendo "Índice", "Sumário", "Peças".
+
+        Se encontrar, extraia TODOS os documentos listados.
+        Se a imagem/texto não tiver qualidade ou não for um índice, retorne lista vazia [].
+
+        Saída Obrigatória (JSON):
+        {
+          "numero_processo": "string ou null",
+          "documentos": [
+             { "id_documento": "string ou null", "tipo_original": "string", "data": "string ou null" }
+          ]
+        }
+        """
+PROMPT_SUMARIO_VERSAO = sha256_hex(PROMPT_SUMARIO)[:16]
+
+
+def identificar_sumario(full_context, imagens=None):
+    """
+    Step 2: extrai numero_processo e a lista de documentos do índice via Gemini Flash.
+    O resultado é guardado pela impressão digital do texto das páginas lidas (mais o modelo e
+    a versão do prompt), então o mesmo arquivo reprocessado não repete a chamada.
+    `imagens` são as páginas digitalizadas lidas, [(pagina, jpeg, hash)], enviadas como imagem.
+    Retorna (documentos_listados, numero_processo, info) com latência/tokens gastos ou economizados.
+    """
+    imagens = imagens or []
+    impressao = sha256_hex(full_context + ''.join(h for _, _, h in imagens))
+    chave = chave_cache(impressao, MODEL_FLASH_NAME, PROMPT_SUMARIO_VERSAO)
+    try:
+        cacheado, tier = cache_sumarios.get(chave)
+    except Exception as e:
+        logger.warning(f"Index cache lookup failed: {e}")
+        cacheado, tier = None, None
+
+    if cacheado is not None:
+        logger.info(f"Index cache hit ({tier}). Saved {cacheado.get('latencia_s')}s and {cacheado.get('tokens')} tokens")
+        info = {
+            'cache_hit': True,
+            'latencia_economizada_s': cacheado.get('latencia_s'),
+            'tokens_economizados': cacheado.get('tokens'),
+        }
+        return cacheado['documentos'], cacheado.get('numero_processo'), info
+
+    conteudo = [PROMPT_SUMARIO, full_context]
+    for p_num, imagem, _ in imagens:
+        conteudo += [f"--- PÁGINA {p_num} (digitalizada) ---", {'mime_type': 'image/jpeg', 'data': imagem}]
+    model_flash = genai.GenerativeModel(MODEL_FLASH_NAME)
+    t0 = time.monotonic()
+    response_sumario = gerar_conteudo(model_flash, MODEL_FLASH_NAME, conteudo,
+                                      {"response_mime_type": "application/json", "temperature": 0.2},
+                                      tokens_estimados=(len(PROMPT_SUMARIO) + len(full_context)) // CARACTERES_POR_TOKEN
+                                      + len(imagens) * TOKENS_POR_PAGINA_PDF)
+    latencia = round(time.monotonic() - t0, 2)
+    logger.info(f"Raw Gemini response for Index: {response_sumario.text}")
+
+    usage = getattr(response_sumario, 'usage_metadata', None)
+    tokens = getattr(usage, 'total_token_count', None) if usage else None
+    
+    documentos_listados = []
+    numero_processo = None
+    
+    try:
+        data_sumario = json.loads(response_sumario.text)
+        # Suporte a formatos antigos ou novos da resposta
+        if isinstance(data_sumario, list):
+            documentos_listados = data_sumario
+        elif isinstance(data_sumario, dict):
+            documentos_listados = data_sumario.get('documentos', [])
+            numero_processo = data_sumario.get('numero_processo')
+    except json.JSONDecodeError:
+         logger.error(f"Failed to parse JSON from Gemini: {response_sumario.text}")
+
+    # Só guarda índices encontrados: uma resposta vazia merece nova tentativa
+    if documentos_listados:
+        try:
+            cache_sumarios.set(chave, {
+                'numero_processo': numero_processo,
+                'documentos': documentos_listados,
+                'latencia_s': latencia,
+                'tokens': tokens,
+            }, modelo=MODEL_FLASH_NAME, versao_prompt=PROMPT_SUMARIO_VERSAO)
+        except Exception as e:
+            logger.warning(f"Index cache write failed: {e}")
+
+    return documentos_listados, numero_processo, {'cache_hit': False, 'latencia_s': latencia, 'tokens': tokens}
+
+
+# Prompt Mestre Definido pelo Usuário (análise individual de cada sub-documento)
+PROMPT_ANALISE_TEMPLATE = """
+CONTEXTO:
+Nome do Arquivo sendo analisado: {filename}
+
+# PERSONA E OBJETIVO MESTRE
+
+Você é um Perito Médico, especialista em Medicina do Trabalho, altamente qualificado, trabalhando sob minha supervisão (Dr. Paulo Mapurunga). Sua missão é transformar um documento de processo da justiça federal em uma análise JSON estruturada, que servirá como base direta para a elaboração do meu laudo pericial. Siga rigorosamente a estrutura de saída.
+
+# DIRETRIZ PRINCIPAL: ANÁLISE CONTEXTUAL
+
+Não se limite a extrair dados isolados. Analise o documento no contexto de uma perícia médica. Busque por correlações, contradições e informações que ajudem a estabelecer ou afastar Incapacidade Laboral (Temporária/Permanente; Parcial/Total), ou Impedimento, no caso em questão.
+
+# REGRAS DE PREENCHIMENTO E FILTRAGEM
+
+  * **Dados Ausentes:** Se uma informação específica para um campo do JSON não for encontrada no documento, preencha o campo com o valor `null` ou com uma string vazia `""`. **Não omita a chave.**
+
+  * **IMPORTANTE: O QUE **NÃO** É CONSIDERADO DOCUMENTO MÉDICO:**
+    **NUNCA inclua** na lista "documentosMedicosAnexados" documentos que sejam apenas:
+    - Certidões (Nascimento, Casamento, Óbito).
+    - Documentos de Identificação Pessoal (RG, CPF, CNH, Carteira de Trabalho, Título de Eleitor).
+    - Comprovantes de Residência (Contas de Água, Luz, Telefone, Internet).
+    - Documentos Escolares (Atestados de Matrícula, Histórico Escolar, Frequência).
+    - Documentos Financeiros/Administrativos (Recibos, Notas Fiscais, Carteiras de Sindicato/Clube/Associação).
+    - Cartões de Vacina ou Cartões do SUS (EXCETO se contiverem anotações clínicas de diagnóstico importantes).
+    - Procurações, Declarações de Pobreza ou Petições Advocatícias (exceto se a petição transcrever um laudo).
+
+  * **CRUCIAL: O QUE É DOCUMENTO MÉDICO:**
+    Procure ativamente por documentos **clínicos** emitidos por profissionais de saúde. Para CADA documento encontrado deste tipo:
+      * Identifique o tipo específico (Atestado Médico, Relatório Médico, Laudo de Exame de Imagem/Laboratorial, Prontuário, Receita, Guia de Encaminhamento, Laudo Pericial Prévio - INSS ou Judicial, CAT, ASO).
+      * Extraia a data exata.
+      * Extraia o nome do Profissional e Instituição.
+      * Resuma o conteúdo clínico (Diagnóstico, CID, Achados, Conclusão).
+      * Indique a página.
+
+# ESTRUTURA DE SAÍDA JSON OBRIGATÓRIA PARA CADA ARQUIVO
+
+```json
+{{
+  "idDocumento": "[O ID extraído. Obrigatório]",
+  "nomeArquivoOriginal": "[O nome completo do arquivo PDF fornecido]",
+  "tipoDocumentoGeral": "[Classificação geral: 'Petição Inicial', 'ASO Admissional', 'ASO Demissional', 'Relatório Médico', 'Comunicação INSS', 'Contestação', 'PCMSO', 'CAT', 'Quesitos', 'Despacho Judicial', 'AET', 'LTCAT', etc.]",
+  "dataAssinatura": "[Data em que o documento foi assinado/protocolado nos autos do processo]",
+  "poloOrigemDocumento": "[Ativo, Passivo, Neutro, ou Não Identificado]",
+  "dadosRelevantesParaLaudo": {{
+    "identificacaoDasPartes": "[Extraia nomes completos, CPFs, Endereço Residencial, PIS/PASEP, CTPS, CNPJs, Estado Civil, Escolaridade, do Reclamante e da Reclamada mencionados NESTE documento, etc.]",
+    "Vara": "[Veja em qual Vara da Justiça ou Orgão Julgador está ocorrendo o caso, por exemplo: ‘1a Vara Federal da SSJ de Feira de Santana-BA’]",
+    "Tribunal": "[Veja qual tribunal está esse processo. Por exemplo: TRF1, TRT5, TJBA, etc...]",
+    "ResumoGeralConteudoArquivo": "[Resumo Geral do conteúdo principal deste arquivo, focando em informações importantes do ponto de vista Pericial]",
+    "historicoClinicoGeral": "[Comorbidades, cirurgias, internações, histórico familiar mencionados NESTE documento.]"
+  }},
+  "historicoOcupacional": [
+    {{
+      "tipoOcupacao": "[Atual ou Anterior]",
+      "ocupacao": "[Nome da profissão]",
+      "descricaoFuncao": "[Descrição de função, atividades, tarefas encontradas NESTE documento.]",
+      "periodoFuncao": "[Período em que exerceu a função. Ex: 'dd/mm/aaaa a dd/mm/aaaa']",
+      "ambienteFisico": "[Menções a ruído, calor, ergonomia, agentes químicos encontradas NESTE documento.]",
+      "ambientePsicossocial": "[Menções a pressão, metas, assédio, relacionamento com liderança encontradas NESTE documento.]",
+      "jornadaTrabalho": "[Informações sobre horário, turno, pausas, horas extras encontradas NESTE documento.]",
+      "treinamentoEPIs": "[Menção a EPIs e treinamentos encontrada NESTE documento.]"
+    }}
+  ],
+  "documentosMedicosAnexados": [
+    {{
+      "tipo": "[Tipo específico: 'Relatório Médico', 'Laudo de Exame', 'Atestado', 'Receita', 'ASO', 'CAT', 'Laudo INSS'. NUNCA INCLUIR DOCUMENTOS PESSOAIS, CERTIDÕES OU COMPROVANTES DE RESIDÊNCIA AQUI]",
+      "data": "[dd/mm/aaaa]",
+      "profissionalServico": "[Nome do médico/clínica/hospital]",
+      "resumoConteudo": "[Resumo do CONTEÚDO DESTE DOCUMENTO MÉDICO (Diagnóstico, CID, Achados, Conclusões)]",
+      "paginaNoArquivo": "[Número da página no PDF]"
+    }}
+  ],
+  "quesitosApresentados": [
+    {{
+      "polo": "[Ativo, Passivo ou Neutro]",
+      "textoQuesito": "[Veja se tem quesitos apresentados neste arquivo. Diga objetivamente que sim ou que não tem quesitos neste arquivo.]",
+      "paginaNoArquivo": "[Número da página no PDF onde o quesito se encontra]"
+    }}
+  ],
+  "observacoes": "[Qualquer informação relevante que não se encaixe acima, dificuldades encontradas ou a justificativa para usar o nome do arquivo como idDocumento.]"
+}}
+```
+
+# INSTRUÇÃO FINAL DE FORMATAÇÃO
+Sua resposta deve conter **APENAS** o código JSON válido, sem nenhum texto introdutório, comentários ou explicações. Sua resposta deve começar diretamente com `{{` e terminar com `}}`.
+"""
+# Qualquer alteração no template invalida o cache de resultados
+PROMPT_ANALISE_VERSAO = sha256_hex(PROMPT_ANALISE_TEMPLATE)[:16]
+
+
+def montar_prompt_analise(filename):
+    return PROMPT_ANALISE_TEMPLATE.format(filename=filename)
+
+
+# Complemento do prompt de análise quando vários documentos pequenos vão numa única chamada
+PROMPT_ANALISE_LOTE = """
+# ANÁLISE EM LOTE
+Esta requisição contém {n} documentos DISTINTOS do mesmo processo, cada um (PDF, ou texto extraído com marcadores de página) precedido por um marcador `DOCUMENTO idDocumento=<id>`.
+Analise cada documento isoladamente, como se fosse o único arquivo, seguindo todas as regras acima; a numeração de páginas é a de cada documento.
+Esta instrução substitui a instrução final de formatação: responda com **APENAS** um array JSON com um objeto por documento, na ordem dos marcadores, cada um na estrutura obrigatória acima e com "idDocumento" igual ao id do seu marcador. A resposta deve começar com `[` e terminar com `]`.
+"""
+
+
+def parte_pdf_gemini(recorte):
+    """
+    Parte do conteúdo com o PDF do recorte: inline se couber na requisição,
+    senão enviado pela File API a partir do arquivo em disco. Retorna (parte, arquivo_enviado).
+    """
+    if recorte.inline:
+        return {"mime_type": "application/pdf", "data": recorte.dados}, None
+
+    logger.info(f"Uploading {recorte.tamanho / 1024 / 1024:.1f}MB sub-document through the Gemini File API")
+    arquivo = genai.upload_file(path=recorte.caminho, mime_type="application/pdf")
+    while arquivo.state.name == "PROCESSING":
+        time.sleep(2)
+        arquivo = genai.get_file(arquivo.name)
+    if arquivo.state.name != "ACTIVE":
+        raise RuntimeError(f"Gemini File API upload failed: {arquivo.name} ({arquivo.state.name})")
+    return arquivo, arquivo
+
+
+def partes_gemini(recorte):
+    """
+    Partes do conteúdo para um Recorte (o PDF) ou um PayloadTexto (textos com marcadores de
+    página e PDFs só dos trechos com imagem). Retorna (partes, arquivos_enviados à File API).
+    """
+    partes, enviados = [], []
+    for item in (recorte.partes if isinstance(recorte, PayloadTexto) else [recorte]):
+        if isinstance(item, str):
+            partes.append(item)
+            continue
+        parte, arquivo_enviado = parte_pdf_gemini(item)
+        partes.append(parte)
+        if arquivo_enviado is not None:
+            enviados.append(arquivo_enviado)
+    return partes, enviados
+
+
+def analisar_subdocumento(model, prompt_analise, recorte, tokens_estimados=0, nome_modelo=MODEL_PRO_NAME):
+    """
+    Chamada Gemini Pro para um recorte (ou PayloadTexto). Executada nas threads do pool de análise.
+    Retorna (dados_extraidos, tier_do_cache); em um acerto de cache o modelo não é chamado.
+    Recortes em disco (e os arquivos enviados à File API) são descartados ao final.
+    """
+    try:
+        # Recortes idênticos (mesmas páginas re-enviadas em outros jobs) reaproveitam a análise
+        chave = chave_cache(recorte.sha256(), nome_modelo, PROMPT_ANALISE_VERSAO)
+        try:
+            dados, tier = cache_analises.get(chave)
+            if dados is not None:
+                return dados, tier
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+
+        partes, arquivos_enviados = partes_gemini(recorte)
+        try:
+            response_analise = gerar_conteudo(model, nome_modelo, [
+                prompt_analise,
+                *partes
+            ], {"response_mime_type": "application/json", "temperature": 0.0},
+                tokens_estimados=tokens_estimados + len(prompt_analise) // CARACTERES_POR_TOKEN)
+        finally:
+            for arquivo_enviado in arquivos_enviados:
+                try:
+                    genai.delete_file(arquivo_enviado.name)
+                except Exception as e:
+                    logger.warning(f"Failed to delete Gemini file {arquivo_enviado.name}: {e}")
+        dados = json.loads(response_analise.text)
+    finally:
+        recorte.descartar()
+
+    try:
+        cache_analises.set(chave, dados, modelo=nome_modelo, versao_prompt=PROMPT_ANALISE_VERSAO)
+    except Exception as e:
+        logger.warning(f"Result cache write failed: {e}")
+    return dados, None
+
+
+def analisar_lote(model, prompt_analise, itens, nome_modelo=MODEL_PRO_NAME):
+    """
+    Uma chamada Gemini Pro para vários sub-documentos pequenos (ver batching.planejar_lotes).
+    `itens` é a lista [(id_documento, recorte, tokens_estimados)] com recortes (ou PayloadTexto) inline.
+    Retorna ([(dados_extraidos, tier) ou None por item], chamadas_individuais_de_fallback).
+    Itens em cache não vão ao modelo; itens que a resposta não cobre (todos, se ela não puder
+    ser lida) são analisados individualmente.
+    """
+    resultados = [None] * len(itens)
+    pendentes = []
+    for i, (doc_id, recorte, _) in enumerate(itens):
+        dados = None
+        try:
+            dados, tier = cache_analises.get(chave_cache(recorte.sha256(), nome_modelo, PROMPT_ANALISE_VERSAO))
+        except Exception as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+        if dados is not None:
+            resultados[i] = (dados, tier)
+        else:
+            pendentes.append(i)
+
+    por_id = {}
+    if len(pendentes) > 1:
+        conteudo = [prompt_analise + PROMPT_ANALISE_LOTE.format(n=len(pendentes))]
+        for i in pendentes:
+            doc_id, recorte, _ = itens[i]
+            conteudo.append(f"DOCUMENTO idDocumento={doc_id}")
+            conteudo.extend(partes_gemini(recorte)[0])
+        try:
+            tokens_estimados = sum(itens[i][2] for i in pendentes) + len(conteudo[0]) // CARACTERES_POR_TOKEN
+            response_analise = gerar_conteudo(model, nome_modelo, conteudo,
+                                              {"response_mime_type": "application/json", "temperature": 0.0},
+                                              tokens_estimados=tokens_estimados)
+            por_id = separar_resposta_lote(response_analise.text, [itens[i][0] for i in pendentes])
+        except Exception as e:
+            logger.warning(f"Batch analysis of {len(pendentes)} sub-documents failed ({e}). Falling back to single calls")
+
+    fallbacks = 0
+    for i in pendentes:
+        doc_id, recorte, tokens_task = itens[i]
+        dados = por_id.get(doc_id)
+        if dados is not None:
+            try:
+                cache_analises.set(chave_cache(recorte.sha256(), nome_modelo, PROMPT_ANALISE_VERSAO), dados,
+                                   modelo=nome_modelo, versao_prompt=PROMPT_ANALISE_VERSAO)
+            except Exception as e:
+                logger.warning(f"Result cache write failed: {e}")
+            resultados[i] = (dados, None)
+            continue
+        if len(pendentes) > 1:
+            fallbacks += 1
+        try:
+            resultados[i] = analisar_subdocumento(model, prompt_analise, recorte, tokens_task, nome_modelo)
+        except Exception as e:
+            logger.error(f"Error processing sub-doc task {doc_id}: {e}")
+    return resultados, fallbacks
+
+
+def tokens_da_resposta(response):
+    return response.usage_metadata.total_token_count
+
+
+def gerar_conteudo(model, nome_modelo, conteudo, generation_config, tokens_estimados=0):
+    """generate_content pelo limitador compartilhado do modelo (cotas RPM/TPM, AIMD e retentativas)."""
+    return limitadores_gemini[nome_modelo].chamar(
+        lambda: model.generate_content(conteudo, generation_config=generation_config),
+        tokens_estimados=tokens_estimados, tokens_da_resposta=tokens_da_resposta)
+
+
+def executar_cronometrado(funcao, *args):
+    """Executa `funcao` (numa thread do pool) e devolve (resultado, segundos)."""
+    t0 = time.perf_counter()
+    return funcao(*args), time.perf_counter() - t0
+
+
+def montar_documento_final(meta, pages, dados_extraidos):
+    # FLATTENING & MERGING
+    # O usuário quer que o resultado do Gemini fique 'ao lado' dos metadados, e não aninhado.
+    # Vamos combinar os metadados originais com o resultado do Gemini.
+    
+    final_doc = {}
+    # Prioridade: Dados do Gemini > Metadados do Sumário
+    final_doc.update(meta) # id_documento, tipo_original, data do sumário
+    final_doc.update(dados_extraidos) # idDocumento, tipoDocumentoGeral, etc do Gemini
+    
+    # Ajustes finos
+    final_doc['paginas_pdf'] = pages  # indices das paginas
+    final_doc['analisado_em'] = firestore.SERVER_TIMESTAMP
+    final_doc['status'] = 'Sucesso'
+    return final_doc
+
+
+def chave_documento(base_id, seen_doc_ids):
+    """Chave única no Firestore para `base_id`, numerando repetições (12345, 12345_1, ...)."""
+    # Limpar caracteres inválidos para ID de documento firestore
+    chave = safe_id(base_id)
+    
+    count = seen_doc_ids.get(chave, 0)
+    seen_doc_ids[chave] = count + 1
+    
+    if count > 0:
+        return f"{chave}_{count}" # ex: 12345_1
+    return chave
+
+
+def blob_de_caminho(file_path_gs):
+    """gs://bucket/caminho -> Blob."""
+    bucket_name = file_path_gs.split('/')[2]
+    blob_name = '/'.join(file_path_gs.split('/')[3:])
+    return storage_client.bucket(bucket_name).blob(blob_name)
+
+
+def disparar_consolidacao(parent_id):
+    """
+    Dispara a consolidação do processo, agregada com a de outros jobs que terminam na mesma
+    janela (um POST com vários process_ids). Espera o envio do lote. Falhas não derrubam o job.
+    """
+    try:
+        # Precisamos enviar o ID do PAI (que pode ser o numero do processo ou o jobId original)
+        tamanho_lote = agregador_consolidacao.adicionar(parent_id).result(timeout=CONSOLIDACAO_ESPERA_S)
+        logger.info(f"Consolidation triggered for {parent_id} (batch of {tamanho_lote}).")
+
+    except Exception as e_cons:
+        # Não falha o job principal se o trigger falhar
+        logger.error(f"Failed to trigger consolidation for {parent_id}: {e_cons}")
+
+
+def remover_arquivo_original(file_path_gs):
+    """5. Cleanup: Deletar arquivo original do Bucket"""
+    try:
+        logger.info(f"Cleanup: Deleting file {file_path_gs}")
+        blob_de_caminho(file_path_gs).delete()
+        logger.info("Cleanup: File deleted successfully.")
+    except Exception as e:
+        logger.warning(f"Cleanup: Failed to delete file {file_path_gs}. Error: {e}")
+
+
+# --- FAN-OUT / FAN-IN ---
+
+def iniciar_fanout(job_id, file_path_gs, parent_id, recortador, pending_tasks, seen_doc_ids, escritor, ja_iniciado, lease=None):
+    """
+    Em vez de analisar no loop local, grava o recorte de cada sub-documento em
+    gs://.../partes/{job_id}/{indice}.pdf e cria uma Cloud Task por parte (ROTA_WORKER_PARTE).
+    As chaves no Firestore são definidas aqui, na ordem das tasks, a partir do ID do sumário.
+    As tasks são nomeadas, então uma reentrega deste coordenador não duplica partes.
+    O `lease` do processo passa para as partes, com a validade longa do fan-out: cada uma
+    renova ao começar e ao terminar, e a última o libera.
+    """
+    bucket_name = file_path_gs.split('/')[2]
+    bucket = storage_client.bucket(bucket_name)
+    doc_ref = db.collection('analises_processos').document(job_id)
+    filename = file_path_gs.split('/')[-1]
+
+    partes = []
+    for task in pending_tasks:
+        base_id = task['meta'].get('id_documento') or 'doc_desconhecido'
+        partes.append((task, chave_documento(base_id, seen_doc_ids)))
+
+    if not ja_iniciado:
+        escritor.update(doc_ref, {
+            'modo': 'FANOUT',
+            'status': 'PROCESSANDO_PARTES',
+            'parent_id': parent_id,
+            'arquivo_original': file_path_gs,
+            'partes_total': len(partes),
+            'partes_finalizadas': 0,
+            'partes_finalizadas_ids': [],
+            'partes_com_erro': [],
+            'fan_in_concluido': False,
+        }, imediato=True)
+    if lease:
+        # Sem o coordenador pulsando, o lease precisa durar até as partes começarem a renová-lo
+        lease.ttl_s = LEASE_TTL_FANOUT_S
+        lease.pulsar(forcar=True)
+        escritor.update(doc_ref, {'lease_execucao': lease.execucao}, imediato=True)
+
+    logger.info(f"Fan-out: enqueuing {len(partes)} part tasks for job {job_id}")
+    for task, doc_key in partes:
+        indice = task['indice']
+        parte_path = f"partes/{job_id}/{indice}.pdf"
+        recorte = recortador.recortar(task['pages'])
+        try:
+            if recorte.inline:
+                bucket.blob(parte_path).upload_from_string(recorte.dados, content_type='application/pdf')
+            else:
+                bucket.blob(parte_path).upload_from_filename(recorte.caminho, content_type='application/pdf')
+        finally:
+            recorte.descartar()
+
+        payload = {
+            'jobId': job_id,
+            'parentId': parent_id,
+            'indice': indice,
+            'parteFilePath': f"gs://{bucket_name}/{parte_path}",
+            'filename': filename,
+            'meta': task['meta'],
+            'pages': task['pages'],
+            'docKey': doc_key,
+            'modelo': task.get('modelo', MODEL_PRO_NAME),
+            'leaseExecucao': lease.execucao if lease else None,
+        }
+        try:
+            enqueue_process_task(payload, rota=ROTA_WORKER_PARTE, nome=f"{job_id}-parte-{indice}")
+        except (AlreadyExists, TarefaDuplicada):
+            logger.info(f"Part {indice} of job {job_id} was already enqueued")
+
+
+def processar_parte(payload, tentativa=0):
+    """
+    Worker do fan-out: analisa uma parte, grava o resultado e registra a conclusão.
+    Erros são relançados (para o Cloud Tasks reentregar) até FANOUT_MAX_TENTATIVAS;
+    na última tentativa a parte é registrada como falha para o fan-in não travar.
+    """
+    job_id = payload['jobId']
+    indice = payload['indice']
+    filename = payload['filename']
+    sucesso = False
+    pulsar_lease_parte(payload)
+    try:
+        recorte = recorte_de_bytes(blob_de_caminho(payload['parteFilePath']).download_as_bytes())
+        nome_modelo = payload.get('modelo', MODEL_PRO_NAME)
+        dados_extraidos, tier = analisar_subdocumento(genai.GenerativeModel(nome_modelo), montar_prompt_analise(filename),
+                                                      recorte, nome_modelo=nome_modelo)
+        if tier:
+            dados_extraidos = dict(dados_extraidos, nomeArquivoOriginal=filename)
+
+        final_doc = montar_documento_final(payload['meta'], payload['pages'], dados_extraidos)
+        db.collection(f"analises_processos/{payload['parentId']}/documentos_analisados").document(payload['docKey']).set(final_doc)
+        cache_processados.adicionar(payload['parentId'], [final_doc.get('idDocumento'), final_doc.get('id_documento')])
+        sucesso = True
+        pulsar_lease_parte(payload)
+    except Exception as e:
+        if tentativa + 1 < FANOUT_MAX_TENTATIVAS:
+            raise
+        logger.error(f"Part {indice} of job {job_id} failed permanently: {e}")
+
+    job_ref = db.collection('analises_processos').document(job_id)
+    ultimo, job_data = registrar_parte_finalizada(job_ref, indice, sucesso)
+    if ultimo:
+        finalizar_fanout(job_id, job_data)
+
+
+def pulsar_lease_parte(payload):
+    """Renova o lease do processo em nome do job do fan-out (ao começar e ao terminar uma parte)."""
+    if not payload.get('leaseExecucao'):
+        return
+    try:
+        LeaseProcesso(db, firestore, payload['parentId'], payload['jobId'], execucao=payload['leaseExecucao'],
+                      ttl_s=LEASE_TTL_FANOUT_S).pulsar(forcar=True)
+    except LeasePerdido as e:
+        logger.warning(f"Part {payload['indice']} of job {payload['jobId']}: {e}")
+
+
+def registrar_parte_finalizada(job_ref, indice, sucesso):
+    """
+    Fan-in: marca a parte como finalizada numa transação no documento do job.
+    Idempotente para reentregas da mesma parte. Retorna (ultimo, dados_do_job), onde
+    `ultimo` é True para exatamente uma parte: a que completou o conjunto.
+    """
+    @firestore.transactional
+    def _registrar(transaction):
+        snapshot = job_ref.get(transaction=transaction)
+        job_data = snapshot.to_dict()
+        finalizadas = job_data.get('partes_finalizadas_ids', [])
+        if indice in finalizadas:
+            return False, job_data
+
+        finalizadas = finalizadas + [indice]
+        total = job_data.get('partes_total') or len(finalizadas)
+        updates = {
+            'partes_finalizadas_ids': finalizadas,
+            'partes_finalizadas': len(finalizadas),
+            'progresso': 50 + int((len(finalizadas) / total) * 50),
+        }
+        if not sucesso:
+            updates['partes_com_erro'] = job_data.get('partes_com_erro', []) + [indice]
+        ultimo = len(finalizadas) >= total and not job_data.get('fan_in_concluido')
+        if ultimo:
+            updates['fan_in_concluido'] = True
+        transaction.update(job_ref, updates)
+        job_data.update(updates)
+        return ultimo, job_data
+
+    # Muitas partes terminam juntas: mais tentativas para a contenção no documento do job
+    return _registrar(db.transaction(max_attempts=25))
+
+
+def finalizar_fanout(job_id, job_data):
+    """Executado uma única vez, pela última parte: conclui o job, consolida e limpa arquivos."""
+    parent_id = job_data.get('parent_id') or job_id
+    logger.info(f"Fan-in: all {job_data.get('partes_total')} parts of job {job_id} finished ({len(job_data.get('partes_com_erro', []))} with errors)")
+
+    escritor = EscritorFirestore(db)
+    escritor.update(db.collection('analises_processos').document(job_id), {'status': 'CONCLUIDO', 'progresso': 100})
+    if parent_id != job_id:
+        escritor.update(db.collection('analises_processos').document(parent_id), {'status': 'CONCLUIDO', 'progresso': 100})
+    checkpoints = JobCheckpoints(db, job_id, escritor=escritor)
+    checkpoints.carregar()
+    checkpoints.limpar()
+    escritor.flush()
+
+    if job_data.get('lease_execucao'):
+        liberar_lease(LeaseProcesso(db, firestore, parent_id, job_id, execucao=job_data['lease_execucao']))
+
+    disparar_consolidacao(parent_id)
+
+    file_path_gs = job_data.get('arquivo_original')
+    if file_path_gs:
+        remover_arquivo_original(file_path_gs)
+        bucket = storage_client.bucket(file_path_gs.split('/')[2])
+        for blob in bucket.list_blobs(prefix=f"partes/{job_id}/"):
+            try:
+                blob.delete()
+            except Exception as e:
+                logger.warning(f"Cleanup: Failed to delete part file {blob.name}. Error: {e}")
+
+
+def encerrar_com_erro(job_id, escritor, checkpoints):
+    """
+    Fim de um job com erro terminal (o worker responde 200 e a tarefa não é reentregue): grava os
+    resultados ainda no buffer e remove os checkpoints, que nenhuma execução vai retomar.
+    """
+    if checkpoints is not None:
+        checkpoints.limpar()
+    try:
+        # Não perde resultados já analisados que ainda estavam no buffer
+        escritor.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush pending writes for job {job_id}: {e}")
+
+def processar_pdf(job_id, file_path_gs, payload=None, tentativa=0):
     """
     1. Baixar PDF
     2. Identificar Sumário (Gemini 1)
     3. Mapear Páginas (Regex)
     4. Recortar e Analisar (Gemini 2)
     5. Salvar Resultados
+    `payload` é o da tarefa; se o processo estiver com outro job, é reenfileirado para depois dele.
+    `tentativa` é a entrega (0 = primeira): erros transitórios relançam até JOB_MAX_TENTATIVAS.
     """
     logger.info(f"Iniciando job {job_id} para {file_path_gs}")
     doc_ref = db.collection('analises_processos').document(job_id)
+    payload = payload or {'jobId': job_id, 'filePath': file_path_gs}
+    spool_path = None
+    doc = None
+    # Lease do processo (numero_processo): liberado no fim, ou pela última parte no fan-out
+    lease = None
+    lease_transferido = False
+    checkpoints = None
+    # Pico de memória deste job por amostragem (o VmHWM é do processo, compartilhado entre jobs)
+    amostrador_rss = AmostradorRSS().iniciar()
+    # Escritas do job em lotes (resultados, checkpoints e progresso) + contagem de RPCs
+    escritor = EscritorFirestore(db)
+    # Duração, bytes e contagens por etapa: logs estruturados + mapa `metricas` no documento do job
+    rastreador = RastreadorEtapas(job_id)
+    inicio_job = time.perf_counter()
     
     try:
+        # Reentrega de um job já concluído (ex.: timeout na resposta ao Cloud Tasks)
+        job_snapshot = doc_ref.get()
+        escritor.contar_leituras()
+        if job_snapshot.exists and job_snapshot.to_dict().get('status') == 'CONCLUIDO':
+            logger.info(f"Job {job_id} already completed. Ignoring redelivery.")
+            return
+
+        # Checkpoints de uma execução anterior interrompida deste mesmo job
+        checkpoints = JobCheckpoints(db, job_id, escritor=escritor)
+        etapas_salvas = checkpoints.carregar()
+        if etapas_salvas:
+            logger.info(f"Resuming job {job_id} from checkpoints: {etapas_salvas}")
+
         # 1. Baixar PDF
         logger.info("Step 1: Downloading PDF from GCS")
-        bucket_name = file_path_gs.split('/')[2]
-        blob_name = '/'.join(file_path_gs.split('/')[3:])
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
+        blob = blob_de_caminho(file_path_gs)
         
-        pdf_bytes = blob.download_as_bytes()
-        logger.info(f"PDF Downloaded from GCS. Size: {len(pdf_bytes)} bytes")
+        # Download em blocos direto para disco (com verificação de checksum); o PDF é aberto
+        # pelo caminho e o mesmo arquivo é usado pelos workers do mapeamento paralelo.
+        with rastreador.etapa('download') as medicao:
+            spool_path, pdf_size = baixar_blob_para_arquivo(blob)
+            medicao['bytes'] = pdf_size
+        logger.info(f"PDF Downloaded from GCS. Size: {pdf_size} bytes")
         
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        with rastreador.etapa('abertura') as medicao:
+            doc = fitz.open(spool_path)
+            medicao['paginas'] = len(doc)
         logger.info(f"PDF Opened with Fitz. Is Encrypted: {doc.is_encrypted}. Page Count: {len(doc)}")
         
         if len(doc) == 0:
              logger.error("PDF has 0 pages. Check if the file is corrupted or empty.")
-             doc_ref.update({'status': 'ERRO', 'erro': 'O arquivo PDF parece estar vazio ou corrompido.'})
+             escritor.update(doc_ref, {'status': 'ERRO', 'erro': 'O arquivo PDF parece estar vazio ou corrompido.'}, imediato=True)
              return
         
         if doc.is_encrypted:
             logger.error("PDF is encrypted")
-            doc_ref.update({'status': 'ERRO', 'erro': 'Arquivo protegido por senha'})
+            escritor.update(doc_ref, {'status': 'ERRO', 'erro': 'Arquivo protegido por senha'}, imediato=True)
             return
 
-        doc_ref.update({'progresso': 10})
+        escritor.update(doc_ref, {'progresso': 10}, imediato=True)
 
-        # 2. Identificar Sumário (Gemini Flash)
-        # Pega 5 primeiras e 10 últimas
-        logger.info(f"Step 2: Identifying Index. Total pages: {len(doc)}")
-        pages_to_scan = list(range(min(5, len(doc))))
-        if len(doc) > 10:
-             pages_to_scan += list(range(len(doc)-10, len(doc)))
-        
-        extracted_text_images = []
-        for p_num in pages_to_scan:
-            page = doc[p_num]
-            # Extrair texto ou imagem. Vamos de texto para economizar token, imagem se precisar
-            text = page.get_text()
-            extracted_text_images.append(f"--- PÁGINA {p_num} ---\n{text}")
-
-        full_context = "\n".join(extracted_text_images)
-        
-        model_flash = genai.GenerativeModel('gemini-2.5-flash') 
-        # Melhoria no Prompt para ser mais permissivo e explicativo
-        prompt_sumario = """
-        Você é um auditor jurídico experiente. Sua tarefa é identificar a tabela de índice ou lista de documentos neste PDF.
-        Também tente encontrar o NÚMERO DO PROCESSO (formato NNNNNNN-DD.AAAA.J.TR.OOOO).
+        # Texto de cada página é extraído uma única vez e reaproveitado nos Steps 2 e 3
+        textos = PageTextCache(doc, fonte=spool_path)
+        # Páginas digitalizadas (sem camada de texto): imagem no Step 2, OCR do rodapé no Step 3
+        renderizador = RenderizadorPaginas(doc, fonte=spool_path, cache=cache_paginas)
 
-        Geralmente encontrada nas primeiras ou últimas páginas.
-        Procure por:
-        - Tabela com colunas 'Id', 'Documento', 'Data'.
-        - Lista sequencial de peças processuais.
-        - Cabeçalho ou linha contendo "Índice", "Sumário", "Peças".
+        sumario_salvo = checkpoints.get(ETAPA_SUMARIO)
+        if sumario_salvo:
+            logger.info("Step 2: Index restored from checkpoint")
+            documentos_listados = sumario_salvo['documentos']
+            numero_processo = sumario_salvo['numero_processo']
+            info_sumario = sumario_salvo['info']
+            full_context = ""
+        else:
+            # 2. Identificar Sumário (Gemini Flash)
+            # Pega 5 primeiras e 10 últimas
+            logger.info(f"Step 2: Identifying Index. Total pages: {len(doc)}")
+            pages_to_scan = list(range(min(5, len(doc))))
+            if len(doc) > 10:
+                 pages_to_scan += list(range(len(doc)-10, len(doc)))
+        
+            with rastreador.etapa('indice', paginas=len(pages_to_scan)) as medicao:
+                extracted_text_images = []
+                for p_num in pages_to_scan:
+                    # Extrair texto ou imagem. Vamos de texto para economizar token, imagem se precisar
+                    text = textos.get(p_num)
+                    extracted_text_images.append(f"--- PÁGINA {p_num} ---\n{text}")
 
-        Se encontrar, extraia TODOS os documentos listados.
-        Se a imagem/texto não tiver qualidade ou não for um índice, retorne lista vazia [].
+                full_context = "\n".join(extracted_text_images)
 
-        Saída Obrigatória (JSON):
-        {
-          "numero_processo": "string ou null",
-          "documentos": [
-             { "id_documento": "string ou null", "tipo_original": "string", "data": "string ou null" }
-          ]
-        }
-        """
-        
-        response_sumario = model_flash.generate_content([prompt_sumario, full_context], generation_config={"response_mime_type": "application/json", "temperature": 0.2})
-        logger.info(f"Raw Gemini response for Index: {response_sumario.text}")
-        
-        documentos_listados = []
-        numero_processo = None
-        
-        try:
-            data_sumario = json.loads(response_sumario.text)
-            # Suporte a formatos antigos ou novos da resposta
-            if isinstance(data_sumario, list):
-                documentos_listados = data_sumario
-            elif isinstance(data_sumario, dict):
-                documentos_listados = data_sumario.get('documentos', [])
-                numero_processo = data_sumario.get('numero_processo')
-        except json.JSONDecodeError:
-             logger.error(f"Failed to parse JSON from Gemini: {response_sumario.text}")
+                digitalizadas = renderizador.sem_texto(textos, pages_to_scan)
+                imagens = [(p_num, imagem, renderizador.hash(p_num))
+                           for p_num, imagem in sorted(renderizador.renderizar(digitalizadas).items())]
+            
+                documentos_listados, numero_processo, info_sumario = identificar_sumario(full_context, imagens)
+                medicao['caracteres'] = len(full_context)
+                medicao['imagens'] = len(imagens)
+                medicao['documentos'] = len(documentos_listados or [])
+            if documentos_listados:
+                checkpoints.salvar(ETAPA_SUMARIO, {
+                    'documentos': documentos_listados,
+                    'numero_processo': numero_processo,
+                    'info': info_sumario,
+                })
 
         logger.info(f"Process Number found: {numero_processo}")
         logger.info(f"Index found: {len(documentos_listados)} documents")
@@ -397,90 +1242,99 @@ def processar_pdf(job_id, file_path_gs):
                 
                 # ID do PAI real (Processo)
                 parent_doc_ref = db.collection('analises_processos').document(parent_id)
-                parent_snapshot = parent_doc_ref.get()
 
                 # --- CONCURRENCY SAFEGUARD ---
-                if parent_snapshot.exists:
-                    parent_data = parent_snapshot.to_dict()
-                    current_status = parent_data.get('status')
-                    last_update = parent_data.get('data_criacao') # ou analisado_em
-                    
-                    # Se já está processando por OUTRO job (não este) e foi recente (< 10 min)
-                    if current_status == 'PROCESSANDO' and parent_data.get('origem_job_id') != job_id:
-                        # Verifica se é muito antigo (zumbi)
-                        if last_update:
-                            # Se for Timestamp do firestore, converte. Se for muito recente, aborta este.
-                            # Simplificado: Se status é processando e tem origem diferente, assume duplicação.
-                            logger.warning(f"Process {parent_id} is already being processed by job {parent_data.get('origem_job_id')}. Aborting redundancy.")
-                            doc_ref.update({'status': 'REDUNDANTE_ABORTADO', 'info': f'Já sendo processado por {parent_data.get("origem_job_id")}'})
-                            return
-
-                # Se passou, assume a liderança
-                parent_doc_ref.set({
-                    'status': 'PROCESSANDO', 
+                # Um job por processo: lease transacional com expiração, renovado pelo loop de análise.
+                # Quem chega depois espera o dono (é reenfileirado), e lease de job morto é assumido.
+                lease = LeaseProcesso(db, firestore, parent_id, job_id)
+                # Cada espera tem a própria tarefa de segurança (nome único), cancelada quando o job é acordado
+                tarefa_espera = dict(payload, espera=payload.get('espera', 0) + 1)
+                aquisicao = lease.adquirir(tarefa=tarefa_espera, processo_ref=parent_doc_ref, dados_processo={
+                    'status': 'PROCESSANDO',
                     'data_criacao': firestore.SERVER_TIMESTAMP,
                     'numero_processo': numero_processo,
                     'origem_job_id': job_id
-                }, merge=True)
-                
+                })
+                escritor.contar_leituras()
+                if not aquisicao.adquirido and aquisicao.dono == job_id:
+                    # Outra execução deste job já é a dona (tarefa de segurança que escapou do
+                    # cancelamento): não mexe no status nem volta a esperar
+                    logger.info(f"Job {job_id} already owns process {parent_id} in another run. Dropping this delivery.")
+                    return
+                if not aquisicao.adquirido:
+                    # O dono reenfileira este job ao liberar; o atraso só vale se o dono morrer
+                    atraso = lease.atraso_espera(aquisicao)
+                    lease = None
+                    logger.info(f"Process {parent_id} is being processed by job {aquisicao.dono}. "
+                                f"Job {job_id} will run after it (retry in {atraso:.0f}s if not woken).")
+                    escritor.update(doc_ref, {'status': 'AGUARDANDO_PROCESSO', 'info': f'Aguardando o job {aquisicao.dono}'}, imediato=True)
+                    try:
+                        reenfileirar_job(tarefa_espera, atraso_s=atraso, nome=nome_espera(tarefa_espera))
+                    except (AlreadyExists, TarefaDuplicada):
+                        logger.info(f"Safety-net task for job {job_id} was already created")
+                    return
+
                 logger.info(f"Redirecting output to Process ID: {parent_id}")
 
         if not documentos_listados:
              logger.warning("No index found in the supplied context. Context sample: " + full_context[:200])
-             doc_ref.update({'status': 'ERRO', 'erro': 'Sumário não encontrado. Verifique se o PDF possui um índice nas 5 primeiras ou 10 últimas páginas.'})
+             escritor.update(doc_ref, {'status': 'ERRO', 'erro': 'Sumário não encontrado. Verifique se o PDF possui um índice nas 5 primeiras ou 10 últimas páginas.'}, imediato=True)
              return
 
-        doc_ref.update({'progresso': 30, 'numero_processo_detectado': numero_processo})
+        atualizacao = {'progresso': 30, 'numero_processo_detectado': numero_processo, 'sumario': info_sumario}
+        if job_snapshot.exists and job_snapshot.to_dict().get('status') == 'AGUARDANDO_PROCESSO':
+            # Esperou outro job do mesmo processo e agora é o dono
+            atualizacao.update(status='PROCESSANDO', info=f'Processo {parent_id} liberado')
+        escritor.update(doc_ref, atualizacao, imediato=True)
 
         # 3. Mapeamento Físico (Regex)
-        logger.info("Step 3: Regex Mapping")
-        mapa_paginas = {} # id -> [indices]
-        
-        regex_trf = re.compile(r"Num\.\s+(\d{9,})")
-        regex_trt = re.compile(r"-\s+([a-f0-9]{7})\s*$")
+        mapa_paginas = checkpoints.get(ETAPA_MAPA) # id -> [indices]
+        if mapa_paginas is not None:
+            logger.info("Step 3: Page map restored from checkpoint")
+        else:
+            logger.info("Step 3: Regex Mapping")
+            with rastreador.etapa('mapeamento', paginas=len(doc)) as medicao:
+                mapa_paginas = mapear_paginas(textos, renderizador)
+                medicao['documentos'] = len(mapa_paginas)
+                medicao['ocr_paginas'] = renderizador.ocr_paginas
+            logger.info(f"Page text extraction: {textos.resumo_tempos()}")
+            if renderizador.renderizadas or renderizador.acertos_cache:
+                logger.info(f"Scanned page rendering: {renderizador.resumo()}")
 
-        for i, page in enumerate(doc):
-            text = page.get_text()
-            
-            # TRF Check
-            match_trf = regex_trf.search(text)
-            if match_trf:
-                doc_id = match_trf.group(1)
-                if doc_id not in mapa_paginas: mapa_paginas[doc_id] = []
-                mapa_paginas[doc_id].append(i)
-                continue
-            
-            # TRT Check
-            match_trt = regex_trt.search(text)
-            if match_trt:
-                doc_id = match_trt.group(1)
-                # Normalização: As vezes o índice do sumário usa parte do hash ou ele todo
-                if doc_id not in mapa_paginas: mapa_paginas[doc_id] = []
-                mapa_paginas[doc_id].append(i)
-
-        doc_ref.update({'progresso': 50})
+            # Páginas digitalizadas que nem o OCR do rodapé identificou (OCR desligado ou sem leitura)
+            mapeadas = {p for paginas in mapa_paginas.values() for p in paginas}
+            digitalizadas_sem_id = [p for p in renderizador.sem_texto(textos) if p not in mapeadas]
+            if digitalizadas_sem_id:
+                aviso = (f"{len(digitalizadas_sem_id)} de {len(doc)} páginas digitalizadas (sem camada de texto) "
+                         f"não puderam ser associadas a documentos do índice.")
+                logger.warning(f"{aviso} OCR: {renderizador.motor_ocr or 'desligado'}")
+                if not mapa_paginas:
+                    encerrar_com_erro(job_id, escritor, checkpoints)
+                    escritor.update(doc_ref, {'status': 'ERRO', 'erro': f"PDF digitalizado: {aviso}"}, imediato=True)
+                    return
+                escritor.update(doc_ref, {'aviso': aviso, 'paginas_digitalizadas_nao_mapeadas': len(digitalizadas_sem_id)})
+            checkpoints.salvar(ETAPA_MAPA, mapa_paginas)
+
+        if lease:
+            lease.pulsar()
+        escritor.update(doc_ref, {'progresso': 50}, imediato=True)
         
         # 4. Cruzamento e Análise Individual
-        model_pro = genai.GenerativeModel('gemini-2.5-pro') 
+        model_pro = genai.GenerativeModel(MODEL_PRO_NAME) 
         
         tasks_found = []
+        indice_documentos = IndiceDocumentos(mapa_paginas)
         
         # Iterar sobre o que achamos no sumário
         for item in documentos_listados:
             extracted_doc_id = item.get('id_documento') # ID extraído do Sumário
             
-            # Tentar match exato ou parcial
-            found_pages = mapa_paginas.get(extracted_doc_id)
-            if not found_pages:
-                # Tentar match parcial (hashing as vezes trunca)
-                if extracted_doc_id:
-                    for k in mapa_paginas.keys():
-                        if extracted_doc_id in k or k in extracted_doc_id:
-                            found_pages = mapa_paginas[k]
-                            break
+            # Tentar match exato ou parcial (hashing as vezes trunca)
+            found_pages = indice_documentos.resolver(extracted_doc_id)
             
             if found_pages:
                 tasks_found.append({
+                    'indice': len(tasks_found), # posição estável, usada no checkpoint
                     'meta': item,
                     'pages': found_pages
                 })
@@ -489,25 +1343,32 @@ def processar_pdf(job_id, file_path_gs):
         logger.info(f"Step 4: Processing {total_tasks} tasks (documents matched)")
         processed_count = 0
         
-        # DEDUPLICAÇÃO: Buscar documentos já analisados neste processo
-        existing_docs_ref = db.collection(f"analises_processos/{parent_id}/documentos_analisados")
-        existing_docs = existing_docs_ref.select(['idDocumento', 'id_documento']).stream()
-        
-        already_processed_ids = set()
-        for d in existing_docs:
-            data = d.to_dict()
-            if data.get('idDocumento'): already_processed_ids.add(str(data.get('idDocumento')))
-            if data.get('id_documento'): already_processed_ids.add(str(data.get('id_documento')))
+        # DEDUPLICAÇÃO: consulta só os IDs candidatos deste job (não a subcoleção inteira)
+        with rastreador.etapa('dedup') as medicao:
+            deduplicador = Deduplicador(db, parent_id, cache_processados)
+            candidatos = [task['meta'].get('id_documento') for task in tasks_found]
+            already_processed_ids = deduplicador.ja_processados(candidatos)
+            escritor.contar_leituras(deduplicador.rpcs)
+            medicao.update(candidatos=len(candidatos), documentos=len(already_processed_ids),
+                           rpcs=deduplicador.rpcs, acertos_cache=deduplicador.acertos_cache)
             
-        logger.info(f"Deduplication: {len(already_processed_ids)} documents already processed for {parent_id}")
+        logger.info(f"Deduplication: {len(already_processed_ids)} of {len(candidatos)} candidate documents already processed "
+                    f"for {parent_id} ({deduplicador.rpcs} reads, {deduplicador.acertos_cache} from instance cache)")
+
+        # Tasks concluídas numa execução anterior deste job e a numeração de chaves já usada
+        estado_analise = checkpoints.get(ETAPA_ANALISE) or {}
+        concluidas = set(estado_analise.get('concluidas', []))
 
         # Usado para garantir doc_ids únicos no Firestore
-        seen_doc_ids = {}
+        seen_doc_ids = dict(estado_analise.get('seen_doc_ids', {}))
 
+        pending_tasks = []
         for task in tasks_found:
+            if task['indice'] in concluidas:
+                processed_count += 1
+                continue
+
             meta = task['meta']
-            pages = task['pages']
-            
             doc_id_candidate = meta.get('id_documento')
             
             # 1. Filtro de Duplicatas (Banco de dados)
@@ -519,197 +1380,278 @@ def processar_pdf(job_id, file_path_gs):
             # 2. Filtro de Duplicatas (Lista atual - Evitar processar o mesmo ID duas vezes neste loop)
             # Adiciona ao set para barrar repetições na mesma lista de tasks
             if doc_id_candidate:
-                if str(doc_id_candidate) in already_processed_ids:
-                     # Já pegou no if acima ou na iteração anterior
-                     continue
                 already_processed_ids.add(str(doc_id_candidate))
+            pending_tasks.append(task)
+
+        # Triagem: documentos sem interesse pericial não gastam chamadas Pro; atos processuais vão para o Flash.
+        # Os pulados ficam registrados (com o motivo) fora de documentos_analisados.
+        triagem = Triagem(textos)
+        estatisticas_triagem = EstatisticasTriagem()
+        modelos = {MODEL_PRO_NAME: model_pro, MODEL_FLASH_NAME: genai.GenerativeModel(MODEL_FLASH_NAME)}
+        seen_ignorados = {}
+        a_analisar = []
+        for task in pending_tasks:
+            decisao = triagem.decidir(task)
+            estatisticas_triagem.registrar(decisao.acao)
+            if decisao.acao == ACAO_PULAR:
+                logger.info(f"Triage: skipping {task['meta'].get('id_documento')} - {decisao.motivo}")
+                base_id = task['meta'].get('id_documento') or 'doc_desconhecido'
+                ignorado_ref = db.collection(f"analises_processos/{parent_id}/documentos_ignorados").document(
+                    chave_documento(base_id, seen_ignorados))
+                escritor.set(ignorado_ref, dict(task['meta'], paginas_pdf=task['pages'], motivo=decisao.motivo,
+                                                ignorado_em=firestore.SERVER_TIMESTAMP))
+                processed_count += 1
+                continue
+            task['triagem'] = decisao.acao
+            task['modelo'] = MODEL_FLASH_NAME if decisao.acao == ACAO_FLASH else MODEL_PRO_NAME
+            a_analisar.append(task)
+        pending_tasks = a_analisar
+
+        filename = file_path_gs.split('/')[-1]
+        prompt_analise = montar_prompt_analise(filename)
+        # IDs gravados por este job, por task; só entram no cache de dedup depois do commit final
+        analisados_por_task = {}
+
+        def salvar_resultado(task, dados_extraidos):
+            final_doc = montar_documento_final(task['meta'], task['pages'], dados_extraidos)
             
-            # Recorte Virtual
-            new_doc = fitz.open()
-            new_doc.insert_pdf(doc, from_page=min(pages), to_page=max(pages))
-            pdf_bytes_chunk = new_doc.tobytes()
+            # Garantir doc_id único para FIRESTORE KEY
+            # O ID pode ser o `idDocumento` retornado pelo Gemini ou o ID do sumário.
+            base_id = final_doc.get('idDocumento') or final_doc.get('id_documento') or 'doc_desconhecido'
+            doc_key = chave_documento(base_id, seen_doc_ids)
             
-            # Prompt Mestre Definido pelo Usuário
-            filename = file_path_gs.split('/')[-1]
-            prompt_analise = f"""
-CONTEXTO:
-Nome do Arquivo sendo analisado: {filename}
+            # Persistência
+            # Usando parent_id (que pode ser o numero do processo)
+            escritor.set(db.collection(f"analises_processos/{parent_id}/documentos_analisados").document(doc_key), final_doc,
+                         rotulo=task['indice'])
+            analisados_por_task[task['indice']] = [final_doc.get('idDocumento'), final_doc.get('id_documento')]
 
-# PERSONA E OBJETIVO MESTRE
+        def registrar_rejeitados():
+            # Resultado recusado pelo Firestore (ex.: documento acima de 1 MiB): só ele vai para a lista de erros
+            for indice in escritor.rejeitados():
+                concluidas.discard(indice)
+                analisados_por_task.pop(indice, None)
+                com_erro.append(tasks_found[indice]['meta'].get('id_documento'))
 
-Você é um Perito Médico, especialista em Medicina do Trabalho, altamente qualificado, trabalhando sob minha supervisão (Dr. Paulo Mapurunga). Sua missão é transformar um documento de processo da justiça federal em uma análise JSON estruturada, que servirá como base direta para a elaboração do meu laudo pericial. Siga rigorosamente a estrutura de saída.
+        # Todos os intervalos são conhecidos antes do loop: recortes repetidos são gerados uma vez
+        recortador = RecortadorPDF(doc, tamanho_arquivo=pdf_size, dir_temp=os.path.dirname(spool_path))
 
-# DIRETRIZ PRINCIPAL: ANÁLISE CONTEXTUAL
+        # Processos grandes: distribui as partes em Cloud Tasks (fan-out) e encerra este worker.
+        # A conclusão do job fica com a última parte (fan-in). Reentrega de um job já em fan-out
+        # continua nele mesmo com menos tasks pendentes que o limite: partes ainda estão em voo.
+        ja_iniciado = job_snapshot.exists and job_snapshot.to_dict().get('modo') == 'FANOUT'
+        if ja_iniciado or (FANOUT_MIN_TASKS and len(pending_tasks) >= FANOUT_MIN_TASKS):
+            recortador.planejar(task['pages'] for task in pending_tasks)
+            with rastreador.etapa('fanout', partes=len(pending_tasks)):
+                iniciar_fanout(job_id, file_path_gs, parent_id, recortador, pending_tasks, seen_doc_ids, escritor, ja_iniciado, lease)
+            lease_transferido = True
+            logger.info(f"Slicing: {recortador.resumo()}")
+            with rastreador.etapa('persistencia'):
+                escritor.flush()
+            return
 
-Não se limite a extrair dados isolados. Analise o documento no contexto de uma perícia médica. Busque por correlações, contradições e informações que ajudem a estabelecer ou afastar Incapacidade Laboral (Temporária/Permanente; Parcial/Total), ou Impedimento, no caso em questão.
+        # Páginas com boa camada de texto vão como texto extraído; só as com imagem vão em PDF
+        planejador = PlanejadorPayload(doc, textos)
+        planos = [planejador.planejar(task['pages']) for task in pending_tasks]
+        recortador.planejar(paginas for plano in planos for paginas in paginas_em_pdf(plano))
 
-# REGRAS DE PREENCHIMENTO E FILTRAGEM
+        # Documentos pequenos e vizinhos (procurações, certidões, despachos...) vão juntos numa só chamada
+        tokens_por_task = [plano.tokens_estimados for plano in planos]
+        lotes = planejar_lotes(pending_tasks, tokens_por_task)
 
-  * **Dados Ausentes:** Se uma informação específica para um campo do JSON não for encontrada no documento, preencha o campo com o valor `null` ou com uma string vazia `""`. **Não omita a chave.**
+        # Análise concorrente com no máximo GEMINI_MAX_CONCURRENCY chamadas em voo.
+        # O recorte (fitz) acontece sempre nesta thread, pois o PyMuPDF não é thread-safe;
+        # só a chamada ao Gemini vai para o pool. Os resultados chegam fora de ordem, mas são
+        # persistidos na ordem das tasks para que a numeração de seen_doc_ids seja determinística.
+        logger.info(f"Analyzing {len(pending_tasks)} sub-documents in {len(lotes)} requests with up to {GEMINI_MAX_CONCURRENCY} concurrent Gemini calls")
+        estatisticas_cache = EstatisticasCache()
+        estatisticas_lotes = EstatisticasLotes()
+        # Métricas do limitador são da instância; o delta aproxima as do job (exato com 1 job por instância)
+        gemini_antes = limitadores_gemini[MODEL_PRO_NAME].resumo()
+        com_erro = []  # sub-documentos que falharam mesmo após as retentativas
+        resultados = {}  # indice da task -> dados extraídos (None em caso de erro)
+        proximo_a_salvar = 0
+        em_voo = {}  # future -> indices das tasks da chamada
+        fila = iter(lotes)
 
-  * **IMPORTANTE: O QUE **NÃO** É CONSIDERADO DOCUMENTO MÉDICO:**
-    **NUNCA inclua** na lista "documentosMedicosAnexados" documentos que sejam apenas:
-    - Certidões (Nascimento, Casamento, Óbito).
-    - Documentos de Identificação Pessoal (RG, CPF, CNH, Carteira de Trabalho, Título de Eleitor).
-    - Comprovantes de Residência (Contas de Água, Luz, Telefone, Internet).
-    - Documentos Escolares (Atestados de Matrícula, Histórico Escolar, Frequência).
-    - Documentos Financeiros/Administrativos (Recibos, Notas Fiscais, Carteiras de Sindicato/Clube/Associação).
-    - Cartões de Vacina ou Cartões do SUS (EXCETO se contiverem anotações clínicas de diagnóstico importantes).
-    - Procurações, Declarações de Pobreza ou Petições Advocatícias (exceto se a petição transcrever um laudo).
+        with ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY) as executor:
+            def submeter_proxima():
+                for lote in fila:
+                    recortes = []
+                    for idx in lote:
+                        # Um log por sub-documento já existe abaixo; o recorte só entra no agregado
+                        with rastreador.etapa('recorte', log=False, paginas=len(pending_tasks[idx]['pages'])) as medicao:
+                            recortes.append(planejador.montar(planos[idx], recortador))
+                            medicao['bytes'] = recortes[-1].tamanho
+                    if len(lote) > 1 and all(r.inline for r in recortes) and sum(r.tamanho for r in recortes) <= GEMINI_INLINE_MAX_BYTES:
+                        itens = [(str(pending_tasks[idx]['meta'].get('id_documento')), r, tokens_por_task[idx])
+                                 for idx, r in zip(lote, recortes)]
+                        nome_modelo = pending_tasks[lote[0]]['modelo']
+                        logger.info(f"Analyzing {len(lote)} small sub-documents in one {nome_modelo} call: {[i for i, _, _ in itens]}")
+                        em_voo[executor.submit(executar_cronometrado, analisar_lote, modelos[nome_modelo], prompt_analise,
+                                               itens, nome_modelo)] = lote
+                    else:
+                        for idx, recorte in zip(lote, recortes):
+                            nome_modelo = pending_tasks[idx]['modelo']
+                            plano = planos[idx]
+                            logger.info(f"Analyzing sub-document {pending_tasks[idx]['meta'].get('id_documento')} with {nome_modelo} "
+                                        f"as {plano.modo} (~{plano.tokens_estimados} tokens, PDF ~{plano.tokens_pdf})")
+                            em_voo[executor.submit(executar_cronometrado, analisar_subdocumento, modelos[nome_modelo], prompt_analise,
+                                                   recorte, tokens_por_task[idx], nome_modelo)] = [idx]
+                    # O pool só mantém os recortes até a chamada terminar
+                    del recortes
+                    return True
+                return False
 
-  * **CRUCIAL: O QUE É DOCUMENTO MÉDICO:**
-    Procure ativamente por documentos **clínicos** emitidos por profissionais de saúde. Para CADA documento encontrado deste tipo:
-      * Identifique o tipo específico (Atestado Médico, Relatório Médico, Laudo de Exame de Imagem/Laboratorial, Prontuário, Receita, Guia de Encaminhamento, Laudo Pericial Prévio - INSS ou Judicial, CAT, ASO).
-      * Extraia a data exata.
-      * Extraia o nome do Profissional e Instituição.
-      * Resuma o conteúdo clínico (Diagnóstico, CID, Achados, Conclusão).
-      * Indique a página.
+            while len(em_voo) < GEMINI_MAX_CONCURRENCY and submeter_proxima():
+                pass
 
-# ESTRUTURA DE SAÍDA JSON OBRIGATÓRIA PARA CADA ARQUIVO
+            while em_voo:
+                # O timeout garante o heartbeat do lease mesmo com chamadas longas em voo
+                concluidos, _ = wait(em_voo, timeout=lease.heartbeat_s if lease else None, return_when=FIRST_COMPLETED)
+                if lease:
+                    lease.pulsar()
+                for future in concluidos:
+                    lote = em_voo.pop(future)
+                    try:
+                        resultado, segundos = future.result()
+                        rastreador.registrar('analise', segundos, documentos=len(lote),
+                                             modelo=pending_tasks[lote[0]]['modelo'],
+                                             id_documento=[pending_tasks[idx]['meta'].get('id_documento') for idx in lote])
+                        if len(lote) > 1:
+                            por_task, fallbacks = resultado
+                            estatisticas_lotes.registrar('lote', segundos, documentos=len(lote), fallbacks=fallbacks)
+                        else:
+                            por_task = [resultado]
+                            estatisticas_lotes.registrar('individual', segundos)
+                            if resultado[1] is None:
+                                estatisticas_triagem.registrar_latencia(pending_tasks[lote[0]]['triagem'], segundos)
+                    except Exception as e:
+                        # Isolamento por task: loga o erro e segue com as demais
+                        logger.error(f"Error processing sub-doc task {pending_tasks[lote[0]]['meta'].get('id_documento')}: {e}")
+                        rastreador.registrar('analise', 0.0, log=False, documentos=len(lote), erros=1)
+                        por_task = [None] * len(lote)
 
-```json
-{{
-  "idDocumento": "[O ID extraído. Obrigatório]",
-  "nomeArquivoOriginal": "[O nome completo do arquivo PDF fornecido]",
-  "tipoDocumentoGeral": "[Classificação geral: 'Petição Inicial', 'ASO Admissional', 'ASO Demissional', 'Relatório Médico', 'Comunicação INSS', 'Contestação', 'PCMSO', 'CAT', 'Quesitos', 'Despacho Judicial', 'AET', 'LTCAT', etc.]",
-  "dataAssinatura": "[Data em que o documento foi assinado/protocolado nos autos do processo]",
-  "poloOrigemDocumento": "[Ativo, Passivo, Neutro, ou Não Identificado]",
-  "dadosRelevantesParaLaudo": {{
-    "identificacaoDasPartes": "[Extraia nomes completos, CPFs, Endereço Residencial, PIS/PASEP, CTPS, CNPJs, Estado Civil, Escolaridade, do Reclamante e da Reclamada mencionados NESTE documento, etc.]",
-    "Vara": "[Veja em qual Vara da Justiça ou Orgão Julgador está ocorrendo o caso, por exemplo: ‘1a Vara Federal da SSJ de Feira de Santana-BA’]",
-    "Tribunal": "[Veja qual tribunal está esse processo. Por exemplo: TRF1, TRT5, TJBA, etc...]",
-    "ResumoGeralConteudoArquivo": "[Resumo Geral do conteúdo principal deste arquivo, focando em informações importantes do ponto de vista Pericial]",
-    "historicoClinicoGeral": "[Comorbidades, cirurgias, internações, histórico familiar mencionados NESTE documento.]"
-  }},
-  "historicoOcupacional": [
-    {{
-      "tipoOcupacao": "[Atual ou Anterior]",
-      "ocupacao": "[Nome da profissão]",
-      "descricaoFuncao": "[Descrição de função, atividades, tarefas encontradas NESTE documento.]",
-      "periodoFuncao": "[Período em que exerceu a função. Ex: 'dd/mm/aaaa a dd/mm/aaaa']",
-      "ambienteFisico": "[Menções a ruído, calor, ergonomia, agentes químicos encontradas NESTE documento.]",
-      "ambientePsicossocial": "[Menções a pressão, metas, assédio, relacionamento com liderança encontradas NESTE documento.]",
-      "jornadaTrabalho": "[Informações sobre horário, turno, pausas, horas extras encontradas NESTE documento.]",
-      "treinamentoEPIs": "[Menção a EPIs e treinamentos encontrada NESTE documento.]"
-    }}
-  ],
-  "documentosMedicosAnexados": [
-    {{
-      "tipo": "[Tipo específico: 'Relatório Médico', 'Laudo de Exame', 'Atestado', 'Receita', 'ASO', 'CAT', 'Laudo INSS'. NUNCA INCLUIR DOCUMENTOS PESSOAIS, CERTIDÕES OU COMPROVANTES DE RESIDÊNCIA AQUI]",
-      "data": "[dd/mm/aaaa]",
-      "profissionalServico": "[Nome do médico/clínica/hospital]",
-      "resumoConteudo": "[Resumo do CONTEÚDO DESTE DOCUMENTO MÉDICO (Diagnóstico, CID, Achados, Conclusões)]",
-      "paginaNoArquivo": "[Número da página no PDF]"
-    }}
-  ],
-  "quesitosApresentados": [
-    {{
-      "polo": "[Ativo, Passivo ou Neutro]",
-      "textoQuesito": "[Veja se tem quesitos apresentados neste arquivo. Diga objetivamente que sim ou que não tem quesitos neste arquivo.]",
-      "paginaNoArquivo": "[Número da página no PDF onde o quesito se encontra]"
-    }}
-  ],
-  "observacoes": "[Qualquer informação relevante que não se encaixe acima, dificuldades encontradas ou a justificativa para usar o nome do arquivo como idDocumento.]"
-}}
-```
+                    for idx, resultado_task in zip(lote, por_task):
+                        if resultado_task is None:
+                            resultados[idx] = None
+                        else:
+                            dados_extraidos, tier = resultado_task
+                            estatisticas_cache.registrar(tier)
+                            if tier:
+                                # Resultado veio de outro arquivo: mantém o nome do arquivo atual
+                                dados_extraidos = dict(dados_extraidos, nomeArquivoOriginal=filename)
+                            resultados[idx] = dados_extraidos
+                        processed_count += 1
+                    submeter_proxima()
 
-# INSTRUÇÃO FINAL DE FORMATAÇÃO
-Sua resposta deve conter **APENAS** o código JSON válido, sem nenhum texto introdutório, comentários ou explicações. Sua resposta deve começar diretamente com `{{` e terminar com `}}`.
-"""
-            
-            # Chamada Gemini (Sincrona no loop por simplicidade, ideal seria asyncio.gather)
-            # Para upload do blob pro Gemini 1.5 Pro, precisamos usar File API se for grande, ou inline data se pequeno.
-            # Vamos assumir inline data para recortes de processos (< 20MB)
-            logger.info(f"Analyzing sub-document {meta.get('id_documento')} with Gemini 2.5 Pro")
-            response_analise = model_pro.generate_content([
-                prompt_analise,
-                {"mime_type": "application/pdf", "data": pdf_bytes_chunk}
-            ], generation_config={"response_mime_type": "application/json", "temperature": 0.0})
-            
-            try:
-                dados_extraidos = json.loads(response_analise.text)
-                
-                # FLATTENING & MERGING
-                # O usuário quer que o resultado do Gemini fique 'ao lado' dos metadados, e não aninhado.
-                # Vamos combinar os metadados originais com o resultado do Gemini.
-                
-                final_doc = {}
-                # Prioridade: Dados do Gemini > Metadados do Sumário
-                final_doc.update(meta) # id_documento, tipo_original, data do sumário
-                final_doc.update(dados_extraidos) # idDocumento, tipoDocumentoGeral, etc do Gemini
-                
-                # Ajustes finos
-                final_doc['paginas_pdf'] = pages  # indices das paginas
-                final_doc['analisado_em'] = firestore.SERVER_TIMESTAMP
-                final_doc['status'] = 'Sucesso'
-                
-                # Garantir doc_id único para FIRESTORE KEY
-                # O ID pode ser o `idDocumento` retornado pelo Gemini ou o ID do sumário.
-                base_id = final_doc.get('idDocumento') or final_doc.get('id_documento') or 'doc_desconhecido'
-                
-                # Limpar caracteres inválidos para ID de documento firestore
-                safe_id = re.sub(r'[^a-zA-Z0-9_\-]', '_', str(base_id))
-                
-                count = seen_doc_ids.get(safe_id, 0)
-                seen_doc_ids[safe_id] = count + 1
-                
-                doc_key = safe_id
-                if count > 0:
-                    doc_key = f"{safe_id}_{count}" # ex: 12345_1
-                
-                # Persistência
-                # Usando parent_id (que pode ser o numero do processo)
-                db.collection(f"analises_processos/{parent_id}/documentos_analisados").document(doc_key).set(final_doc)
-                
-                processed_count += 1
-                progresso_atual = 50 + int((processed_count / total_tasks) * 50)
-                doc_ref.update({'progresso': progresso_atual})
-                
-                # Se mudamos o pai, atualiza ele também para o frontend saber que está vivo (opcional, mas bom)
-                if parent_id != job_id:
-                     db.collection('analises_processos').document(parent_id).update({'progresso': progresso_atual})
+                # Persiste o prefixo contíguo de tasks já concluídas (commits do escritor incluídos)
+                with rastreador.etapa('persistencia', log=False):
+                    while proximo_a_salvar in resultados:
+                        dados_extraidos = resultados.pop(proximo_a_salvar)
+                        if dados_extraidos is not None:
+                            try:
+                                salvar_resultado(pending_tasks[proximo_a_salvar], dados_extraidos)
+                                concluidas.add(pending_tasks[proximo_a_salvar]['indice'])
+                            except Exception as e:
+                                logger.error(f"Error processing sub-doc task: {e}")
+                                # Logar erro mas continuar loop
+                                com_erro.append(pending_tasks[proximo_a_salvar]['meta'].get('id_documento'))
+                        else:
+                            com_erro.append(pending_tasks[proximo_a_salvar]['meta'].get('id_documento'))
+                        proximo_a_salvar += 1
 
-            except Exception as e:
-                logger.error(f"Error processing sub-doc task: {e}")
-                # Logar erro mas continuar loop
-        
-        doc_ref.update({'status': 'CONCLUIDO', 'progresso': 100})
-        if parent_id != job_id:
-            db.collection('analises_processos').document(parent_id).update({'status': 'CONCLUIDO', 'progresso': 100})
+                    checkpoints.salvar(ETAPA_ANALISE, {'concluidas': sorted(concluidas), 'seen_doc_ids': seen_doc_ids})
 
-        logger.info("Job completed successfully.")
-        
-        # --- TRIGGER CONSOLIDATION ---
-        try:
-            consolidation_url = "https://consolidar-processos-async-557034577173.us-central1.run.app/consolidar-batch"
-            # Precisamos enviar o ID do PAI (que pode ser o numero do processo ou o jobId original)
-            # parent_id foi definido na linha 370 ou 379
-            payload = {"process_ids": [parent_id]}
-            
-            logger.info(f"Triggering consolidation for {parent_id}: {consolidation_url}")
-            # Timeout curto pois o serviço retorna 202 imediatamente
-            resp_cons = requests.post(consolidation_url, json=payload, timeout=10)
-            
-            if resp_cons.status_code == 202:
-                logger.info(f"Consolidation triggered successfully for {parent_id}.")
-            else:
-                logger.warning(f"Consolidation trigger returned unexpected status: {resp_cons.status_code} - {resp_cons.text}")
+                    # Progresso com throttle: o commit leva junto os resultados e o checkpoint pendentes
+                    progresso_atual = 50 + int((processed_count / total_tasks) * 50)
+                    refs_progresso = [doc_ref]
 
-        except Exception as e_cons:
-            # Não falha o job principal se o trigger falhar
-            logger.error(f"Failed to trigger consolidation for {parent_id}: {e_cons}")
-        # -----------------------------
+                    # Se mudamos o pai, atualiza ele também para o frontend saber que está vivo (opcional, mas bom)
+                    if parent_id != job_id:
+                         refs_progresso.append(db.collection('analises_processos').document(parent_id))
+                    escritor.progresso(refs_progresso, progresso_atual)
+                    registrar_rejeitados()
         
-        # 5. Cleanup: Deletar arquivo original do Bucket
-        try:
-            logger.info(f"Cleanup: Deleting file {file_path_gs}")
-            blob.delete()
-            logger.info("Cleanup: File deleted successfully.")
-        except Exception as e:
-            logger.warning(f"Cleanup: Failed to delete file {file_path_gs}. Error: {e}")
+        with rastreador.etapa('persistencia', log=False):
+            escritor.flush()
+            registrar_rejeitados()
+        logger.info(f"Result cache: {estatisticas_cache.resumo()}")
+        logger.info(f"Slicing: {recortador.resumo()}")
+        logger.info(f"Payload planning: {planejador.resumo()}")
+        logger.info(f"Batching: {estatisticas_lotes.resumo()}")
+        logger.info(f"Triage: {estatisticas_triagem.resumo()}")
+        gemini_job = diferenca_resumos(gemini_antes, limitadores_gemini[MODEL_PRO_NAME].resumo())
+        logger.info(f"Gemini Pro limiter: {gemini_job}")
+        if com_erro:
+            logger.error(f"{len(com_erro)} sub-documents could not be analyzed: {com_erro}")
+        with rastreador.etapa('persistencia'):
+            escritor.update(doc_ref, {'status': 'CONCLUIDO', 'progresso': 100, 'cache_analises': estatisticas_cache.resumo(),
+                                      'lotes_analise': estatisticas_lotes.resumo(), 'gemini_pro': gemini_job,
+                                      'payload_analise': planejador.resumo(),
+                                      'documentos_com_erro': com_erro, 'triagem': estatisticas_triagem.resumo()})
+            if parent_id != job_id:
+                escritor.update(db.collection('analises_processos').document(parent_id), {'status': 'CONCLUIDO', 'progresso': 100})
+            checkpoints.limpar()
+            escritor.flush()
+        cache_processados.adicionar(parent_id, [i for ids in analisados_por_task.values() for i in ids])
 
+        logger.info("Job completed successfully.")
         
+        with rastreador.etapa('consolidacao'):
+            disparar_consolidacao(parent_id)
+        with rastreador.etapa('limpeza'):
+            remover_arquivo_original(file_path_gs)
+
+    except LeasePerdido as e:
+        # Este job ficou sem heartbeat tempo demais e outro assumiu o processo: para aqui
+        logger.warning(f"Job {job_id} lost the process lease: {e}")
+        lease = None
+        encerrar_com_erro(job_id, escritor, checkpoints)
+        doc_ref.update({'status': 'REDUNDANTE_ABORTADO', 'info': str(e)})
+    except ERROS_TRANSITORIOS as e:
+        if tentativa + 1 >= JOB_MAX_TENTATIVAS:
+            logger.exception(f"Transient error on the last delivery of job {job_id}")
+            encerrar_com_erro(job_id, escritor, checkpoints)
+            doc_ref.update({'status': 'ERRO', 'erro': str(e)})
+        else:
+            # Mantém os checkpoints e relança: o worker responde 500 e a reentrega retoma daqui
+            logger.warning(f"Transient error in job {job_id} (attempt {tentativa + 1}/{JOB_MAX_TENTATIVAS}): {e}")
+            try:
+                escritor.flush()
+            except Exception as e_flush:
+                logger.error(f"Failed to flush pending writes for job {job_id}: {e_flush}")
+            raise
     except Exception as e:
         logger.exception("Final processing exception")
+        encerrar_com_erro(job_id, escritor, checkpoints)
         doc_ref.update({'status': 'ERRO', 'erro': str(e)})
+    finally:
+        pico_memoria_mb = amostrador_rss.parar()
+        if lease is not None and not lease_transferido:
+            liberar_lease(lease)
+        if doc is not None:
+            doc.close()
+        if spool_path and os.path.exists(spool_path):
+            os.remove(spool_path)
+        try:
+            rpcs = escritor.resumo()
+            logger.info(f"Firestore RPCs for job {job_id}: {rpcs}")
+            metricas_job = {'pico_memoria_mb': pico_memoria_mb, 'rpcs_firestore': rpcs}
+            # Reentrega de job já concluído não mede nenhuma etapa: mantém as métricas da execução real
+            if rastreador.etapas:
+                rastreador.registrar('total', time.perf_counter() - inicio_job, log=False)
+                metricas_job['metricas'] = rastreador.resumo()
+                logger.info(f"Stage metrics for job {job_id}: {metricas_job['metricas']}",
+                            extra={'json_fields': {'job_id': job_id, 'metricas': metricas_job['metricas']}})
+            doc_ref.update(metricas_job)
+        except Exception as e:
+            logger.warning(f"Failed to record job metrics for job {job_id}: {e}")
+
+
+if os.environ.get("TASKS_BACKEND") == "local":
+    usar_fila_local()
 
+# Perfil de cold start: import do módulo (sem clientes); a criação de cada cliente é logada no primeiro uso
+tempos_inicializacao['import_main'] = round(time.perf_counter() - _inicio_import, 3)
+logger.info(f"Module imported in {tempos_inicializacao['import_main']}s")
@@ -0,0 +1,124 @@
+import bisect
+import os
+import re
+
+# Rodapés de identificação de documento
+# TRF: "Num. 123456789 - Pág. 1" | TRT: "... - a1b2c3d" no fim da página
+REGEX_TRF = re.compile(r"Num\.\s+(\d{9,})")
+REGEX_TRT = re.compile(r"-\s+([a-f0-9]{7})\s*$")
+# Tamanho mínimo de um trecho de ID para o match parcial (sumário x rodapé)
+MATCH_MIN_CHARS = int(os.environ.get("MATCH_MIN_CHARS", "3"))
+
+
+def identificar_documento(text):
+    """Retorna o ID do documento ao qual a página pertence (TRF tem prioridade), ou None."""
+    # TRF Check
+    match_trf = REGEX_TRF.search(text)
+    if match_trf:
+        return match_trf.group(1)
+
+    # TRT Check
+    # Normalização: As vezes o índice do sumário usa parte do hash ou ele todo
+    match_trt = REGEX_TRT.search(text)
+    if match_trt:
+        return match_trt.group(1)
+    return None
+
+
+def mapear_paginas(textos, renderizador=None):
+    """
+    Step 3: monta o mapa id_documento -> [indices de página].
+    Em PDFs grandes o texto das páginas ainda não lidas é extraído por `textos.prefetch`
+    num pool de processos; o resultado é idêntico ao caminho serial, com as páginas de
+    cada documento em ordem crescente.
+    Com `renderizador` (page_render.RenderizadorPaginas), páginas sem camada de texto
+    são identificadas pelo OCR da faixa do rodapé.
+    """
+    n_paginas = len(textos)
+    textos.prefetch()
+    ids_por_pagina = {i: identificar_documento(textos.get(i)) for i in range(n_paginas)}
+
+    if renderizador is not None:
+        digitalizadas = renderizador.sem_texto(textos, [i for i in range(n_paginas) if not ids_por_pagina[i]])
+        for i, text in renderizador.ocr_rodapes(digitalizadas).items():
+            ids_por_pagina[i] = identificar_documento(text.strip())
+
+    mapa_paginas = {}  # id -> [indices]
+    for i in range(n_paginas):
+        doc_id = ids_por_pagina[i]
+        if doc_id:
+            mapa_paginas.setdefault(doc_id, []).append(i)
+    return mapa_paginas
+
+
+class IndiceDocumentos:
+    """
+    Índice para cruzar os IDs do sumário com as chaves de `mapa_paginas` (Step 4).
+    Além do match exato, resolve IDs truncados nas duas direções (ID do sumário contido
+    na chave do rodapé, ou chave contida no ID do sumário) sem varrer as chaves uma a uma.
+    Só os IDs completos são indexados: as chaves ficam concatenadas num único texto
+    (separadas por SEPARADOR), onde `str.find` localiza o ID do sumário e a posição é
+    convertida de volta na chave por busca binária; no sentido inverso, só os trechos do
+    ID do sumário com o tamanho de alguma chave são consultados no próprio mapa.
+    Match parcial exige pelo menos `min_chars` caracteres no lado mais curto: IDs e
+    chaves menores que isso só casam exatamente (a varredura original aceitava qualquer
+    tamanho, e uma chave de 1-2 caracteres casava com quase todo ID do sumário).
+    Entre vários candidatos, a escolha é determinística: prefixo > sufixo > trecho interno,
+    depois a menor diferença de tamanho, a primeira página e, por fim, a própria chave.
+    """
+
+    SEPARADOR = "\x00"
+
+    def __init__(self, mapa_paginas, min_chars=MATCH_MIN_CHARS):
+        self.mapa = mapa_paginas
+        self.min_chars = min_chars
+        self._chaves = list(mapa_paginas)
+        self._inicios = []  # posição de cada chave em self._texto
+        pos = 0
+        for chave in self._chaves:
+            self._inicios.append(pos)
+            pos += len(chave) + len(self.SEPARADOR)
+        self._texto = self.SEPARADOR.join(self._chaves)
+        self._tamanhos = sorted({len(chave) for chave in self._chaves if len(chave) >= min_chars})
+
+    def _ordem(self, doc_id, chave):
+        curto, longo = sorted((doc_id, chave), key=len)
+        pos = longo.find(curto)
+        if pos == 0:
+            tipo = 0  # prefixo
+        elif pos + len(curto) == len(longo):
+            tipo = 1  # sufixo
+        else:
+            tipo = 2  # trecho interno
+        return (tipo, len(longo) - len(curto), self.mapa[chave][0], chave)
+
+    def candidatos(self, doc_id):
+        """Chaves compatíveis com `doc_id`, da melhor para a pior."""
+        doc_id = str(doc_id)
+        if doc_id in self.mapa:
+            return [doc_id]
+        if len(doc_id) < self.min_chars:
+            return []
+
+        # ID do sumário contido na chave (rodapé com o ID completo)
+        encontrados = set()
+        pos = self._texto.find(doc_id) if self.SEPARADOR not in doc_id else -1
+        while pos != -1:
+            encontrados.add(self._chaves[bisect.bisect_right(self._inicios, pos) - 1])
+            pos = self._texto.find(doc_id, pos + 1)
+        # Chave contida no ID do sumário (rodapé truncado)
+        for tamanho in self._tamanhos:
+            if tamanho > len(doc_id):
+                break
+            for i in range(len(doc_id) - tamanho + 1):
+                trecho = doc_id[i:i + tamanho]
+                if trecho in self.mapa:
+                    encontrados.add(trecho)
+        return sorted(encontrados, key=lambda chave: self._ordem(doc_id, chave))
+
+    def resolver(self, doc_id):
+        """Páginas do melhor candidato para `doc_id`, ou None."""
+        if not doc_id:
+            return None
+        candidatos = self.candidatos(doc_id)
+        return self.mapa[candidatos[0]] if candidatos else None
@@ -0,0 +1,283 @@
+import os
+import io
+import time
+import hashlib
+import logging
+import importlib
+
+import fitz  # PyMuPDF
+
+import page_text
+
+logger = logging.getLogger()
+
+# Página com menos caracteres que isto na camada de texto é tratada como digitalizada (sem texto)
+PAGINA_SEM_TEXTO_MIN_CHARS = int(os.environ.get("PAGINA_SEM_TEXTO_MIN_CHARS", "20"))
+# Resolução das imagens de página inteira enviadas ao Gemini no Step 2 e JPEG usado
+RENDER_DPI_PAGINA = int(os.environ.get("RENDER_DPI_PAGINA", "100"))
+RENDER_JPEG_QUALIDADE = int(os.environ.get("RENDER_JPEG_QUALIDADE", "70"))
+# Resolução da faixa de rodapé passada ao OCR no Step 3 e sua altura (fração da página)
+RENDER_DPI_RODAPE = int(os.environ.get("RENDER_DPI_RODAPE", "200"))
+RODAPE_FRACAO = float(os.environ.get("RODAPE_FRACAO", "0.12"))
+# Abaixo deste número de páginas a renderização roda no próprio processo
+RENDER_PARALLEL_MIN_PAGES = int(os.environ.get("RENDER_PARALLEL_MIN_PAGES", "16"))
+# Motor de OCR dos rodapés: "mupdf" (Tesseract embutido no MuPDF, precisa de TESSDATA_PREFIX),
+# "tesseract" (pytesseract), "modulo:funcao" (qualquer callable png_bytes -> texto) ou "" (desligado).
+# Desligado por padrão: a imagem do serviço não traz Tesseract nem tessdata.
+OCR_MOTOR = os.environ.get("OCR_MOTOR", "")
+OCR_IDIOMA = os.environ.get("OCR_IDIOMA", "por")
+
+REGIAO_PAGINA = 'pagina'
+REGIAO_RODAPE = 'rodape'
+
+
+def pagina_sem_texto(text):
+    return len((text or '').strip()) < PAGINA_SEM_TEXTO_MIN_CHARS
+
+
+def hash_pagina(doc, page_num):
+    """
+    Impressão digital da página a partir dos bytes brutos do conteúdo e das imagens (sem
+    decodificar nem renderizar): a mesma digitalização, em qualquer PDF, tem o mesmo hash.
+    """
+    page = doc[page_num]
+    h = hashlib.sha256()
+    h.update(f"{tuple(page.rect)}|{page.rotation}".encode())
+    for xref in page.get_contents():
+        h.update(doc.xref_stream_raw(xref) or b'')
+    for imagem in page.get_images(full=True):
+        h.update(doc.xref_stream_raw(imagem[0]) or b'')
+    return h.hexdigest()
+
+
+def renderizar_pagina(doc, page_num, regiao=REGIAO_PAGINA):
+    """Página inteira (JPEG reduzido, para o Gemini) ou só a faixa do rodapé (PNG, para o OCR), em cinza."""
+    page = doc[page_num]
+    if regiao == REGIAO_RODAPE:
+        r = page.rect
+        clip = fitz.Rect(r.x0, r.y1 - r.height * RODAPE_FRACAO, r.x1, r.y1)
+        pix = page.get_pixmap(dpi=RENDER_DPI_RODAPE, clip=clip, colorspace=fitz.csGRAY)
+        return pix.tobytes("png")
+    pix = page.get_pixmap(dpi=RENDER_DPI_PAGINA, colorspace=fitz.csGRAY)
+    return pix.tobytes("jpeg", jpg_quality=RENDER_JPEG_QUALIDADE)
+
+
+# --- Motores de OCR (resolvidos por nome também dentro dos workers) ---
+
+def ocr_mupdf(png):
+    pix = fitz.Pixmap(png)
+    with fitz.open("pdf", pix.pdfocr_tobytes(language=OCR_IDIOMA)) as ocr:
+        return ocr[0].get_text()
+
+
+def ocr_tesseract(png):
+    import pytesseract
+    from PIL import Image
+    return pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=OCR_IDIOMA)
+
+
+MOTORES_OCR = {'mupdf': ocr_mupdf, 'tesseract': ocr_tesseract}
+
+
+def carregar_motor_ocr(nome):
+    """Callable png_bytes -> texto para `nome` (ver OCR_MOTOR), ou None se o OCR está desligado."""
+    if not nome:
+        return None
+    if nome in MOTORES_OCR:
+        return MOTORES_OCR[nome]
+    modulo, _, funcao = nome.partition(':')
+    return getattr(importlib.import_module(modulo), funcao)
+
+
+# Resultado da verificação de cada motor neste processo (nome -> callable, ou None se indisponível)
+_motores_verificados = {}
+
+
+def _imagem_em_branco():
+    pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, 32, 32), False)
+    pix.clear_with(255)
+    return pix.tobytes("png")
+
+
+def verificar_motor_ocr(nome):
+    """
+    Motor `nome` pronto para uso, ou None. Na primeira chamada do processo o motor é carregado e
+    testado numa imagem em branco; se falhar (módulo ausente, Tesseract ou tessdata não
+    instalados) fica desligado, em vez de renderizar e falhar de novo em cada página de cada job.
+    """
+    if not nome:
+        return None
+    if nome not in _motores_verificados:
+        try:
+            motor = carregar_motor_ocr(nome)
+            motor(_imagem_em_branco())
+        except Exception as e:
+            logger.warning(f"OCR engine {nome} unavailable, scanned footers will not be read: {e}")
+            motor = None
+        _motores_verificados[nome] = motor
+    return _motores_verificados[nome]
+
+
+def _renderizar_intervalo(paginas, regiao):
+    """Executado no worker: renderiza `paginas` do documento aberto no processo."""
+    doc = page_text.worker_doc()
+    return [(i, renderizar_pagina(doc, i, regiao)) for i in paginas]
+
+
+def _ocr_rodapes(itens, motor):
+    """Executado no worker: [(pagina, png ou None)] -> [(pagina, png, texto, erro)], renderizando o que faltar."""
+    doc = page_text.worker_doc()
+    ocr = carregar_motor_ocr(motor)
+    resultado = []
+    for i, png in itens:
+        if png is None:
+            png = renderizar_pagina(doc, i, REGIAO_RODAPE)
+        try:
+            resultado.append((i, png, ocr(png), None))
+        except Exception as e:
+            resultado.append((i, png, '', str(e)))
+    return resultado
+
+
+def _em_blocos(itens, partes):
+    tamanho = max(1, -(-len(itens) // max(1, partes)))
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+
+class RenderizadorPaginas:
+    """
+    Fallback para PDFs digitalizados (páginas sem camada de texto).
+    Renderiza só as páginas pedidas, em imagens reduzidas, num pool de processos quando são
+    muitas (mesmo pool do page_text: cada worker abre o PDF pelo caminho). As imagens e o texto
+    de OCR ficam em `cache` (LRUCache) pela impressão digital da página, então a mesma
+    digitalização juntada de novo, ou o mesmo arquivo reprocessado, não é renderizada outra vez.
+    """
+
+    def __init__(self, doc, fonte=None, workers=None, cache=None, motor_ocr=OCR_MOTOR):
+        self.doc = doc
+        self.fonte = fonte
+        self.workers = page_text.PAGE_TEXT_WORKERS if workers is None else workers
+        self.cache = cache
+        self.motor_ocr = motor_ocr
+        self._hashes = {}
+        self.renderizadas = 0
+        self.acertos_cache = 0
+        self.ocr_paginas = 0
+        self.ocr_erros = 0
+        self.tempo_s = 0.0
+
+    def sem_texto(self, textos, paginas=None):
+        """Páginas (de `paginas`, ou do PDF inteiro) cuja camada de texto está vazia."""
+        if paginas is None:
+            paginas = range(len(self.doc))
+        return [p for p in paginas if pagina_sem_texto(textos.get(p))]
+
+    def hash(self, page_num):
+        h = self._hashes.get(page_num)
+        if h is None:
+            h = self._hashes[page_num] = hash_pagina(self.doc, page_num)
+        return h
+
+    def _cache_get(self, chave):
+        valor = self.cache.get(chave) if self.cache is not None else None
+        if valor is not None:
+            self.acertos_cache += 1
+        return valor
+
+    def _cache_set(self, chave, valor):
+        if self.cache is not None:
+            self.cache.set(chave, valor)
+
+    def _paralelo(self, n_paginas):
+        return self.fonte is not None and self.workers > 1 and n_paginas >= RENDER_PARALLEL_MIN_PAGES
+
+    def renderizar(self, paginas, regiao=REGIAO_PAGINA):
+        """{pagina: bytes da imagem} para `paginas`, renderizando só o que não está no cache."""
+        t0 = time.perf_counter()
+        imagens, faltando = {}, []
+        for p in paginas:
+            imagem = self._cache_get(f"{regiao}:{self.hash(p)}")
+            if imagem is None:
+                faltando.append(p)
+            else:
+                imagens[p] = imagem
+
+        if self._paralelo(len(faltando)):
+            with page_text.abrir_pool(self.fonte, self.workers) as pool:
+                blocos = _em_blocos(faltando, self.workers * 4)
+                for resultado in pool.map(_renderizar_intervalo, blocos, [regiao] * len(blocos)):
+                    for p, imagem in resultado:
+                        imagens[p] = imagem
+        else:
+            for p in faltando:
+                imagens[p] = renderizar_pagina(self.doc, p, regiao)
+
+        for p in faltando:
+            self._cache_set(f"{regiao}:{self.hash(p)}", imagens[p])
+        self.renderizadas += len(faltando)
+        self.tempo_s += time.perf_counter() - t0
+        return imagens
+
+    def ocr_rodapes(self, paginas):
+        """{pagina: texto} do OCR da faixa do rodapé de `paginas` ({} com o OCR desligado ou indisponível)."""
+        if not paginas or verificar_motor_ocr(self.motor_ocr) is None:
+            return {}
+        t0 = time.perf_counter()
+        textos, itens = {}, []
+        for p in paginas:
+            texto = self._cache_get(f"ocr:{self.motor_ocr}:{self.hash(p)}")
+            if texto is not None:
+                textos[p] = texto
+            else:
+                itens.append((p, self._cache_get(f"{REGIAO_RODAPE}:{self.hash(p)}")))
+
+        try:
+            if self._paralelo(len(itens)):
+                with page_text.abrir_pool(self.fonte, self.workers) as pool:
+                    blocos = _em_blocos(itens, self.workers * 4)
+                    resultados = [r for bloco in pool.map(_ocr_rodapes, blocos, [self.motor_ocr] * len(blocos))
+                                  for r in bloco]
+            else:
+                resultados = self._ocr_local(itens)
+        except Exception as e:
+            # Falha do pool (o motor já foi verificado): segue sem OCR
+            logger.warning(f"OCR of scanned footers with {self.motor_ocr} failed: {e}")
+            self.tempo_s += time.perf_counter() - t0
+            return textos
+        self.renderizadas += sum(1 for _, png in itens if png is None)
+
+        erros = []
+        for p, png, texto, erro in resultados:
+            self._cache_set(f"{REGIAO_RODAPE}:{self.hash(p)}", png)
+            if erro is None:
+                self._cache_set(f"ocr:{self.motor_ocr}:{self.hash(p)}", texto)
+            else:
+                erros.append(erro)
+            textos[p] = texto
+        if erros:
+            logger.warning(f"OCR ({self.motor_ocr}) failed on {len(erros)} pages: {erros[0]}")
+        self.ocr_paginas += len(resultados)
+        self.ocr_erros += len(erros)
+        self.tempo_s += time.perf_counter() - t0
+        return textos
+
+    def _ocr_local(self, itens):
+        ocr = verificar_motor_ocr(self.motor_ocr)
+        resultado = []
+        for p, png in itens:
+            if png is None:
+                png = renderizar_pagina(self.doc, p, REGIAO_RODAPE)
+            try:
+                resultado.append((p, png, ocr(png), None))
+            except Exception as e:
+                resultado.append((p, png, '', str(e)))
+        return resultado
+
+    def resumo(self):
+        return {
+            'renderizadas': self.renderizadas,
+            'acertos_cache': self.acertos_cache,
+            'ocr_paginas': self.ocr_paginas,
+            'ocr_erros': self.ocr_erros,
+            'tempo_s': round(self.tempo_s, 3),
+        }
@@ -0,0 +1,139 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+# Workers usados na extração paralela de texto (0/1 = sempre serial)
+PAGE_TEXT_WORKERS = int(os.environ.get("PAGE_TEXT_WORKERS", str(os.cpu_count() or 1)))
+# Abaixo deste número de páginas o custo de subir processos não compensa
+PAGE_TEXT_PARALLEL_MIN_PAGES = int(os.environ.get("PAGE_TEXT_PARALLEL_MIN_PAGES", "200"))
+
+# Documento aberto em cada processo do pool (inicializado uma única vez por worker)
+_worker_doc = None
+
+
+def _init_worker(fonte):
+    global _worker_doc
+    if isinstance(fonte, (bytes, bytearray)):
+        _worker_doc = fitz.open(stream=fonte, filetype="pdf")
+    else:
+        # Caminho do arquivo temporário: cada worker abre o mesmo arquivo e as páginas
+        # vêm do page cache do SO, sem serializar o PDF inteiro para cada processo.
+        _worker_doc = fitz.open(fonte)
+
+
+def worker_doc():
+    """Documento aberto no processo worker atual (ver abrir_pool)."""
+    return _worker_doc
+
+
+def abrir_pool(fonte, workers):
+    """Pool de processos em que cada worker já tem o PDF `fonte` aberto."""
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                               initializer=_init_worker, initargs=(fonte,))
+
+
+def _extrair_intervalo(inicio, fim):
+    """Extrai o texto das páginas [inicio, fim) no processo worker."""
+    resultado = []
+    for i in range(inicio, fim):
+        t0 = time.perf_counter()
+        text = _worker_doc[i].get_text()
+        resultado.append((i, text, time.perf_counter() - t0))
+    return resultado
+
+
+def dividir_intervalos(paginas, partes):
+    """Agrupa páginas ordenadas em até `partes` intervalos contíguos [inicio, fim)."""
+    paginas = sorted(paginas)
+    if not paginas:
+        return []
+    intervalos = []
+    inicio = anterior = paginas[0]
+    for p in paginas[1:]:
+        if p != anterior + 1:
+            intervalos.append((inicio, anterior + 1))
+            inicio = p
+        anterior = p
+    intervalos.append((inicio, anterior + 1))
+
+    # Quebra intervalos grandes para distribuir a carga entre os workers
+    total = len(paginas)
+    tamanho = max(1, -(-total // max(1, partes)))
+    shards = []
+    for inicio, fim in intervalos:
+        for s in range(inicio, fim, tamanho):
+            shards.append((s, min(s + tamanho, fim)))
+    return shards
+
+
+class PageTextCache:
+    """
+    Camada de texto por página do PDF.
+    Cada página é extraída no máximo uma vez (sob demanda), e o resultado é
+    compartilhado pelo Step 2 (contexto do sumário) e Step 3 (mapeamento regex).
+    `fonte` (bytes ou caminho do PDF) só é necessária para a extração em paralelo.
+    """
+
+    def __init__(self, doc, fonte=None, workers=None):
+        self.doc = doc
+        self.fonte = fonte
+        self.workers = PAGE_TEXT_WORKERS if workers is None else workers
+        self.textos = {}   # pagina -> texto
+        self.tempos = {}   # pagina -> segundos de extração
+
+    def __len__(self):
+        return len(self.doc)
+
+    def get(self, page_num):
+        text = self.textos.get(page_num)
+        if text is None:
+            t0 = time.perf_counter()
+            text = self.doc[page_num].get_text()
+            self.tempos[page_num] = time.perf_counter() - t0
+            self.textos[page_num] = text
+        return text
+
+    def prefetch(self, paginas=None):
+        """Extrai antecipadamente as páginas ainda não lidas, em paralelo quando vale a pena."""
+        if paginas is None:
+            paginas = range(len(self.doc))
+        faltando = [p for p in paginas if p not in self.textos]
+        if not faltando:
+            return
+
+        if not self.usa_paralelismo(len(faltando)):
+            for p in faltando:
+                self.get(p)
+            return
+
+        shards = dividir_intervalos(faltando, self.workers * 4)
+        with abrir_pool(self.fonte, self.workers) as pool:
+            for resultado in pool.map(_extrair_intervalo, *zip(*shards)):
+                for i, text, elapsed in resultado:
+                    self.registrar(i, text, elapsed)
+
+    def usa_paralelismo(self, n_paginas):
+        return self.fonte is not None and self.workers > 1 and n_paginas >= PAGE_TEXT_PARALLEL_MIN_PAGES
+
+    def registrar(self, page_num, text, elapsed):
+        """Guarda o texto de uma página extraída fora do cache (ex.: por um worker)."""
+        self.textos[page_num] = text
+        self.tempos[page_num] = elapsed
+
+    def resumo_tempos(self):
+        """Resumo da extração para logs: páginas lidas, total, média e página mais lenta."""
+        if not self.tempos:
+            return {'paginas': 0, 'total_s': 0.0, 'media_ms': 0.0, 'max_ms': 0.0, 'pagina_mais_lenta': None}
+        total = sum(self.tempos.values())
+        mais_lenta = max(self.tempos, key=self.tempos.get)
+        return {
+            'paginas': len(self.tempos),
+            'total_s': round(total, 3),
+            'media_ms': round(total / len(self.tempos) * 1000, 2),
+            'max_ms': round(self.tempos[mais_lenta] * 1000, 2),
+            'pagina_mais_lenta': mais_lenta,
+        }
@@ -0,0 +1,202 @@
+import os
+import hashlib
+from collections import namedtuple
+
+from batching import estimar_tokens_paginas, CARACTERES_POR_TOKEN
+from pdf_slicing import intervalo_de
+
+# "hibrido": texto extraído no lugar do PDF onde a camada de texto é boa; "pdf": sempre o recorte em PDF
+PAYLOAD_MODO = os.environ.get("PAYLOAD_MODO", "hibrido")
+# Página vai como texto se tiver ao menos N caracteres e imagens cobrindo no máximo esta fração da área
+PAYLOAD_TEXTO_MIN_CHARS = int(os.environ.get("PAYLOAD_TEXTO_MIN_CHARS", "200"))
+PAYLOAD_IMAGEM_MAX_FRACAO = float(os.environ.get("PAYLOAD_IMAGEM_MAX_FRACAO", "0.25"))
+# Mais trechos em PDF que isto (texto e imagem muito intercalados) e o documento vai inteiro em PDF
+PAYLOAD_MAX_ANEXOS = int(os.environ.get("PAYLOAD_MAX_ANEXOS", "4"))
+# Economia mínima de tokens (fração) para trocar o PDF pelo payload com texto
+PAYLOAD_ECONOMIA_MIN = float(os.environ.get("PAYLOAD_ECONOMIA_MIN", "0.15"))
+
+MODO_PDF = 'pdf'
+MODO_TEXTO = 'texto'
+MODO_HIBRIDO = 'hibrido'
+
+# Abre o payload com texto: a numeração das páginas é a do sub-documento, como no PDF
+CABECALHO_TEXTO = (
+    "O ARQUIVO FOI ENVIADO COMO TEXTO EXTRAÍDO DE CADA PÁGINA. Cada página começa com o marcador "
+    "`--- PÁGINA n ---`, em que n é o número da página no arquivo (use-o em paginaNoArquivo). "
+    "Páginas com imagens (exames, digitalizações) vêm como PDF anexo após o marcador "
+    "`--- PÁGINAS a A b: PDF ANEXO ---`; a 1ª página do anexo é a página a do arquivo."
+)
+
+# segmentos: [(MODO_TEXTO|MODO_PDF, [páginas])] cobrindo o intervalo do recorte, na ordem do documento
+Plano = namedtuple('Plano', ['pages', 'modo', 'segmentos', 'tokens_estimados', 'tokens_pdf'])
+
+
+def cobertura_imagens(page):
+    """Fração da área da página coberta por imagens (soma das áreas visíveis, limitada a 1)."""
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    coberta = sum(abs(page.rect & info['bbox']) for info in page.get_image_info())
+    return min(1.0, coberta / area)
+
+
+def _tokens_texto(texto):
+    return len(texto) // CARACTERES_POR_TOKEN
+
+
+def _marcador_pagina(n):
+    return f"--- PÁGINA {n} ---"
+
+
+def _marcador_anexo(inicio, fim):
+    return f"--- PÁGINAS {inicio} A {fim}: PDF ANEXO ---"
+
+
+TOKENS_MARCADOR = _tokens_texto(_marcador_anexo(999, 999)) + 1
+
+
+def paginas_em_pdf(plano):
+    """Listas de páginas que o plano envia como recorte em PDF (para o RecortadorPDF.planejar)."""
+    return [paginas for tipo, paginas in plano.segmentos if tipo == MODO_PDF]
+
+
+class PayloadTexto:
+    """
+    Payload de análise com texto: `partes` intercala textos (str) e recortes em PDF das páginas
+    com imagem, na ordem das páginas. Tem a mesma interface do Recorte usada pela análise
+    (inline, tamanho, sha256, descartar), então entra no cache e nos lotes do mesmo jeito.
+    """
+
+    def __init__(self, partes, modo):
+        self.partes = partes
+        self.modo = modo
+        self._sha256 = None
+
+    @property
+    def inline(self):
+        return all(isinstance(p, str) or p.inline for p in self.partes)
+
+    @property
+    def tamanho(self):
+        return sum(len(p.encode('utf-8')) if isinstance(p, str) else p.tamanho for p in self.partes)
+
+    def sha256(self):
+        if self._sha256 is None:
+            h = hashlib.sha256(self.modo.encode())
+            for p in self.partes:
+                h.update(b'\0' + (p.encode('utf-8') if isinstance(p, str) else p.sha256().encode()))
+            self._sha256 = h.hexdigest()
+        return self._sha256
+
+    def descartar(self):
+        for p in self.partes:
+            if not isinstance(p, str):
+                p.descartar()
+
+
+class PlanejadorPayload:
+    """
+    Decide, por sub-documento, o que vai ao Gemini: o recorte em PDF (como sempre), só o texto
+    extraído no Step 3 com marcadores de página, ou um híbrido (texto + PDF só dos trechos com
+    imagem). Cada página é classificada uma vez pela densidade de texto e pela área de imagens.
+    Usado pela thread principal do job (lê o documento aberto, que não é thread-safe).
+    """
+
+    def __init__(self, doc, textos, modo=PAYLOAD_MODO, texto_min_chars=PAYLOAD_TEXTO_MIN_CHARS,
+                 imagem_max_fracao=PAYLOAD_IMAGEM_MAX_FRACAO, max_anexos=PAYLOAD_MAX_ANEXOS,
+                 economia_min=PAYLOAD_ECONOMIA_MIN):
+        self.doc = doc
+        self.textos = textos
+        self.modo = modo
+        self.texto_min_chars = texto_min_chars
+        self.imagem_max_fracao = imagem_max_fracao
+        self.max_anexos = max_anexos
+        self.economia_min = economia_min
+        self._tipos = {}
+        self.documentos = {MODO_PDF: 0, MODO_TEXTO: 0, MODO_HIBRIDO: 0}
+        self.paginas_texto = 0
+        self.paginas_pdf = 0
+        self.tokens_estimados = 0
+        self.tokens_pdf = 0
+        self.bytes_enviados = 0
+
+    def tipo_pagina(self, p):
+        tipo = self._tipos.get(p)
+        if tipo is None:
+            texto = self.textos.get(p) or ''
+            if (len(texto.strip()) < self.texto_min_chars
+                    or cobertura_imagens(self.doc[p]) > self.imagem_max_fracao):
+                tipo = MODO_PDF
+            else:
+                tipo = MODO_TEXTO
+            self._tipos[p] = tipo
+        return tipo
+
+    def _tokens_pdf(self, pages):
+        return estimar_tokens_paginas(self.textos, pages)
+
+    def planejar(self, pages):
+        """Plano do sub-documento `pages` (sem gerar recortes)."""
+        pages = list(pages)
+        # O recorte em PDF leva o intervalo inteiro; o texto cobre as mesmas páginas
+        intervalo = range(*intervalo_de(pages))
+        tokens_pdf = self._tokens_pdf(intervalo)
+        so_pdf = Plano(pages, MODO_PDF, [(MODO_PDF, list(intervalo))], tokens_pdf, tokens_pdf)
+        if self.modo == MODO_PDF:
+            return so_pdf
+
+        segmentos = []
+        for p in intervalo:
+            tipo = self.tipo_pagina(p)
+            if segmentos and segmentos[-1][0] == tipo:
+                segmentos[-1][1].append(p)
+            else:
+                segmentos.append((tipo, [p]))
+        anexos = sum(1 for tipo, _ in segmentos if tipo == MODO_PDF)
+        if anexos == len(segmentos) or anexos > self.max_anexos:
+            return so_pdf
+
+        tokens = _tokens_texto(CABECALHO_TEXTO)
+        for tipo, paginas in segmentos:
+            if tipo == MODO_TEXTO:
+                tokens += sum(_tokens_texto(self.textos.get(p) or '') + TOKENS_MARCADOR for p in paginas)
+            else:
+                tokens += self._tokens_pdf(paginas) + TOKENS_MARCADOR
+        if tokens > tokens_pdf * (1 - self.economia_min):
+            return so_pdf
+        return Plano(pages, MODO_HIBRIDO if anexos else MODO_TEXTO, segmentos, tokens, tokens_pdf)
+
+    def montar(self, plano, recortador):
+        """Recorte (modo PDF) ou PayloadTexto do plano; recortes vêm do `recortador` do job."""
+        if plano.modo == MODO_PDF:
+            payload = recortador.recortar(plano.pages)
+        else:
+            inicio = min(plano.pages)
+            partes = [CABECALHO_TEXTO]
+            for tipo, paginas in plano.segmentos:
+                if tipo == MODO_TEXTO:
+                    partes.append('\n'.join(f"{_marcador_pagina(p - inicio + 1)}\n{self.textos.get(p) or ''}"
+                                            for p in paginas))
+                else:
+                    partes.append(_marcador_anexo(paginas[0] - inicio + 1, paginas[-1] - inicio + 1))
+                    partes.append(recortador.recortar(paginas))
+            payload = PayloadTexto(partes, plano.modo)
+
+        self.documentos[plano.modo] += 1
+        self.paginas_pdf += sum(len(paginas) for tipo, paginas in plano.segmentos if tipo == MODO_PDF)
+        self.paginas_texto += sum(len(paginas) for tipo, paginas in plano.segmentos if tipo == MODO_TEXTO)
+        self.tokens_estimados += plano.tokens_estimados
+        self.tokens_pdf += plano.tokens_pdf
+        self.bytes_enviados += payload.tamanho
+        return payload
+
+    def resumo(self):
+        return {
+            'documentos': dict(self.documentos),
+            'paginas_texto': self.paginas_texto,
+            'paginas_pdf': self.paginas_pdf,
+            'tokens_estimados': self.tokens_estimados,
+            'tokens_pdf_estimados': self.tokens_pdf,
+            'tokens_economizados': self.tokens_pdf - self.tokens_estimados,
+            'bytes_enviados': self.bytes_enviados,
+        }
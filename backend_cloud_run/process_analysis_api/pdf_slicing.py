@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import tempfile
+from collections import Counter
+
+import fitz  # PyMuPDF
+
+# Limite de uma requisição inline ao Gemini (20MB), com folga para o prompt.
+# Recortes acima disso vão pela File API a partir de um arquivo em disco.
+GEMINI_INLINE_MAX_BYTES = int(os.environ.get("GEMINI_INLINE_MAX_BYTES", str(19 * 1024 * 1024)))
+# Opções de serialização dos recortes: garbage=3 junta objetos duplicados
+# (fontes/imagens copiadas do original) e deflate comprime os streams.
+SLICE_GARBAGE = int(os.environ.get("SLICE_GARBAGE", "3"))
+SLICE_DEFLATE = os.environ.get("SLICE_DEFLATE", "1") != "0"
+
+
+def intervalo_de(pages):
+    """Intervalo [inicio, fim) coberto pelas páginas de um sub-documento."""
+    return min(pages), max(pages) + 1
+
+
+def _sha256_arquivo(caminho, bloco=1024 * 1024):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for parte in iter(lambda: f.read(bloco), b''):
+            h.update(parte)
+    return h.hexdigest()
+
+
+class Recorte:
+    """
+    PDF de um sub-documento: em memória (`dados`) ou, quando grande demais para ir
+    inline ao Gemini, num arquivo temporário (`caminho`) que deve ser descartado após o uso.
+    """
+
+    def __init__(self, dados=None, caminho=None):
+        self.dados = dados
+        self.caminho = caminho
+        self._sha256 = None
+
+    @property
+    def inline(self):
+        return self.dados is not None
+
+    @property
+    def tamanho(self):
+        return len(self.dados) if self.inline else os.path.getsize(self.caminho)
+
+    def sha256(self):
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.dados).hexdigest() if self.inline else _sha256_arquivo(self.caminho)
+        return self._sha256
+
+    def ler(self):
+        if self.inline:
+            return self.dados
+        with open(self.caminho, 'rb') as f:
+            return f.read()
+
+    def descartar(self):
+        if self.caminho and os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+
+def _arquivo_temporario(dir_temp=None):
+    fd, caminho = tempfile.mkstemp(suffix='.pdf', dir=dir_temp)
+    os.close(fd)
+    return caminho
+
+
+def recorte_de_bytes(dados, limite_inline=GEMINI_INLINE_MAX_BYTES, dir_temp=None):
+    """Recorte a partir de bytes já prontos (ex.: parte baixada do GCS no fan-out)."""
+    if len(dados) <= limite_inline:
+        return Recorte(dados=dados)
+    caminho = _arquivo_temporario(dir_temp)
+    with open(caminho, 'wb') as f:
+        f.write(dados)
+    return Recorte(caminho=caminho)
+
+
+class RecortadorPDF:
+    """
+    Gera os recortes de um job a partir do documento aberto uma única vez.
+    `planejar` recebe todas as listas de páginas de antemão: intervalos repetidos
+    (mesmas páginas indexadas mais de uma vez no sumário) são serializados uma vez só e
+    mantidos em memória até o último uso. Recortes cujo tamanho estimado (pela média de bytes
+    por página do arquivo original) ou real passa de `limite_inline` são gravados direto em disco.
+    Usado apenas pela thread principal do job (o PyMuPDF não é thread-safe).
+    """
+
+    def __init__(self, doc, tamanho_arquivo=None, limite_inline=GEMINI_INLINE_MAX_BYTES,
+                 garbage=SLICE_GARBAGE, deflate=SLICE_DEFLATE, dir_temp=None):
+        self.doc = doc
+        self.limite_inline = limite_inline
+        self.opcoes = {'garbage': garbage, 'deflate': deflate, 'no_new_id': True}
+        self.dir_temp = dir_temp
+        self.bytes_por_pagina = (tamanho_arquivo / len(doc)) if tamanho_arquivo and len(doc) else None
+        self._usos = Counter()
+        self._memo = {}
+        self.recortes = 0
+        self.reaproveitados = 0
+        self.em_disco = 0
+        self.bytes_gerados = 0
+        self.tempo_s = 0.0
+
+    def planejar(self, lista_pages):
+        for pages in lista_pages:
+            self._usos[intervalo_de(pages)] += 1
+
+    def recortar(self, pages):
+        inicio, fim = intervalo = intervalo_de(pages)
+        if self._usos[intervalo] > 0:
+            self._usos[intervalo] -= 1
+        recorte = self._memo.get(intervalo)
+        if recorte is not None:
+            self.reaproveitados += 1
+            if not self._usos[intervalo]:
+                del self._memo[intervalo]
+            return recorte
+
+        t0 = time.perf_counter()
+        new_doc = fitz.open()
+        try:
+            # to_page é inclusivo no insert_pdf
+            new_doc.insert_pdf(self.doc, from_page=inicio, to_page=fim - 1)
+            estimado = self.bytes_por_pagina * (fim - inicio) if self.bytes_por_pagina else 0
+            if estimado > self.limite_inline:
+                caminho = _arquivo_temporario(self.dir_temp)
+                new_doc.save(caminho, **self.opcoes)
+                recorte = Recorte(caminho=caminho)
+            else:
+                recorte = recorte_de_bytes(new_doc.tobytes(**self.opcoes), self.limite_inline, self.dir_temp)
+        finally:
+            new_doc.close()
+        self.tempo_s += time.perf_counter() - t0
+        self.recortes += 1
+        self.bytes_gerados += recorte.tamanho
+        if not recorte.inline:
+            self.em_disco += 1
+        elif self._usos[intervalo]:
+            # Arquivos em disco não são compartilhados: cada uso é descartado pelo consumidor
+            self._memo[intervalo] = recorte
+        return recorte
+
+    def resumo(self):
+        return {
+            'recortes': self.recortes,
+            'reaproveitados': self.reaproveitados,
+            'em_disco': self.em_disco,
+            'bytes_gerados': self.bytes_gerados,
+            'tempo_s': round(self.tempo_s, 3),
+            'media_ms': round(self.tempo_s / self.recortes * 1000, 2) if self.recortes else 0.0,
+        }
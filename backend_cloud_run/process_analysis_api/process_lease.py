@@ -0,0 +1,145 @@
+import os
+import time
+import uuid
+import logging
+from collections import namedtuple
+
+from dedup import safe_id
+
+logger = logging.getLogger()
+
+# Validade do lease de um processo: sem heartbeat por esse tempo, o dono é considerado morto
+LEASE_TTL_S = float(os.environ.get("LEASE_TTL_S", "600"))
+# Validade no fan-out: as partes esperam na fila e só renovam ao começar e ao terminar, então o
+# lease tem de atravessar a espera na fila e a análise de uma parte (a última o libera no fan-in)
+LEASE_TTL_FANOUT_S = float(os.environ.get("LEASE_TTL_FANOUT_S", "3600"))
+# Intervalo mínimo entre heartbeats (o loop de análise chama `pulsar` a cada iteração)
+LEASE_HEARTBEAT_S = float(os.environ.get("LEASE_HEARTBEAT_S", "60"))
+# Margem após a expiração antes de um job em espera tentar de novo (rede de segurança do despertar)
+LEASE_MARGEM_S = float(os.environ.get("LEASE_MARGEM_S", "15"))
+
+Aquisicao = namedtuple('Aquisicao', ['adquirido', 'dono', 'expira_em', 'tomado_de'])
+
+
+class LeasePerdido(Exception):
+    """Outro job assumiu o processo (o lease deste expirou sem heartbeat)."""
+    pass
+
+
+class LeaseProcesso:
+    """
+    Exclusividade de um job sobre um processo (parent_id), em `colecao/{parent_id}`.
+    O lease é adquirido numa transação e vale até `expira_em`; o dono renova com `pulsar`.
+    Cada execução tem um token próprio (`execucao`), então uma reentrega concorrente do mesmo
+    job também espera. Lease expirado é assumido por quem tentar adquiri-lo. Quem não consegue
+    o lease entra em `aguardando` (com o payload da sua tarefa); quem liberar reenfileira o
+    primeiro da fila, que ao terminar chama o seguinte. O atraso devolvido por `atraso_espera`
+    cobre o caso de o dono morrer sem liberar.
+    """
+
+    def __init__(self, db, firestore, parent_id, job_id, execucao=None, colecao='leases_processos',
+                 ttl_s=LEASE_TTL_S, heartbeat_s=LEASE_HEARTBEAT_S, margem_s=LEASE_MARGEM_S, relogio=time.time):
+        self.db = db
+        self.firestore = firestore
+        self.parent_id = parent_id
+        self.job_id = job_id
+        self.execucao = execucao or uuid.uuid4().hex
+        self.ref = db.collection(colecao).document(safe_id(parent_id))
+        self.ttl_s = ttl_s
+        self.heartbeat_s = heartbeat_s
+        self.margem_s = margem_s
+        self.relogio = relogio
+        self.expira_em = 0.0
+        self._ultimo_pulso = 0.0
+        self.renovacoes = 0
+
+    def adquirir(self, tarefa=None, processo_ref=None, dados_processo=None):
+        """
+        Tenta assumir o processo. Sem sucesso, registra `tarefa` (payload do job) na fila de
+        espera do lease. Com sucesso, grava `dados_processo` em `processo_ref` na mesma transação.
+        """
+        @self.firestore.transactional
+        def _adquirir(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            atual = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            agora = self.relogio()
+            dono = atual.get('execucao')
+            aguardando = [t for t in atual.get('aguardando') or [] if t.get('jobId') != self.job_id]
+
+            if dono and dono != self.execucao and atual.get('expira_em', 0) > agora:
+                if tarefa is not None:
+                    transaction.update(self.ref, {'aguardando': aguardando + [tarefa]})
+                return Aquisicao(False, atual.get('job_id'), atual['expira_em'], None)
+
+            tomado_de = atual.get('job_id') if dono and dono != self.execucao else None
+            transaction.set(self.ref, {
+                'parent_id': self.parent_id,
+                'job_id': self.job_id,
+                'execucao': self.execucao,
+                'adquirido_em': agora,
+                'expira_em': agora + self.ttl_s,
+                'aguardando': aguardando,
+            })
+            if processo_ref is not None and dados_processo:
+                transaction.set(processo_ref, dados_processo, merge=True)
+            return Aquisicao(True, self.job_id, agora + self.ttl_s, tomado_de)
+
+        aquisicao = _adquirir(self.db.transaction())
+        if aquisicao.adquirido:
+            self.expira_em = aquisicao.expira_em
+            self._ultimo_pulso = self.relogio()
+            if aquisicao.tomado_de:
+                logger.warning(f"Lease on {self.parent_id} taken over from stale job {aquisicao.tomado_de} by {self.job_id}")
+        return aquisicao
+
+    def atraso_espera(self, aquisicao):
+        """Segundos até um job em espera tentar de novo por conta própria (lease expirado + margem)."""
+        return max(self.margem_s, aquisicao.expira_em - self.relogio() + self.margem_s)
+
+    def pulsar(self, forcar=False):
+        """
+        Heartbeat: estende o lease se o último tiver mais de `heartbeat_s`. Lança LeasePerdido
+        se outro job o assumiu; falhas de RPC só são logadas (o lease ainda vale até expirar).
+        """
+        agora = self.relogio()
+        if not forcar and agora - self._ultimo_pulso < self.heartbeat_s:
+            return False
+
+        @self.firestore.transactional
+        def _renovar(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            atual = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            if atual.get('execucao') != self.execucao:
+                return atual.get('job_id') or 'desconhecido'
+            transaction.update(self.ref, {'expira_em': agora + self.ttl_s, 'renovado_em': agora})
+            return None
+
+        try:
+            novo_dono = _renovar(self.db.transaction())
+        except Exception as e:
+            logger.warning(f"Lease heartbeat for {self.parent_id} failed: {e}")
+            return False
+        if novo_dono is not None:
+            raise LeasePerdido(f"Processo {self.parent_id} assumido pelo job {novo_dono}")
+        self.expira_em = agora + self.ttl_s
+        self._ultimo_pulso = agora
+        self.renovacoes += 1
+        return True
+
+    def liberar(self, despertar=1):
+        """
+        Solta o lease (se ainda for deste job) e devolve as `despertar` primeiras tarefas que
+        esperavam por ele; as demais continuam na fila para o próximo dono.
+        """
+        @self.firestore.transactional
+        def _liberar(transaction):
+            snapshot = self.ref.get(transaction=transaction)
+            atual = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            if atual.get('execucao') != self.execucao:
+                return []
+            aguardando = atual.get('aguardando') or []
+            transaction.update(self.ref, {'execucao': None, 'expira_em': 0, 'liberado_em': self.relogio(),
+                                          'aguardando': aguardando[despertar:]})
+            return aguardando[:despertar]
+
+        return _liberar(self.db.transaction())
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# Tamanho do tier local (por instância) e validade do tier persistente (Firestore)
+CACHE_LRU_MAX_ITEMS = int(os.environ.get("CACHE_LRU_MAX_ITEMS", "512"))
+CACHE_TTL_DIAS = int(os.environ.get("CACHE_TTL_DIAS", "30"))
+
+
+def sha256_hex(dados):
+    if isinstance(dados, str):
+        dados = dados.encode('utf-8')
+    return hashlib.sha256(dados).hexdigest()
+
+
+def chave_cache(*partes):
+    """Chave estável a partir de partes já normalizadas (hashes, nomes de modelo, versões)."""
+    return sha256_hex('|'.join(str(p) for p in partes))
+
+
+class LRUCache:
+    """Cache local em memória, thread-safe (as análises rodam no pool de threads)."""
+
+    def __init__(self, max_items=CACHE_LRU_MAX_ITEMS):
+        self.max_items = max_items
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_items:
+                self._itens.popitem(last=False)
+
+
+class FirestoreCache:
+    """
+    Tier persistente: um documento por chave em `colecao`, com o valor serializado em JSON
+    e validade em `expira_em`. Entradas vencidas são ignoradas e apagadas na leitura;
+    a remoção em massa fica com a política de TTL do Firestore sobre o campo `expira_em`
+    (criada por setup_firestore.sh; coleção nova precisa entrar na lista de lá).
+    """
+
+    def __init__(self, db, colecao, ttl_dias=CACHE_TTL_DIAS):
+        self.db = db
+        self.colecao = colecao
+        self.ttl = timedelta(days=ttl_dias)
+
+    def get(self, chave):
+        ref = self.db.collection(self.colecao).document(chave)
+        snapshot = ref.get()
+        if not snapshot.exists:
+            return None
+        dados = snapshot.to_dict()
+        expira_em = dados.get('expira_em')
+        if expira_em and expira_em < datetime.now(timezone.utc):
+            ref.delete()
+            return None
+        return json.loads(dados['valor_json'])
+
+    def set(self, chave, valor, **extras):
+        agora = datetime.now(timezone.utc)
+        self.db.collection(self.colecao).document(chave).set({
+            'valor_json': json.dumps(valor, ensure_ascii=False),
+            'criado_em': agora,
+            'expira_em': agora + self.ttl,
+            **extras,
+        })
+
+
+class CacheEmCamadas:
+    """LRU local na frente de um tier persistente. `get` retorna (valor, tier) ou (None, None)."""
+
+    def __init__(self, local, persistente):
+        self.local = local
+        self.persistente = persistente
+
+    def get(self, chave):
+        valor = self.local.get(chave)
+        if valor is not None:
+            return valor, 'local'
+        valor = self.persistente.get(chave)
+        if valor is not None:
+            self.local.set(chave, valor)
+            return valor, 'persistente'
+        return None, None
+
+    def set(self, chave, valor, **extras):
+        self.local.set(chave, valor)
+        self.persistente.set(chave, valor, **extras)
+
+
+class EstatisticasCache:
+    """Contadores de acerto de um job (atualizados apenas pela thread principal)."""
+
+    def __init__(self):
+        self.hits_local = 0
+        self.hits_persistente = 0
+        self.misses = 0
+
+    def registrar(self, tier):
+        if tier == 'local':
+            self.hits_local += 1
+        elif tier == 'persistente':
+            self.hits_persistente += 1
+        else:
+            self.misses += 1
+
+    def resumo(self):
+        hits = self.hits_local + self.hits_persistente
+        total = hits + self.misses
+        return {
+            'hits': hits,
+            'hits_local': self.hits_local,
+            'hits_persistente': self.hits_persistente,
+            'misses': self.misses,
+            'taxa_acerto': round(hits / total, 3) if total else 0.0,
+        }
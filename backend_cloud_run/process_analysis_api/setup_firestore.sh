@@ -0,0 +1,12 @@
+#!/bin/bash
+PROJECT_ID="processai-468612"
+
+# Política de TTL do Firestore sobre `expira_em` (Timestamp) dos caches persistentes
+# (result_cache.FirestoreCache). A leitura já ignora entradas vencidas; esta política
+# é que apaga os documentos, senão as coleções de cache crescem para sempre.
+for COLECAO in cache_analises_gemini cache_sumarios; do
+    echo "Enabling TTL on $COLECAO.expira_em..."
+    gcloud firestore fields ttls update expira_em --collection-group=$COLECAO --enable-ttl --project=$PROJECT_ID
+done
+
+echo "Firestore setup complete."
@@ -9,4 +9,15 @@ gcloud tasks queues create $QUEUE --location=$LOCATION
 echo "Updating Queue Limits..."
 gcloud tasks queues update $QUEUE --location=$LOCATION --max-dispatches-per-second=10 --max-concurrent-dispatches=50
 
+# Filas por classe de tamanho (job_scheduling.CLASSES_TAMANHO): orçamento de concorrência próprio,
+# para que processos pequenos não esperem atrás dos gigantes
+for CLASSE in "process-queue-pequenos 30" "process-queue-medios 10" "process-queue-grandes 3"; do
+    set -- $CLASSE
+    echo "Creating size-class queue: $1 (max $2 concurrent)..."
+    gcloud tasks queues create $1 --location=$LOCATION
+    # max-attempts = JOB_MAX_TENTATIVAS (main.py): erros transitórios são reentregues e retomam dos checkpoints
+    gcloud tasks queues update $1 --location=$LOCATION --max-dispatches-per-second=10 --max-concurrent-dispatches=$2 \
+        --max-attempts=5 --min-backoff=10s
+done
+
 echo "Queue setup complete."
@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import base64
+import random
+import hashlib
+import logging
+import tempfile
+
+import google_crc32c
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger()
+
+# Tamanho dos blocos lidos do GCS (múltiplo de 256 KB)
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Blocos do upload resumível para o GCS (precisa ser múltiplo de 256 KB)
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_RETRIES = int(os.environ.get("UPLOAD_MAX_RETRIES", "5"))
+
+_STATUS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+_http_session = None
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class FalhaTransitoria(Exception):
+    """Erro de rede/HTTP que justifica retomar a transferência do último offset confirmado."""
+    pass
+
+
+def sessao_http():
+    """Sessão HTTP única por instância, com pool de conexões (Drive e upload resumível)."""
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+        _http_session.mount('https://', adapter)
+        _http_session.mount('http://', adapter)
+    return _http_session
+
+
+def baixar_blob_para_arquivo(blob, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Baixa o blob em blocos para um arquivo temporário, sem manter o conteúdo em memória.
+    Valida o MD5 do objeto (ou CRC32C, no caso de objetos compostos que não têm MD5).
+    Retorna (caminho, tamanho_em_bytes). Quem chama é responsável por remover o arquivo.
+    """
+    blob.reload()  # md5_hash / crc32c / size
+    md5 = hashlib.md5()
+    crc = google_crc32c.Checksum()
+    tamanho = 0
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as spool:
+        try:
+            with blob.open('rb', chunk_size=chunk_size) as origem:
+                while True:
+                    chunk = origem.read(chunk_size)
+                    if not chunk:
+                        break
+                    md5.update(chunk)
+                    crc.update(chunk)
+                    spool.write(chunk)
+                    tamanho += len(chunk)
+
+            if blob.md5_hash:
+                esperado, obtido = blob.md5_hash, base64.b64encode(md5.digest()).decode()
+            else:
+                esperado, obtido = blob.crc32c, base64.b64encode(crc.digest()).decode()
+            if esperado and esperado != obtido:
+                raise ChecksumMismatch(f"Checksum inválido para {blob.name}: esperado {esperado}, obtido {obtido}")
+        except Exception:
+            spool.close()
+            os.remove(spool.name)
+            raise
+
+    return spool.name, tamanho
+
+
+def _offset_confirmado(resp):
+    """Lê o header Range de uma resposta 308 do upload resumível ("bytes=0-N" -> N+1)."""
+    match = re.match(r'bytes=0-(\d+)', resp.headers.get('Range', ''))
+    return int(match.group(1)) + 1 if match else 0
+
+
+def _enviar_bloco(session, upload_url, dados, inicio, total):
+    """
+    Envia um bloco do upload resumível. Retorna o novo offset confirmado,
+    ou None quando o GCS indica que o objeto foi finalizado.
+    """
+    total_str = str(total) if total is not None else '*'
+    if dados:
+        content_range = f"bytes {inicio}-{inicio + len(dados) - 1}/{total_str}"
+    else:
+        content_range = f"bytes */{total_str}"
+    try:
+        resp = session.put(upload_url, data=dados, headers={'Content-Range': content_range}, timeout=120)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise FalhaTransitoria(f"GCS upload: {e}")
+    if resp.status_code in (200, 201):
+        return None
+    if resp.status_code == 308:
+        return _offset_confirmado(resp)
+    if resp.status_code in _STATUS_TRANSITORIOS:
+        raise FalhaTransitoria(f"GCS upload status {resp.status_code}")
+    raise RuntimeError(f"GCS upload failed. Status: {resp.status_code}, Response: {resp.text}")
+
+
+def _consultar_offset(session, upload_url, total):
+    """Pergunta ao GCS quantos bytes já foram persistidos (None = upload já concluído)."""
+    return _enviar_bloco(session, upload_url, b'', 0, total)
+
+
+def _transferir_a_partir_de(session, download_url, download_headers, upload_url, offset, total, chunk_size):
+    headers = dict(download_headers)
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+    try:
+        with session.get(download_url, headers=headers, stream=True, timeout=120) as resp:
+            if resp.status_code in _STATUS_TRANSITORIOS:
+                raise FalhaTransitoria(f"Drive download status {resp.status_code}")
+            if resp.status_code not in (200, 206):
+                raise RuntimeError(f"Failed to download file. Status: {resp.status_code}, Response: {resp.text}")
+
+            # Servidor ignorou o Range: descarta o que já foi confirmado
+            descartar = offset if (offset and resp.status_code == 200) else 0
+            buffer = bytearray()
+            for parte in resp.iter_content(chunk_size=256 * 1024):
+                if descartar:
+                    corte = min(descartar, len(parte))
+                    parte = parte[corte:]
+                    descartar -= corte
+                buffer += parte
+                # Blocos intermediários têm tamanho fixo; o resto fica para o bloco final
+                while len(buffer) > chunk_size:
+                    bloco = bytes(buffer[:chunk_size])
+                    novo_offset = _enviar_bloco(session, upload_url, bloco, offset, total)
+                    if novo_offset is None:
+                        return offset + len(bloco)
+                    # O GCS pode confirmar menos do que recebeu: o restante volta ao buffer
+                    del buffer[:novo_offset - offset]
+                    offset = novo_offset
+    except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        raise FalhaTransitoria(f"Drive download: {e}")
+
+    # Bloco final (define o tamanho total do objeto)
+    while True:
+        final = offset + len(buffer)
+        novo_offset = _enviar_bloco(session, upload_url, bytes(buffer), offset, final)
+        if novo_offset is None:
+            return final
+        del buffer[:novo_offset - offset]
+        offset = novo_offset
+
+
+def transferir_stream_para_gcs(download_url, download_headers, upload_url, tamanho_total=None,
+                               chunk_size=UPLOAD_CHUNK_SIZE, max_tentativas=UPLOAD_MAX_RETRIES, session=None):
+    """
+    Copia `download_url` (ex.: Drive alt=media) para uma sessão de upload resumível do GCS
+    em blocos de tamanho fixo, com memória constante (~2 blocos). Em falhas transitórias,
+    consulta o offset já persistido no GCS e retoma o download com header Range a partir dele.
+    Retorna o número de bytes gravados.
+    """
+    session = session or sessao_http()
+    offset = 0
+    tentativas = 0
+    t0 = time.monotonic()
+    while True:
+        try:
+            tamanho = _transferir_a_partir_de(session, download_url, download_headers, upload_url,
+                                              offset, tamanho_total, chunk_size)
+            break
+        except FalhaTransitoria as e:
+            tentativas += 1
+            if tentativas > max_tentativas:
+                raise
+            espera = min(30, (2 ** tentativas) * 0.5) * (0.5 + random.random())
+            logger.warning(f"Transient failure during stream transfer ({e}). Retry {tentativas}/{max_tentativas} in {espera:.1f}s")
+            time.sleep(espera)
+            try:
+                offset = _consultar_offset(session, upload_url, tamanho_total)
+            except FalhaTransitoria:
+                continue  # tenta de novo na próxima volta, mantendo o offset anterior
+            if offset is None:
+                # Upload já finalizado antes da falha
+                tamanho = tamanho_total
+                break
+            logger.info(f"Resuming stream transfer at byte {offset}")
+
+    elapsed = max(time.monotonic() - t0, 1e-6)
+    mb = (tamanho or 0) / (1024 * 1024)
+    logger.info(f"Stream transfer finished: {mb:.1f} MB in {elapsed:.1f}s ({mb / elapsed:.1f} MB/s, {tentativas} retries)")
+    return tamanho
@@ -0,0 +1,99 @@
+import logging
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+
+class TarefaDuplicada(Exception):
+    """Equivalente local do AlreadyExists do Cloud Tasks (tarefa nomeada já criada)."""
+    pass
+
+
+class FilaLocal:
+    """
+    Substituto in-process do Cloud Tasks para desenvolvimento e benchmarks.
+    `despachar(rota, payload, tentativa)` executa o handler da rota; exceções contam
+    como falha e a tarefa é reentregue (como o Cloud Tasks faria) até `max_tentativas`.
+    Tarefas nomeadas são deduplicadas, como no Cloud Tasks.
+    `filas` ({nome: workers}) dá a cada fila nomeada o próprio limite de concorrência
+    (max-concurrent-dispatches); tarefas sem fila, ou de filas não configuradas, usam `workers`.
+    """
+
+    def __init__(self, despachar, workers=4, max_tentativas=3, filas=None):
+        self.despachar = despachar
+        self.max_tentativas = max_tentativas
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._executores = {nome: ThreadPoolExecutor(max_workers=n, thread_name_prefix=nome)
+                            for nome, n in (filas or {}).items()}
+        self._nomes = set()
+        self._adiadas = {}  # nome -> Timer das tarefas com atraso ainda não despachadas
+        self._contador = itertools.count(1)
+        self._pendentes = 0
+        self._cond = threading.Condition()
+        self.entregas = 0
+        self.falhas = 0
+
+    def criar_tarefa(self, rota, payload, nome=None, fila=None, atraso_s=0):
+        """`atraso_s` adia o despacho, como o schedule_time do Cloud Tasks."""
+        with self._cond:
+            if nome is not None:
+                if nome in self._nomes:
+                    raise TarefaDuplicada(nome)
+                self._nomes.add(nome)
+            self._pendentes += 1
+        nome = nome or f"local-{next(self._contador)}"
+        executor = self._executores.get(fila, self._executor)
+        if atraso_s > 0:
+            timer = threading.Timer(atraso_s, self._despachar_adiada, (nome, rota, payload, executor))
+            timer.daemon = True
+            with self._cond:
+                self._adiadas[nome] = timer
+            timer.start()
+        else:
+            executor.submit(self._executar, nome, rota, payload, 0, executor)
+        return nome
+
+    def _despachar_adiada(self, nome, rota, payload, executor):
+        with self._cond:
+            if self._adiadas.pop(nome, None) is None:
+                return  # cancelada
+        executor.submit(self._executar, nome, rota, payload, 0, executor)
+
+    def cancelar_tarefa(self, nome):
+        """Remove uma tarefa adiada ainda não despachada (como o delete_task do Cloud Tasks)."""
+        with self._cond:
+            timer = self._adiadas.pop(nome, None)
+            if timer is None:
+                return False
+            timer.cancel()
+            self._pendentes -= 1
+            self._cond.notify_all()
+        return True
+
+    def _executar(self, nome, rota, payload, tentativa, executor):
+        try:
+            with self._cond:
+                self.entregas += 1
+            self.despachar(rota, payload, tentativa)
+        except Exception as e:
+            with self._cond:
+                self.falhas += 1
+            if tentativa + 1 < self.max_tentativas:
+                logger.warning(f"Local task {nome} failed ({e}). Redelivering (attempt {tentativa + 2})")
+                executor.submit(self._executar, nome, rota, payload, tentativa + 1, executor)
+                return
+            logger.error(f"Local task {nome} failed permanently: {e}")
+        with self._cond:
+            self._pendentes -= 1
+            self._cond.notify_all()
+
+    def aguardar(self, timeout=None):
+        """Bloqueia até que todas as tarefas (inclusive as criadas por outras tarefas) terminem."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pendentes == 0, timeout=timeout)
+
+    def encerrar(self):
+        for executor in [self._executor, *self._executores.values()]:
+            executor.shutdown(wait=True)
@@ -0,0 +1,76 @@
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Só functions_framework e google.api_core vêm dos stubs; os clientes são substituídos pelos fakes
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks", "stubs_nuvem"))
+sys.path.insert(0, RAIZ)
+
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+from dedup import CacheProcessados  # noqa: E402
+from gemini_limiter import LimitadorModelo  # noqa: E402
+from result_cache import LRUCache, FirestoreCache, CacheEmCamadas  # noqa: E402
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico  # noqa: E402
+from benchmarks.fakes_pipeline import FakeGCS, FakeGenAI, modulo_firestore  # noqa: E402
+
+BUCKET = "bucket-teste"
+JOB_ID = "job-teste"
+ARQUIVO = f"gs://{BUCKET}/uploads/processo.pdf"
+
+
+@pytest.fixture(scope="session")
+def pdf():
+    pdf_bytes, documentos = gerar_pdf_sintetico(120)
+    indice = [{'id_documento': doc_id, 'tipo_original': 'Petição', 'data': '01/01/2024'} for doc_id, _ in documentos]
+    return pdf_bytes, indice
+
+
+class Ambiente:
+    """main.processar_pdf contra fakes novos; `reiniciar_instancia` simula a reentrega noutra instância."""
+
+    def __init__(self, monkeypatch, pdf, db):
+        pdf_bytes, indice = pdf
+        self.monkeypatch = monkeypatch
+        self.db = db
+        self.gcs = FakeGCS()
+        self.genai = FakeGenAI(main.PROMPT_SUMARIO, indice)
+        self.gcs.objetos[(BUCKET, "uploads/processo.pdf")] = pdf_bytes
+        main.db.substituir(self.db)
+        main.firestore.substituir(modulo_firestore(self.db))
+        main.storage_client.substituir(self.gcs)
+        main.genai.substituir(self.genai)
+        main.logging_client.substituir(object())
+        monkeypatch.setattr(main, 'FANOUT_MIN_TASKS', 0)
+        monkeypatch.setattr(main, 'disparar_consolidacao', lambda parent_id: None)
+        self.indices = []
+        identificar = main.identificar_sumario
+        monkeypatch.setattr(main, 'identificar_sumario',
+                            lambda *a, **k: self.indices.append(1) or identificar(*a, **k))
+        self.reiniciar_instancia()
+        self.db.collection('analises_processos').document(JOB_ID).set({'status': 'ENFILEIRADO', 'progresso': 0})
+
+    def reiniciar_instancia(self):
+        self.monkeypatch.setattr(main, 'cache_analises', CacheEmCamadas(LRUCache(), FirestoreCache(self.db, 'cache_analises_gemini')))
+        self.monkeypatch.setattr(main, 'cache_sumarios', CacheEmCamadas(LRUCache(), FirestoreCache(self.db, 'cache_sumarios')))
+        self.monkeypatch.setattr(main, 'cache_paginas', LRUCache())
+        self.monkeypatch.setattr(main, 'cache_processados', CacheProcessados())
+        # Cotas RPM/TPM por instância: os testes anteriores não consomem a janela deste
+        self.monkeypatch.setattr(main, 'limitadores_gemini', {
+            main.MODEL_PRO_NAME: LimitadorModelo(main.MODEL_PRO_NAME, rpm=main.GEMINI_PRO_RPM, tpm=main.GEMINI_PRO_TPM),
+            main.MODEL_FLASH_NAME: LimitadorModelo(main.MODEL_FLASH_NAME, rpm=main.GEMINI_FLASH_RPM,
+                                                   tpm=main.GEMINI_FLASH_TPM),
+        })
+
+    def chamadas_pro(self):
+        return self.genai.contadores.copia().get(f"chamadas:{main.MODEL_PRO_NAME}", 0)
+
+    def status(self):
+        return self.db.docs[f"analises_processos/{JOB_ID}"]['status']
+
+    def checkpoints(self):
+        return set(self.db.listar(f"analises_processos/{JOB_ID}/checkpoints"))
+
+    def analisados(self):
+        return set(self.db.listar(f"analises_processos/{JOB_ID}/documentos_analisados"))
@@ -0,0 +1,62 @@
+"""Rota /api/processar: o job só é enfileirado depois que o documento dele existe."""
+import json
+
+import main
+from job_scheduling import AgendadorJobs
+from benchmarks.fakes_pipeline import FakeFirestore, modulo_firestore
+
+
+class Requisicao:
+    method = "POST"
+    headers = {}
+    path = '/api/processar'
+
+    def __init__(self, corpo):
+        self._corpo = corpo
+
+    def get_json(self, silent=False):
+        return self._corpo
+
+
+async def medir_pdf_async(file_path):
+    return 20, 100_000, True
+
+
+def processar(monkeypatch, criar, agendar):
+    db = FakeFirestore()
+    monkeypatch.setattr(main, 'criar_documento_job', criar)
+    monkeypatch.setattr(main, 'medir_pdf_async', medir_pdf_async)
+    monkeypatch.setattr(main, 'agendador_jobs', AgendadorJobs(db, modulo_firestore(db)))
+    monkeypatch.setattr(main, 'enfileirar_agendado', agendar)
+    monkeypatch.setattr(main, 'logging_client', type('Cliente', (), {'obter': lambda self: None})())
+    resposta = main.process_analysis_api(Requisicao({'jobId': 'job-1', 'filePath': 'gs://b/uploads/p.pdf'}))
+    return resposta[1], json.loads(resposta[0])
+
+
+def test_falha_ao_criar_o_job_nao_enfileira(monkeypatch):
+    enfileirados = []
+
+    def criar(job_id, file_path):
+        raise RuntimeError("Firestore indisponível")
+
+    status, corpo = processar(monkeypatch, criar, lambda *args: enfileirados.append(args))
+    assert status == 500
+    assert enfileirados == []
+
+
+def test_ordem_criacao_e_enfileiramento(monkeypatch):
+    ordem = []
+    status, corpo = processar(monkeypatch, lambda job_id, file_path: ordem.append('criar'),
+                              lambda *args: ordem.append('agendar'))
+    assert status == 200
+    assert corpo['jobId'] == 'job-1'
+    assert ordem == ['criar', 'agendar']
+
+
+def test_falha_ao_enfileirar_responde_500(monkeypatch):
+    def agendar(*args):
+        raise RuntimeError("Cloud Tasks indisponível")
+
+    status, corpo = processar(monkeypatch, lambda job_id, file_path: None, agendar)
+    assert status == 500
+    assert 'Failed to enqueue' in corpo['error']
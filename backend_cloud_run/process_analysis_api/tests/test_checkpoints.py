@@ -0,0 +1,129 @@
+"""
+Retomada por checkpoint (checkpoints.JobCheckpoints) no processar_pdf, com os fakes do
+bench_pipeline: queda do worker no meio do Step 4 seguida da reentrega, erro transitório
+(500 e reentrega) e erro terminal.
+"""
+import pytest
+
+import main
+from checkpoints import ETAPA_SUMARIO, ETAPA_MAPA, ETAPA_ANALISE
+from benchmarks.fakes_pipeline import FakeFirestore, FalhaInjetada, Lote
+from conftest import Ambiente, JOB_ID, ARQUIVO
+
+
+class FirestoreQueCai(FakeFirestore):
+    """O worker cai (FalhaInjetada) no segundo commit com resultados de análise."""
+
+    def __init__(self):
+        super().__init__()
+        self.lotes_com_resultados = 0
+
+    def batch(self):
+        return LoteQueCai(self)
+
+
+class LoteQueCai(Lote):
+    def commit(self):
+        if any('/documentos_analisados/' in op[1].caminho for op in self.ops):
+            self.db.lotes_com_resultados += 1
+            if self.db.lotes_com_resultados == 2:
+                raise FalhaInjetada("queda do worker no meio do Step 4")
+        super().commit()
+
+
+def test_reentrega_retoma_dos_checkpoints(monkeypatch, pdf):
+    limpo = Ambiente(monkeypatch, pdf, FakeFirestore())
+    main.processar_pdf(JOB_ID, ARQUIVO)
+    assert limpo.status() == 'CONCLUIDO'
+
+    # Steps 2 e 3 e o primeiro lote de análises já estão gravados quando o worker cai
+    ambiente = Ambiente(monkeypatch, pdf, FirestoreQueCai())
+    with pytest.raises(FalhaInjetada):
+        main.processar_pdf(JOB_ID, ARQUIVO)
+    assert {ETAPA_SUMARIO, ETAPA_MAPA, ETAPA_ANALISE} <= ambiente.checkpoints()
+    salvos = ambiente.analisados()
+    assert salvos
+    pro_antes = ambiente.chamadas_pro()
+
+    ambiente.reiniciar_instancia()
+    main.processar_pdf(JOB_ID, ARQUIVO)
+
+    assert ambiente.status() == 'CONCLUIDO'
+    assert ambiente.analisados() == limpo.analisados()
+    assert len(ambiente.indices) == 1  # o índice não é extraído de novo
+    assert ambiente.chamadas_pro() - pro_antes < limpo.chamadas_pro()
+    assert ambiente.checkpoints() == set()
+
+
+def test_erro_terminal_remove_checkpoints(monkeypatch, pdf):
+    ambiente = Ambiente(monkeypatch, pdf, FakeFirestore())
+
+    def falhar(mapa_paginas):
+        raise RuntimeError("erro irrecuperável no Step 4")
+
+    monkeypatch.setattr(main, 'IndiceDocumentos', falhar)
+    main.processar_pdf(JOB_ID, ARQUIVO)
+
+    assert ambiente.status() == 'ERRO'
+    # A tarefa não é reentregue (o worker responde 200): nada deve ficar para trás
+    assert ambiente.checkpoints() == set()
+
+
+class FirestoreInstavel(FakeFirestore):
+    """Firestore fora do ar (ServiceUnavailable em todo commit) a partir do segundo lote com resultados."""
+
+    def __init__(self):
+        super().__init__()
+        self.lotes_com_resultados = 0
+        self.fora_do_ar = False
+
+    def batch(self):
+        return LoteInstavel(self)
+
+
+class LoteInstavel(Lote):
+    def commit(self):
+        from google.api_core.exceptions import ServiceUnavailable
+
+        if any('/documentos_analisados/' in op[1].caminho for op in self.ops):
+            self.db.lotes_com_resultados += 1
+            self.db.fora_do_ar = self.db.fora_do_ar or self.db.lotes_com_resultados == 2
+        if self.db.fora_do_ar:
+            raise ServiceUnavailable("503 Firestore indisponível")
+        super().commit()
+
+
+def test_erro_transitorio_preserva_checkpoints_e_retoma(monkeypatch, pdf):
+    from google.api_core.exceptions import ServiceUnavailable
+
+    limpo = Ambiente(monkeypatch, pdf, FakeFirestore())
+    main.processar_pdf(JOB_ID, ARQUIVO)
+
+    ambiente = Ambiente(monkeypatch, pdf, FirestoreInstavel())
+    # Exceção comum (não FalhaInjetada): o worker responde 500 e o Cloud Tasks reentrega
+    with pytest.raises(ServiceUnavailable):
+        main.processar_pdf(JOB_ID, ARQUIVO, tentativa=0)
+    assert ambiente.status() != 'ERRO'
+    assert {ETAPA_SUMARIO, ETAPA_MAPA, ETAPA_ANALISE} <= ambiente.checkpoints()
+
+    ambiente.db.fora_do_ar = False
+    ambiente.reiniciar_instancia()
+    main.processar_pdf(JOB_ID, ARQUIVO, tentativa=1)
+
+    assert ambiente.status() == 'CONCLUIDO'
+    assert ambiente.analisados() == limpo.analisados()
+    assert len(ambiente.indices) == 1  # retomou do checkpoint do sumário
+    assert ambiente.checkpoints() == set()
+
+
+def test_erro_transitorio_na_ultima_entrega_e_terminal(monkeypatch, pdf):
+    ambiente = Ambiente(monkeypatch, pdf, FakeFirestore())
+
+    def falhar(mapa_paginas):
+        raise ConnectionError("conexão com o Firestore caiu")
+
+    monkeypatch.setattr(main, 'IndiceDocumentos', falhar)
+    main.processar_pdf(JOB_ID, ARQUIVO, tentativa=main.JOB_MAX_TENTATIVAS - 1)
+
+    assert ambiente.status() == 'ERRO'
+    assert ambiente.checkpoints() == set()
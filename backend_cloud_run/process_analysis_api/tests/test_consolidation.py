@@ -0,0 +1,30 @@
+"""Espera pelo lote da consolidação: cobre o pior caso da política de retentativas."""
+import requests
+
+import consolidation
+from consolidation import AgregadorConsolidacao, ConsolidacaoFalhou, espera_maxima, CONSOLIDACAO_TIMEOUT_S
+
+
+class SessaoSemResposta:
+    """Toda tentativa gasta o timeout de conexão e o de leitura antes de falhar."""
+
+    def __init__(self, relogio):
+        self.relogio = relogio
+
+    def post(self, url, json=None, timeout=None):
+        self.relogio.append(2 * timeout)
+        raise requests.Timeout("sem resposta")
+
+
+def test_espera_cobre_timeouts_e_backoff_com_jitter_maximo(monkeypatch):
+    monkeypatch.setattr(consolidation.random, 'random', lambda: 0.999999)
+    relogio = []
+    agregador = AgregadorConsolidacao("http://consolidacao.invalid", janela_s=3, max_tentativas=4,
+                                      sessao=SessaoSemResposta(relogio), dormir=relogio.append)
+    try:
+        agregador._post(['processo-1'])
+    except ConsolidacaoFalhou:
+        pass
+    gasto = 3 + sum(relogio)
+    assert gasto > 3 + CONSOLIDACAO_TIMEOUT_S * 4  # a fórmula antiga cortava a espera antes do fim
+    assert gasto <= espera_maxima(janela_s=3, max_tentativas=4)
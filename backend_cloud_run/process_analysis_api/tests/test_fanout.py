@@ -0,0 +1,51 @@
+"""Fan-out (FANOUT_MIN_TASKS): reentrega do coordenador de um job cujas partes ainda estão em voo."""
+import main
+from benchmarks.fakes_pipeline import FakeFirestore
+from conftest import Ambiente, JOB_ID, ARQUIVO
+
+
+def test_reentrega_do_coordenador_continua_em_fanout(monkeypatch, pdf):
+    ambiente = Ambiente(monkeypatch, pdf, FakeFirestore())
+    # Menos tasks pendentes que o limite (as partes já concluídas saíram pela dedup)
+    monkeypatch.setattr(main, 'FANOUT_MIN_TASKS', 10_000)
+    ambiente.db.collection('analises_processos').document(JOB_ID).set(
+        {'modo': 'FANOUT', 'status': 'PROCESSANDO_PARTES', 'partes_total': 38}, merge=True)
+    coordenacoes = []
+    monkeypatch.setattr(main, 'iniciar_fanout', lambda *args: coordenacoes.append(args[-2]))
+
+    main.processar_pdf(JOB_ID, ARQUIVO)
+
+    assert coordenacoes == [True]  # ja_iniciado
+    assert ambiente.chamadas_pro() == 0
+    assert ambiente.status() == 'PROCESSANDO_PARTES'
+    assert ambiente.analisados() == set()
+
+
+def test_lease_do_fanout_dura_ate_o_fan_in(monkeypatch, pdf):
+    import time
+    from dedup import safe_id
+    from process_lease import LEASE_TTL_FANOUT_S
+    from benchmarks.fakes_pipeline import FakeGenAI
+
+    ambiente = Ambiente(monkeypatch, pdf, FakeFirestore())
+    main.genai.substituir(FakeGenAI(main.PROMPT_SUMARIO, ambiente.genai.documentos_indice,
+                                    numero_processo="0001234-56.2024.4.01.3304"))
+    monkeypatch.setattr(main, 'FANOUT_MIN_TASKS', 1)
+    partes = []
+    monkeypatch.setattr(main, 'enqueue_process_task', lambda payload, **kwargs: partes.append(payload))
+    lease_ref = ambiente.db.collection('leases_processos').document(safe_id("0001234-56.2024.4.01.3304"))
+
+    inicio = time.time()
+    main.processar_pdf(JOB_ID, ARQUIVO)
+    assert partes and ambiente.status() == 'PROCESSANDO_PARTES'
+    # O coordenador entrega o lease com a validade do fan-out, não a do loop local
+    assert lease_ref.get().to_dict()['expira_em'] >= inicio + LEASE_TTL_FANOUT_S
+
+    # Uma parte que sai da fila com o lease quase vencido o renova antes de analisar
+    lease_ref.update({'expira_em': time.time() + 1})
+    expiracoes = []
+    analisar = main.analisar_subdocumento
+    monkeypatch.setattr(main, 'analisar_subdocumento',
+                        lambda *a, **k: expiracoes.append(lease_ref.get().to_dict()['expira_em']) or analisar(*a, **k))
+    main.processar_parte(partes[0])
+    assert expiracoes[0] >= time.time() + LEASE_TTL_FANOUT_S - 5
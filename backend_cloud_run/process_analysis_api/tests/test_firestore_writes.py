@@ -0,0 +1,64 @@
+"""
+EscritorFirestore: um documento recusado pelo Firestore não derruba as demais escritas do lote,
+nem o job (processar_pdf) que o gravou.
+"""
+import pytest
+
+import main
+from firestore_writes import EscritorFirestore
+from benchmarks.fakes_pipeline import FakeFirestore
+from conftest import Ambiente, JOB_ID, ARQUIVO
+
+
+class FirestoreRecusando(FakeFirestore):
+    """Recusa escritas nos caminhos informados (como um documento acima de 1 MiB)."""
+
+    def __init__(self, recusar):
+        super().__init__()
+        self.recusar = set(recusar)
+
+    def _aplicar(self, tipo, ref, dados, merge, travado=False):
+        if ref.caminho in self.recusar:
+            raise ValueError(f"document too large: {ref.caminho}")
+        return super()._aplicar(tipo, ref, dados, merge, travado)
+
+
+def test_documento_recusado_vai_para_rejeitados():
+    db = FirestoreRecusando({'resultados/b'})
+    escritor = EscritorFirestore(db)
+    for nome in 'abc':
+        escritor.set(db.collection('resultados').document(nome), {'nome': nome}, rotulo=nome)
+    escritor.update(db.collection('jobs').document('j'), {'progresso': 60})
+    db.collection('jobs').document('j').set({'progresso': 50})
+
+    escritor.flush()
+
+    assert escritor.rejeitados() == ['b']
+    assert escritor.rejeitados() == []
+    assert set(db.listar('resultados')) == {'a', 'c'}
+    assert db.docs['jobs/j'] == {'progresso': 60}
+
+
+def test_falha_sem_rotulo_e_relancada():
+    db = FirestoreRecusando({'jobs/j'})
+    escritor = EscritorFirestore(db)
+    escritor.set(db.collection('resultados').document('a'), {'nome': 'a'}, rotulo='a')
+    escritor.set(db.collection('jobs').document('j'), {'progresso': 60})
+
+    with pytest.raises(ValueError):
+        escritor.flush()
+    assert set(db.listar('resultados')) == {'a'}
+
+
+def test_job_conclui_com_documento_recusado(monkeypatch, pdf):
+    limpo = Ambiente(monkeypatch, pdf, FirestoreRecusando(()))
+    main.processar_pdf(JOB_ID, ARQUIVO)
+    recusado = sorted(limpo.analisados())[0]
+
+    ambiente = Ambiente(monkeypatch, pdf, FirestoreRecusando({f"analises_processos/{JOB_ID}/documentos_analisados/{recusado}"}))
+    main.processar_pdf(JOB_ID, ARQUIVO)
+
+    job = ambiente.db.docs[f"analises_processos/{JOB_ID}"]
+    assert job['status'] == 'CONCLUIDO'
+    assert job['documentos_com_erro'] == [recusado]
+    assert ambiente.analisados() == limpo.analisados() - {recusado}
@@ -0,0 +1,18 @@
+"""Pico de memória por job (job_metrics.AmostradorRSS) com jobs simultâneos na instância."""
+import time
+
+from job_metrics import AmostradorRSS, rss_mb
+
+
+def test_pico_de_um_job_sobrevive_ao_inicio_de_outro():
+    base = rss_mb()
+    primeiro = AmostradorRSS(intervalo_s=0.01).iniciar()
+    bloco = bytearray(64 * 1024 * 1024)
+    bloco[::4096] = b'\1' * len(bloco[::4096])  # memória de fato tocada pelo primeiro job
+    time.sleep(0.05)
+    del bloco
+
+    # Um segundo job começa na mesma instância antes de o primeiro gravar as métricas
+    segundo = AmostradorRSS(intervalo_s=0.01).iniciar()
+    assert primeiro.parar() >= base + 32
+    assert segundo.parar() is not None
@@ -0,0 +1,42 @@
+"""Fair share do job_scheduling: só há atraso quando outro usuário tem trabalho pendente na classe."""
+from job_scheduling import AgendadorJobs, Agendamento, ClasseTamanho, USUARIO_ANONIMO
+from benchmarks.fakes_pipeline import FakeFirestore, modulo_firestore
+
+CLASSE = ClasseTamanho('medio', 1000, None, 'fila-medios', 10, 1200)
+
+
+def agendador():
+    db = FakeFirestore()
+    return AgendadorJobs(db, modulo_firestore(db), classes=[CLASSE], segundos_por_pagina=0.5)
+
+
+def submeter(agendador_, usuario, paginas, agora):
+    """agendar() com o relógio fixo em `agora`: atraso diante dos pendentes e reserva do custo."""
+    atraso = agendador_.atraso_justo(CLASSE, usuario, agendador_.pendentes(usuario, agora), agora)
+    agendador_.reservar(Agendamento(CLASSE, paginas, None, True, usuario, atraso), agora)
+    return atraso
+
+
+def test_jobs_sem_usuario_nao_esperam():
+    agendador_ = agendador()
+    agendamentos = [agendador_.agendar(800, 800 * 50_000) for _ in range(10)]
+    assert [a.atraso_s for a in agendamentos] == [0.0] * 10
+    assert {a.usuario for a in agendamentos} == {USUARIO_ANONIMO}
+    assert not agendador_.db.listar('agendamento_filas')
+
+
+def test_usuario_sozinho_na_classe_nao_espera():
+    agendador_ = agendador()
+    assert [submeter(agendador_, 'ana', 800, 100.0) for _ in range(10)] == [0.0] * 10
+
+
+def test_job_cede_a_vez_ao_trabalho_pendente_de_outro_usuario():
+    agendador_ = agendador()
+    for _ in range(3):  # 3 x 800 páginas de 'ana': relógio dela vai a 100 + 120
+        submeter(agendador_, 'ana', 800, 100.0)
+    # 'bruno' chega sem fila própria: não espera
+    assert submeter(agendador_, 'bruno', 100, 100.0) == 0.0
+    # O próximo de 'ana' começaria em 220, mas espera só o trabalho de 'bruno' (5 s)
+    assert submeter(agendador_, 'ana', 800, 100.0) == 5.0
+    # Depois que o trabalho dos outros passou, 'ana' volta a não esperar
+    assert submeter(agendador_, 'ana', 800, 106.0) == 0.0
@@ -0,0 +1,41 @@
+"""Espera pelo lease do processo: o job acordado pelo dono roda uma vez só (a tarefa de segurança é cancelada)."""
+import time
+
+import main
+from process_lease import LeaseProcesso
+from benchmarks.fakes_pipeline import FakeFirestore, FakeGenAI, modulo_firestore
+from conftest import Ambiente, JOB_ID, ARQUIVO
+
+NUMERO_PROCESSO = "0001234-56.2024.4.01.3304"
+
+
+def test_job_acordado_roda_uma_vez(monkeypatch, pdf):
+    ambiente = Ambiente(monkeypatch, pdf, FakeFirestore())
+    main.genai.substituir(FakeGenAI(main.PROMPT_SUMARIO, ambiente.genai.documentos_indice,
+                                    numero_processo=NUMERO_PROCESSO))
+    # Tarefa de segurança curta: sem o cancelamento ela dispararia durante o teste
+    monkeypatch.setattr(LeaseProcesso, 'atraso_espera', lambda self, aquisicao: 0.3)
+    monkeypatch.setattr(main, 'fila_local', None)
+    entregas = []
+    processar_pdf = main.processar_pdf
+    monkeypatch.setattr(main, 'processar_pdf', lambda *a: entregas.append(a[0]) or processar_pdf(*a))
+    dono = LeaseProcesso(ambiente.db, modulo_firestore(ambiente.db), NUMERO_PROCESSO, 'job-dono', ttl_s=60)
+    assert dono.adquirir().adquirido
+
+    fila = main.usar_fila_local(workers=4)
+    try:
+        main.enqueue_process_task({'jobId': JOB_ID, 'filePath': ARQUIVO})
+        limite = time.time() + 10
+        while ambiente.status() != 'AGUARDANDO_PROCESSO' and time.time() < limite:
+            time.sleep(0.01)
+        assert ambiente.status() == 'AGUARDANDO_PROCESSO'
+
+        main.liberar_lease(dono)
+        assert fila.aguardar(timeout=30)
+        time.sleep(0.5)  # passado o atraso da tarefa de segurança
+    finally:
+        fila.encerrar()
+
+    assert entregas == [JOB_ID, JOB_ID]  # a espera e a execução acordada, sem a tarefa de segurança
+    assert fila.entregas == 2
+    assert ambiente.status() == 'CONCLUIDO'
@@ -0,0 +1,57 @@
+"""Cruzamento dos IDs do sumário com as chaves do mapa de páginas (page_mapping.IndiceDocumentos)."""
+import pytest
+
+from page_mapping import IndiceDocumentos
+
+
+MAPA = {
+    "123456789": [0, 1],
+    "987654321": [2],
+    "1234": [3],
+    "ab": [4],
+}
+
+
+def resolver(doc_id, mapa=MAPA, min_chars=3):
+    return IndiceDocumentos(mapa, min_chars=min_chars).resolver(doc_id)
+
+
+def test_match_exato_vale_para_chave_curta():
+    assert resolver("ab") == [4]
+
+
+@pytest.mark.parametrize("doc_id", ["a", "b", "xab", "abcdef"])
+def test_chave_abaixo_do_minimo_nao_casa_parcialmente(doc_id):
+    assert resolver(doc_id) is None
+
+
+def test_id_abaixo_do_minimo_nao_casa_parcialmente():
+    assert resolver("98") is None
+
+
+def test_id_truncado_casa_com_a_chave_completa():
+    assert resolver("98765") == [2]   # prefixo
+    assert resolver("54321") == [2]   # sufixo
+    assert resolver("76543") == [2]   # trecho interno
+
+
+def test_chave_truncada_contida_no_id():
+    assert resolver("00987654321999") == [2]
+
+
+def test_prefixo_vence_sufixo_e_trecho_interno():
+    mapa = {"x123456": [0], "123456": [1], "912345": [2]}
+    assert IndiceDocumentos(mapa).candidatos("12345") == ["123456", "912345", "x123456"]
+
+
+def test_empate_fica_com_a_menor_diferenca_de_tamanho_e_depois_a_primeira_pagina():
+    # "123456789" e "1234" são prefixos de "12345678"; "1234" tem diferença maior
+    assert IndiceDocumentos(MAPA).candidatos("12345678") == ["123456789", "1234"]
+    mapa = {"55510": [7], "55511": [3]}
+    assert IndiceDocumentos(mapa).candidatos("555") == ["55511", "55510"]
+
+
+def test_indice_guarda_so_os_ids_completos():
+    indice = IndiceDocumentos(MAPA)
+    assert sorted(indice._chaves) == sorted(MAPA)
+    assert indice._tamanhos == [4, 9]
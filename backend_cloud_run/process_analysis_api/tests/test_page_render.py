@@ -0,0 +1,46 @@
+"""Fallback de PDFs digitalizados (page_render): motor de OCR indisponível e job sem páginas mapeadas."""
+import fitz  # PyMuPDF
+import pytest
+
+import main
+import page_render
+from page_text import PageTextCache
+from page_render import RenderizadorPaginas
+from benchmarks.synthetic_pdf import gerar_pdf_sintetico
+from benchmarks.fakes_pipeline import FakeFirestore
+from conftest import Ambiente, JOB_ID, ARQUIVO
+
+chamadas_ocr = []
+
+
+def ocr_sem_tessdata(png):
+    chamadas_ocr.append(png)
+    raise RuntimeError("No tessdata specified and Tesseract is not installed")
+
+
+@pytest.fixture(scope="module")
+def digitalizado():
+    pdf_bytes, documentos = gerar_pdf_sintetico(30, digitalizado=True)
+    indice = [{'id_documento': doc_id, 'tipo_original': 'Laudo', 'data': '01/01/2024'} for doc_id, _ in documentos]
+    return pdf_bytes, indice
+
+
+def test_motor_indisponivel_e_verificado_uma_vez(monkeypatch, digitalizado):
+    monkeypatch.setattr(page_render, '_motores_verificados', {})
+    doc = fitz.open(stream=digitalizado[0], filetype="pdf")
+    textos = PageTextCache(doc)
+    for _ in range(3):  # três jobs na mesma instância
+        renderizador = RenderizadorPaginas(doc, motor_ocr='test_page_render:ocr_sem_tessdata')
+        assert renderizador.ocr_rodapes(renderizador.sem_texto(textos)) == {}
+        assert renderizador.renderizadas == 0
+    assert len(chamadas_ocr) == 1
+
+
+def test_pdf_digitalizado_sem_ocr_termina_em_erro(monkeypatch, digitalizado):
+    ambiente = Ambiente(monkeypatch, digitalizado, FakeFirestore())
+    main.processar_pdf(JOB_ID, ARQUIVO)
+
+    job = ambiente.db.docs[f"analises_processos/{JOB_ID}"]
+    assert job['status'] == 'ERRO'
+    assert job['erro'].startswith('PDF digitalizado')
+    assert ambiente.checkpoints() == set()
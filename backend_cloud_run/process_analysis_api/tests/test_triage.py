@@ -0,0 +1,37 @@
+"""Regras padrão da triagem (triage.REGRAS_PADRAO) sobre o tipo_original do sumário."""
+import pytest
+
+from triage import Triagem, ACAO_PULAR, ACAO_FLASH, ACAO_COMPLETA
+
+
+TEXTO = "Outorgo poderes ao advogado para representar o outorgante em juízo. " * 5  # camada de texto normal
+
+
+def decidir(tipo_original, texto=TEXTO):
+    return Triagem({0: texto}).decidir({'meta': {'tipo_original': tipo_original}, 'pages': [0]}).acao
+
+
+@pytest.mark.parametrize("tipo", ["Certidão de Nascimento", "CERTIDAO DE CASAMENTO", "Certidão de Óbito", "Procuração"])
+def test_documentos_que_o_prompt_exclui_sao_pulados(tipo):
+    assert decidir(tipo) == ACAO_PULAR
+
+
+@pytest.mark.parametrize("tipo", ["Certidão de Intimação", "Certidão de Publicação"])
+def test_certidoes_processuais_sao_analisadas(tipo):
+    # Trazem datas e prazos que a análise extrai
+    assert decidir(tipo) == ACAO_FLASH
+
+
+def test_certidao_sem_regra_vai_para_analise_completa():
+    assert decidir("Certidão de Trânsito em Julgado") == ACAO_COMPLETA
+
+
+@pytest.mark.parametrize("tipo", ["Procuração", "Documento de Identificação"])
+def test_documento_pulavel_digitalizado_vai_para_analise_completa(tipo):
+    # Sem camada de texto a busca de termos médicos não vê um laudo juntado com o tipo errado
+    assert decidir(tipo, texto='') == ACAO_COMPLETA
+
+
+@pytest.mark.parametrize("tipo", ["Custas Processuais", "Guia de Recolhimento", "Aviso de Recebimento"])
+def test_documentos_fora_da_lista_do_prompt_nao_sao_pulados(tipo):
+    assert decidir(tipo) == ACAO_FLASH
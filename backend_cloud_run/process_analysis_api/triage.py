@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import unicodedata
+from collections import namedtuple
+
+# Triagem entre o matching (Step 4) e a análise: pular, analisar com Flash ou análise completa (Pro)
+TRIAGEM_ATIVA = os.environ.get("TRIAGEM_ATIVA", "1") != "0"
+# Termos médicos no texto das páginas que forçam a análise completa, mesmo com tipo "pulável"
+TRIAGEM_MIN_TERMOS_MEDICOS = int(os.environ.get("TRIAGEM_MIN_TERMOS_MEDICOS", "2"))
+# Caracteres por página para confiar na camada de texto: página digitalizada (sem texto) nunca é pulada,
+# porque a busca de termos médicos não a enxerga
+TRIAGEM_MIN_CHARS_PAGINA = int(os.environ.get("TRIAGEM_MIN_CHARS_PAGINA", "200"))
+
+ACAO_PULAR = 'pular'
+ACAO_FLASH = 'flash'
+ACAO_COMPLETA = 'completa'
+
+# Padrões sobre o tipo_original do sumário (minúsculo, sem acentos).
+# Podem ser substituídos por TRIAGEM_REGRAS_JSON='{"pular": [...], "flash": [...]}'.
+REGRAS_PADRAO = {
+    # Documentos que o prompt manda ignorar: não há o que extrair para o laudo
+    ACAO_PULAR: [
+        # Só as certidões civis que o prompt exclui: as processuais (intimação, publicação) têm datas e prazos
+        r"\bcertidao de (nascimento|casamento|obito)\b", r"\bprocuracao\b", r"\bsubstabelecimento\b",
+        r"\bdocumentos? de identifica", r"\bidentidade\b", r"\brg\b", r"\bcpf\b", r"\bcnh\b",
+        r"\btitulo de eleitor\b", r"\bcomprovante de (residencia|endereco)\b",
+        r"\bconta de (agua|luz|energia|telefone|internet)\b",
+        r"\bdeclaracao de (hipossuficiencia|pobreza)\b",
+    ],
+    # Atos processuais curtos: os metadados (vara, tribunal, partes) bastam com o modelo Flash
+    ACAO_FLASH: [
+        r"\bdespacho\b", r"\bato ordinatorio\b", r"\bintimacao\b", r"\bcitacao\b", r"\bmandado\b",
+        r"\bjuntada\b", r"\boficio\b", r"\bpublicacao\b", r"\bdecisao\b", r"\bconclusao\b",
+        # Fora da lista de exclusão do prompt: poucos dados, mas ainda passam pela análise
+        r"\bcustas\b", r"\bguia de recolhimento\b", r"\baviso de recebimento\b",
+    ],
+}
+
+REGEX_TERMOS_MEDICOS = re.compile(
+    r"\b(cid[\s-]*10|cid[\s:-]*[a-z]\d{2}|crm|diagnostic\w*|laudo|atestad\w*|exame|paciente|medic[oa]s?|"
+    r"prontuario|receituario|ressonancia|tomografia|radiografia|ultrassom\w*|cirurgi\w*|"
+    r"internac\w*|afastamento|incapacidade|pericia|aso|cat)\b")
+
+Decisao = namedtuple('Decisao', ['acao', 'motivo'])
+
+
+def normalizar(texto):
+    """Minúsculo e sem acentos, para casar padrões independentemente da grafia."""
+    sem_acento = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii')
+    return sem_acento.lower()
+
+
+def carregar_regras():
+    regras = REGRAS_PADRAO
+    personalizadas = os.environ.get("TRIAGEM_REGRAS_JSON")
+    if personalizadas:
+        regras = dict(REGRAS_PADRAO, **json.loads(personalizadas))
+    return {acao: [re.compile(p) for p in regras.get(acao, [])] for acao in (ACAO_PULAR, ACAO_FLASH)}
+
+
+class Triagem:
+    """
+    Decide, por task, entre pular, analisar com Flash ou fazer a análise completa.
+    Usa o tipo_original do sumário e o texto já extraído das páginas (PageTextCache):
+    termos médicos no texto sempre levam à análise completa, para não perder um laudo
+    juntado como "procuração" ou "certidão". Só pula documentos com camada de texto em todas
+    as páginas; um digitalizado com tipo "pulável" vai para a análise completa.
+    """
+
+    def __init__(self, textos, ativa=TRIAGEM_ATIVA, regras=None, min_termos_medicos=TRIAGEM_MIN_TERMOS_MEDICOS,
+                 min_chars_pagina=TRIAGEM_MIN_CHARS_PAGINA):
+        self.textos = textos
+        self.ativa = ativa
+        self.regras = regras or carregar_regras()
+        self.min_termos_medicos = min_termos_medicos
+        self.min_chars_pagina = min_chars_pagina
+
+    def paginas_sem_texto(self, pages):
+        return [p for p in pages if len((self.textos.get(p) or '').strip()) < self.min_chars_pagina]
+
+    def termos_medicos(self, pages):
+        encontrados = set()
+        for p in pages:
+            encontrados.update(m.group(1) for m in REGEX_TERMOS_MEDICOS.finditer(normalizar(self.textos.get(p))))
+        return encontrados
+
+    def decidir(self, task):
+        if not self.ativa:
+            return Decisao(ACAO_COMPLETA, 'triagem desligada')
+        termos = self.termos_medicos(task['pages'])
+        if len(termos) >= self.min_termos_medicos:
+            return Decisao(ACAO_COMPLETA, f"termos médicos no texto: {', '.join(sorted(termos)[:5])}")
+
+        tipo = task['meta'].get('tipo_original') or ''
+        tipo_normalizado = normalizar(tipo)
+        for acao in (ACAO_PULAR, ACAO_FLASH):
+            for padrao in self.regras[acao]:
+                if padrao.search(tipo_normalizado):
+                    if acao == ACAO_PULAR:
+                        sem_texto = self.paginas_sem_texto(task['pages'])
+                        if sem_texto:
+                            return Decisao(ACAO_COMPLETA, f"tipo_original '{tipo}' pulável, mas {len(sem_texto)} "
+                                                          f"página(s) sem camada de texto")
+                    return Decisao(acao, f"tipo_original '{tipo}' casa com a regra {padrao.pattern}")
+        return Decisao(ACAO_COMPLETA, 'sem regra de triagem')
+
+
+class EstatisticasTriagem:
+    """Contagem por ação e tempo de modelo economizado (estimado pelas latências observadas no job)."""
+
+    def __init__(self):
+        self.contagem = {ACAO_PULAR: 0, ACAO_FLASH: 0, ACAO_COMPLETA: 0}
+        self.latencias = {ACAO_FLASH: [], ACAO_COMPLETA: []}
+
+    def registrar(self, acao):
+        self.contagem[acao] += 1
+
+    def registrar_latencia(self, acao, segundos):
+        self.latencias[acao].append(segundos)
+
+    def resumo(self):
+        media = {acao: (sum(v) / len(v) if v else None) for acao, v in self.latencias.items()}
+        economizado = None
+        if media[ACAO_COMPLETA] is not None:
+            economizado = self.contagem[ACAO_PULAR] * media[ACAO_COMPLETA]
+            if media[ACAO_FLASH] is not None:
+                economizado += self.contagem[ACAO_FLASH] * max(0.0, media[ACAO_COMPLETA] - media[ACAO_FLASH])
+            economizado = round(economizado, 1)
+        return {
+            'pulados': self.contagem[ACAO_PULAR],
+            'flash': self.contagem[ACAO_FLASH],
+            'completos': self.contagem[ACAO_COMPLETA],
+            'tempo_modelo_economizado_s': economizado,
+        }
@@ -1,6 +1,7 @@
 import { Injectable, inject, EnvironmentInjector, runInInjectionContext } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { Firestore, docData, collectionData } from '@angular/fire/firestore';
+import { Auth } from '@angular/fire/auth';
 import { collection, doc } from 'firebase/firestore';
 import { Observable } from 'rxjs';
 
@@ -39,6 +40,7 @@ export interface AnalysedDocument {
 export class ProcessAnalysisService {
     private http = inject(HttpClient);
     private firestore = inject(Firestore);
+    private auth = inject(Auth);
     private injector = inject(EnvironmentInjector);
 
     // API Cloud Run (Real)
@@ -53,13 +55,14 @@ export class ProcessAnalysisService {
 
     // 2. Notificar início de processamento após upload direto
     startProcessing(jobId: string, filePath: string): Observable<any> {
-        return this.http.post(`${this.apiUrl}/processar`, { jobId, filePath });
+        // usuarioUid: a fila divide a capacidade de forma justa entre usuários
+        return this.http.post(`${this.apiUrl}/processar`, { jobId, filePath, usuarioUid: this.auth.currentUser?.uid });
     }
 
     // 3. Importar do Google Drive
     importFromDrive(fileId: string, oAuthToken: string): Observable<DriveImportResponse> {
         console.log('Sending import request to backend for', fileId);
-        return this.http.post<DriveImportResponse>(`${this.apiUrl}/importar-drive`, { fileId, oAuthToken });
+        return this.http.post<DriveImportResponse>(`${this.apiUrl}/importar-drive`, { fileId, oAuthToken, usuarioUid: this.auth.currentUser?.uid });
     }
 
     // 4. Monitorar Status da Análise (Firestore)